@@ -1,15 +1,28 @@
-from typing import Optional
+from __future__ import annotations
+from typing import Optional, Final, Any, Iterator, Hashable, Callable, TYPE_CHECKING
 from enum import Enum, unique, auto
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import Future
+from threading import Lock
+from os import register_at_fork
+from os.path import dirname, getmtime, getsize, isfile, join, splitext
 from classes.dataset_lib import DatasetUnit
-from anomalib.deploy.inferencers import TorchInferencer
-from anomalib.utils.visualization.image import ImageResult
-from matplotlib import pyplot as plt
+from classes.metrics_lib import STAGE_METRICS
+from classes.anomalib_lib import AnomalyModelUnit
 import numpy as np
 from math import ceil
-from matplotlib import gridspec
-from io import BytesIO
+from time import perf_counter
+from cv2 import resize, applyColorMap, cvtColor, putText, getTextSize, COLORMAP_VIRIDIS, COLOR_BGR2RGB, FONT_HERSHEY_SIMPLEX, INTER_AREA, INTER_LINEAR, LINE_AA
 from PIL import Image
 
+# torch, anomalib (lightning, openvino) and timm are imported when the first model is loaded
+if TYPE_CHECKING:
+    import torch
+    from classes.ensemble_lib import SharedBackbone
+    from anomalib.deploy.inferencers import TorchInferencer, OpenVINOInferencer
+    from anomalib.utils.visualization.image import ImageResult
+
 class ModelPathUnit:
     """
     The ModelPathUnit class is used to manage model paths and types.
@@ -18,9 +31,11 @@ class ModelPathUnit:
     Enums:
     ModelTypeEnum : Enum - Enum for model paths.
     ModelWeekEnum : Enum - Enum for model weeks.
+    ModelBackendEnum : Enum - Enum for exported model artifacts.
 
     Methods:
-    ModelPath(type: ModelTypeEnum, week: ModelWeekEnum) -> str - Get the model path.
+    ModelPath(type: ModelTypeEnum, week: ModelWeekEnum, backend: ModelBackendEnum) -> str - Get the model path.
+    ResolveModelPath(types: ModelTypeEnum, week: ModelWeekEnum, backends: list[ModelBackendEnum]) -> str - Get the path of the first exported artifact found.
     IsValidWeek(week: int) -> Optional[ModelWeekEnum] - Check if the week is valid and return the corresponding enum.
     IsValidModel(name: str) -> Optional[ModelTypeEnum] - Check if the model name is valid and return the corresponding enum.
     IsValid(types: str, week: int) -> Optional[tuple[ModelTypeEnum, ModelWeekEnum]] - Check if the model type and week are valid and return the corresponding enums.
@@ -61,19 +76,58 @@ class ModelPathUnit:
         week8_ = 8
         week12_ = 12
         week18_ = 18
-    
-    def ModelPath(self, types: ModelTypeEnum, week: ModelWeekEnum) -> str:
+
+    @unique
+    class ModelBackendEnum(Enum):
+        """
+        Enum for exported model artifacts, the value is the path under the weights folder written by AnomalyModelUnit.Save.
+
+        Attributes:
+        torch_ : str - TorchInferencer, CPU or GPU.
+        openvino_ : str - OpenVINOInferencer on the OpenVINO IR, CPU.
+        onnx_ : str - OpenVINOInferencer on the ONNX graph, CPU.
+        openvino_int8_ : str - OpenVINOInferencer on the INT8 quantized IR from AnomalyModelUnit.Quantize, CPU. Opt in only.
+        """
+        torch_ = "torch/model.pt"
+        openvino_ = "openvino/model.xml"
+        onnx_ = "onnx/model.onnx"
+        openvino_int8_ = "openvino_int8/model.xml"
+
+    def ModelPath(self, types: ModelTypeEnum, week: ModelWeekEnum, backend: ModelBackendEnum = ModelBackendEnum.torch_) -> str:
         """
         Get the model path.
 
         Args:
         type : ModelTypeEnum - The type of the model.
         week : ModelWeekEnum - The week of the model.
+        backend : ModelBackendEnum - The exported artifact. Default is ModelBackendEnum.torch_.
 
         Returns:
         str - The model path.
         """
-        return f"models/T5_Full_Individual_Filtered_Week_Unseen_Week{week.value}_Save_SimMutiAnomaly/{types.name}/weights/torch/model.pt"
+        return f"models/T5_Full_Individual_Filtered_Week_Unseen_Week{week.value}_Save_SimMutiAnomaly/{types.name}/weights/{backend.value}"
+
+    def ResolveModelPath(self, *, types: ModelTypeEnum, week: ModelWeekEnum, backends: list[ModelBackendEnum]) -> str:
+        """
+        Get the path of the first exported artifact that exists, in order of preference.
+
+        Args:
+        types : ModelTypeEnum - The type of the model.
+        week : ModelWeekEnum - The week of the model.
+        backends : list[ModelBackendEnum] - Artifacts to look for, preferred first.
+
+        Returns:
+        str - The path of the first artifact found, the torch path if none exists.
+
+        Example:
+        >>> model_path_unit = ModelPathUnit()
+        >>> model_path_unit.ResolveModelPath(types=ModelPathUnit.ModelTypeEnum.cflow_, week=ModelPathUnit.ModelWeekEnum.week3_, backends=[ModelPathUnit.ModelBackendEnum.openvino_, ModelPathUnit.ModelBackendEnum.torch_])
+        """
+        for backend in backends:
+            model_path = self.ModelPath(types=types, week=week, backend=backend)
+            if isfile(model_path):
+                return model_path
+        return self.ModelPath(types=types, week=week)
     
     def IsValidWeek(self, week: int) -> Optional[ModelWeekEnum]:
         """
@@ -131,14 +185,36 @@ class AnomalibTest:
 
     Attributes:
     param_ : DatasetUnit - The dataset unit to be used for testing.
+
+    Constants:
+    DEFAULT_INPUT_SIZE : tuple[int, int] - Model input size used when the exported model does not report one.
+    RENDER_TILE_SIZE : int - Side of the square tile each rendered array is fitted into.
+    RENDER_TITLE_HEIGHT : int - Height of the title strip above each tile.
+    RENDER_COLUMNS : int - Most tiles per row of the rendered canvas.
     """
 
-    def __init__(self) -> None:
+    DEFAULT_INPUT_SIZE : Final[tuple[int, int]] = (256, 256)
+    RENDER_TILE_SIZE : Final[int] = 384
+    RENDER_TITLE_HEIGHT : Final[int] = 24
+    RENDER_COLUMNS : Final[int] = 3
+
+    def __init__(self, *, batch_size: int = 8, labels: tuple[str, str] = ("unknown", "unknown")) -> None:
         """
         Initialize the AnomalibTest class.
 
+        Args:
+        batch_size : int - Number of images stacked into one forward pass. Default is 8.
+        labels : tuple[str, str] - Model and week the stage latencies are recorded under, see ModelLabels. Default is ("unknown", "unknown").
+
         Attributes:
-        inferencer_ : Optional[TorchInferencer] - The inferencer to be used for testing.
+        inferencer_ : Optional[TorchInferencer | OpenVINOInferencer] - The inferencer to be used for testing.
+        model_path_ : Optional[str] - The loaded model artifact.
+        batch_size_ : int - Number of images stacked into one forward pass.
+        labels_ : tuple[str, str] - Model and week the stage latencies are recorded under.
+        graph_ : bool - Whether the inferencer runs an exported graph (OpenVINOInferencer) rather than the torch model.
+        input_size_ : tuple[int, int] - The (height, width) the model expects, read once the model is loaded, see InputSize.
+        warm_ : bool - Whether the warm-up inferences have run since the model was loaded.
+        warmup_ms_ : list[float] - Latency of each warm-up inference in ms, the first one pays for the lazy initialization.
 
         Example:
         >>> model_path_unit = ModelPathUnit()
@@ -146,89 +222,1222 @@ class AnomalibTest:
         >>> anomalib_test.Setup(model_path=model_path_unit.ModelPath(type=ModelPathUnit.ModelTypeEnum.cflow_, week=ModelPathUnit.ModelWeekEnum.week3_))
         >>> anomalib_test.Evaluate(image_path="path/to/image.jpg")
         >>> anomalib_test.Evaluate(image_path="path/to/directory")
+        >>> anomalib_test.EvaluateArrays(images=[image])
         """
-        self.inferencer_: Optional[TorchInferencer] = None
+        assert batch_size > 0, "Batch size must be positive"
+        self.inferencer_: Optional[TorchInferencer | OpenVINOInferencer] = None
+        self.model_path_: Optional[str] = None
+        self.batch_size_: int = batch_size
+        self.labels_: tuple[str, str] = labels
+        self.graph_: bool = False
+        self.input_size_: tuple[int, int] = self.DEFAULT_INPUT_SIZE
+        self.warm_: bool = False
+        self.warmup_ms_: list[float] = []
 
-    def Setup(self, *, model_path: str) -> None:
+    def Setup(self, *, model_path: str, warmup: int = 0) -> None:
         """
-        Setup the model path.
+        Setup the model path, the inferencer backend follows the artifact.
+        model.pt loads with TorchInferencer, model.xml (OpenVINO IR) and model.onnx load with OpenVINOInferencer on the CPU,
+        using the metadata.json exported next to them. The outputs of Evaluate are the same for every backend.
 
         Args:
         model_path : str - Path to the trained model.
+        warmup : int - Synthetic inferences run once loaded, see Warmup. Default is 0.
 
         Example:
         >>> model_path_unit = ModelPathUnit()
         >>> anomalib_test = AnomalibTest()
         >>> anomalib_test.Setup(model_path=model_path_unit.ModelPath(type=ModelPathUnit.ModelTypeEnum.cflow_, week=ModelPathUnit.ModelWeekEnum.week3_))
+        >>> anomalib_test.Setup(model_path=model_path_unit.ModelPath(type=ModelPathUnit.ModelTypeEnum.cflow_, week=ModelPathUnit.ModelWeekEnum.week3_, backend=ModelPathUnit.ModelBackendEnum.openvino_))
         """
-        self.inferencer_ = TorchInferencer(path=model_path)
-    
-    def Evaluate(self, *, image_path: str) -> list[tuple[Image.Image, str]]:
+        from anomalib.deploy.inferencers import TorchInferencer, OpenVINOInferencer
+
+        self.graph_ = splitext(model_path)[1] in (".xml", ".onnx")
+        if self.graph_:
+            self.inferencer_ = OpenVINOInferencer(path=model_path, metadata=join(dirname(model_path), "metadata.json"), device="CPU")
+        else:
+            self.inferencer_ = TorchInferencer(path=model_path)
+        self.model_path_ = model_path
+        self.input_size_ = self.ReadInputSize()
+        self.warm_, self.warmup_ms_ = False, []
+        if warmup > 0:
+            self.Warmup(runs=warmup)
+
+    def Warmup(self, *, runs: int) -> list[float]:
+        """
+        Run synthetic inferences at the model input size, so the first request does not pay for the lazy torch
+        initialization, the oneDNN kernel selection and the allocator growth. See RunWarmup.
+
+        Args:
+        runs : int - Number of warm-up inferences.
+
+        Returns:
+        list[float] - Latency of each inference in ms.
+
+        Example:
+        >>> anomalib_test.Warmup(runs=2)
+        [2140.3, 95.1]
+        """
+        assert self.inferencer_ is not None, "Inferencer is not set"
+        self.warmup_ms_ = RunWarmup(predict=lambda images: self.PredictBatch(images=images), size=self.InputSize(), batch_size=self.batch_size_, runs=runs, labels=self.labels_)
+        self.warm_ = True
+        return self.warmup_ms_
+
+    def MemoryBytes(self) -> int:
+        """
+        Estimate the resident size of the loaded model from its parameters and buffers (e.g. the PatchCore memory bank).
+        Graph runtimes do not expose their tensors, their size is estimated from the weights file.
+
+        Returns:
+        int - Size in bytes, 0 if no model is loaded.
+        """
+        if self.inferencer_ is None:
+            return 0
+        if self.graph_:
+            assert self.model_path_ is not None, "Model path is not set"
+            weights_path = f"{splitext(self.model_path_)[0]}.bin" if self.model_path_.endswith(".xml") else self.model_path_
+            return getsize(weights_path) if isfile(weights_path) else 0
+        model = self.inferencer_.model
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+    def Evaluate(self, *, image_path: str, batch_size: Optional[int] = None) -> Iterator[tuple[Image.Image, str]]:
         """
         Evaluate the model on the test data.
+        Results are yielded as soon as their batch is scored, only one batch is held in memory at a time.
+        The scan, read, predict and render stages are timed into STAGE_METRICS under labels_.
 
         Args:
         image_path : str - Path to the image to be evaluated, can be a directory or a single image.
+        batch_size : Optional[int] - Images per forward pass, defaults to batch_size_.
 
-        Returns:
-        list[tuple[Image.Image, str]] - A list of tuples containing the PIL image and the attributes as a string.
+        Yields:
+        tuple[Image.Image, str] - The PIL image and the attributes as a string, one per image.
+        """
+        assert self.inferencer_ is not None, "Inferencer is not set"
+        from anomalib.data.utils import read_image
+
+        model, week = self.labels_
+
+        dataset_unit = DatasetUnit()
+        with STAGE_METRICS.Timer(stage="scan", model=model, week=week):
+            dataset_unit.LoadImagesName(paths=image_path)
+
+        batch_size = self.batch_size_ if batch_size is None else batch_size
+
+        for start in range(0, len(dataset_unit.images_name_), batch_size):
+            with STAGE_METRICS.Timer(stage="read", model=model, week=week):
+                images = [read_image(path, as_tensor=True) for path in dataset_unit.images_name_[start:start + batch_size]]
+            with STAGE_METRICS.Timer(stage="predict", model=model, week=week):
+                results = self.PredictBatch(images=images)
+            for result in results:
+                with STAGE_METRICS.Timer(stage="render", model=model, week=week):
+                    rendered = self.Render(result=result)
+                if rendered is not None:
+                    yield rendered
+
+    def EvaluateScores(self, *, image_path: str, batch_size: Optional[int] = None) -> Iterator[tuple[str, float, Optional[bool]]]:
+        """
+        Score-only mode of Evaluate for bulk screening, see PredictScores.
+        No anomaly map is resized, coloured or rendered, only the score and label of every image are produced.
+
+        Args:
+        image_path : str - Path to the image to be evaluated, can be a directory or a single image.
+        batch_size : Optional[int] - Images per forward pass, defaults to batch_size_.
+
+        Yields:
+        tuple[str, float, Optional[bool]] - The image path, the normalized pred_score and the pred_label, one per image.
+
+        Example:
+        >>> for path, pred_score, pred_label in anomalib_test.EvaluateScores(image_path="path/to/directory"):
+        >>>     print(path, pred_score, pred_label)
+        """
+        assert self.inferencer_ is not None, "Inferencer is not set"
+        from anomalib.data.utils import read_image
+
+        model, week = self.labels_
+
+        dataset_unit = DatasetUnit()
+        with STAGE_METRICS.Timer(stage="scan", model=model, week=week):
+            dataset_unit.LoadImagesName(paths=image_path)
+
+        batch_size = self.batch_size_ if batch_size is None else batch_size
+
+        for start in range(0, len(dataset_unit.images_name_), batch_size):
+            paths = dataset_unit.images_name_[start:start + batch_size]
+            with STAGE_METRICS.Timer(stage="read", model=model, week=week):
+                images = [read_image(path, as_tensor=True) for path in paths]
+            with STAGE_METRICS.Timer(stage="score", model=model, week=week):
+                scores = self.PredictScores(images=images)
+            for path, (pred_score, pred_label) in zip(paths, scores):
+                yield path, pred_score, pred_label
+
+    def EvaluateTiled(self, *, image_path: str, tile_size: Optional[int] = None, overlap: float = 0.25, top_k: int = 1) -> Iterator[tuple[Image.Image, str]]:
+        """
+        Tiled mode of Evaluate for high resolution photos, every image is scored at full resolution with PredictTiled.
+
+        Args:
+        image_path : str - Path to the image to be evaluated, can be a directory or a single image.
+        tile_size : Optional[int] - Side of the square tiles in pixels, defaults to the model input size.
+        overlap : float - Fraction of a tile shared with its neighbour, in [0, 1). Default is 0.25.
+        top_k : int - Number of highest tile scores averaged into the image score, 1 for the max. Default is 1.
+
+        Yields:
+        tuple[Image.Image, str] - The PIL image and the attributes as a string, one per image.
+
+        Example:
+        >>> for img, title in anomalib_test.EvaluateTiled(image_path="path/to/photo.jpg", overlap=0.25, top_k=3):
+        >>>     img.show(title=title)
         """
         assert self.inferencer_ is not None, "Inferencer is not set"
+        from anomalib.data.utils import read_image
+
+        model, week = self.labels_
 
         dataset_unit = DatasetUnit()
-        dataset_unit.LoadImagesName(paths=image_path)
-        
-        results: list[tuple[Image.Image, str]] = []
-
-        for image in dataset_unit.images_name_:
-            result: ImageResult = self.inferencer_.predict(image)
-
-            # Collect np.ndarray attributes for combined display
-            images_to_display = []
-            titles = []
-            attributes_output = []
-
-            for attr_name, attr_value in vars(result).items():
-                if isinstance(attr_value, np.ndarray):
-                    images_to_display.append(attr_value)
-                    titles.append(attr_name)
-                elif isinstance(attr_value, (float, str)):
-                    attributes_output.append(f"{attr_name}: {attr_value}")
-
-            # Combine all attributes into a single string
-            attributes_string = "\n".join(attributes_output) + "\n"
-
-            # Combine and display images
-            if images_to_display:
-                num_images = len(images_to_display)
-                rows = ceil(num_images / 3)
-                cols = min(num_images, 3)
-
-                fig = plt.figure(figsize=(cols * 5, rows * 5))
-                spec = gridspec.GridSpec(rows, cols, figure=fig, wspace=0.3, hspace=0.3)
-
-                for idx, (img, title) in enumerate(zip(images_to_display, titles)):
-                    ax = fig.add_subplot(spec[idx])
-                    ax.imshow(img)
-                    ax.set_title(f"Variable: {title}", fontsize=10)  # Add variable name at the top
-                    ax.axis("off")
-
-                # Add a white border around the entire figure
-                fig.patch.set_facecolor('white')
-                fig.tight_layout(pad=0)
-
-                # Convert the matplotlib figure to a PIL image
-                buf = BytesIO()
-                fig.savefig(buf, format="png", bbox_inches='tight')
-                buf.seek(0)
-                pil_image = Image.open(buf).copy()  # Copy the image into memory
-                buf.close()
-
-                # Append the PIL image and attributes string to the results list
-                results.append((pil_image, attributes_string))
+        with STAGE_METRICS.Timer(stage="scan", model=model, week=week):
+            dataset_unit.LoadImagesName(paths=image_path)
+
+        for path in dataset_unit.images_name_:
+            with STAGE_METRICS.Timer(stage="read", model=model, week=week):
+                image = read_image(path, as_tensor=True)
+            with STAGE_METRICS.Timer(stage="predict", model=model, week=week):
+                result = self.PredictTiled(image=image, tile_size=tile_size, overlap=overlap, top_k=top_k)
+            with STAGE_METRICS.Timer(stage="render", model=model, week=week):
+                rendered = self.Render(result=result)
+            if rendered is not None:
+                yield rendered
+
+    def EvaluateArrays(self, *, images: list[np.ndarray], batch_size: Optional[int] = None) -> Iterator[tuple[Image.Image, str]]:
+        """
+        Evaluate the model on in-memory images, nothing is written to or read from disk.
+        Results are yielded as soon as their batch is scored.
+
+        Args:
+        images : list[np.ndarray] - RGB images as HxWx3 uint8 arrays (e.g. decoded with ImageUnit.DecodeImage).
+        batch_size : Optional[int] - Images per forward pass, defaults to batch_size_.
+
+        Yields:
+        tuple[Image.Image, str] - The PIL image and the attributes as a string, one per image.
+
+        Example:
+        >>> image_unit = ImageUnit()
+        >>> image = image_unit.ConvertColor(image_unit.DecodeImage(data, ImageUnit.ColorModeEnum.rgb_), ImageUnit.ColorConversionEnum.bgr2rgb_)
+        >>> anomalib_test.EvaluateArrays(images=[image])
+        """
+        assert self.inferencer_ is not None, "Inferencer is not set"
+
+        batch_size = self.batch_size_ if batch_size is None else batch_size
+
+        model, week = self.labels_
+
+        for start in range(0, len(images), batch_size):
+            tensors = [self.ArrayToTensor(image=image) for image in images[start:start + batch_size]]
+            with STAGE_METRICS.Timer(stage="predict", model=model, week=week):
+                results = self.PredictBatch(images=tensors)
+            for result in results:
+                with STAGE_METRICS.Timer(stage="render", model=model, week=week):
+                    rendered = self.Render(result=result)
+                if rendered is not None:
+                    yield rendered
+
+    def PredictBatch(self, *, images: list[torch.Tensor]) -> list[ImageResult]:
+        """
+        Run one forward pass for a batch of images and split it back into one ImageResult per image.
+        Images are resized to the model input size before stacking, so the batch may mix resolutions.
+        The anomaly map of every image is still post-processed back to its own original shape.
+
+        Args:
+        images : list[torch.Tensor] - CxHxW float tensors in [0, 1].
+
+        Returns:
+        list[ImageResult] - One result per image, same order as the input.
+
+        Example:
+        >>> results = anomalib_test.PredictBatch(images=[read_image("a.jpg", as_tensor=True), read_image("b.jpg", as_tensor=True)])
+        """
+        assert self.inferencer_ is not None, "Inferencer is not set"
+        if len(images) == 0:
+            return []
+
+        return self.PostProcess(predictions=self.Forward(images=images), images=images)
+
+    def PostProcess(self, *, predictions: Any, images: list[torch.Tensor]) -> list[ImageResult]:
+        """
+        Split a batched model output into one ImageResult per image, the second half of PredictBatch.
+
+        Args:
+        predictions : Any - The batched output of the model for the images.
+        images : list[torch.Tensor] - The CxHxW float tensors the output was computed from, in batch order.
+
+        Returns:
+        list[ImageResult] - One result per image, same order as the input.
+        """
+        assert self.inferencer_ is not None, "Inferencer is not set"
+        from anomalib.utils.visualization.image import ImageResult
+
+        results: list[ImageResult] = []
+        for index, image in enumerate(images):
+            # Each image keeps its own shape so the maps are resized back to the upload size
+            metadata: dict[str, Any] = dict(self.inferencer_.metadata)
+            metadata["image_shape"] = image.shape[-2:]
+            output = self.inferencer_.post_process(self.SplitPrediction(predictions=predictions, index=index), metadata=metadata)
+
+            results.append(ImageResult(
+                image=(image.numpy().transpose(1, 2, 0) * 255).astype(np.uint8),
+                pred_score=output["pred_score"],
+                pred_label=output["pred_label"],
+                anomaly_map=output["anomaly_map"],
+                pred_mask=output["pred_mask"],
+                pred_boxes=output["pred_boxes"],
+                box_labels=output["box_labels"],
+            ))
 
         return results
-            
+
+    def PredictScores(self, *, images: list[torch.Tensor]) -> list[tuple[float, Optional[bool]]]:
+        """
+        Score-only fast path of PredictBatch: one forward pass, then only the score and label are post-processed.
+        The anomaly map is not resized back to the image, and no ImageResult is built, so there is no heat map colouring,
+        segmentation or rendering. Scores and labels are the same as those of PredictBatch.
+
+        Args:
+        images : list[torch.Tensor] - CxHxW float tensors in [0, 1].
+
+        Returns:
+        list[tuple[float, Optional[bool]]] - The normalized pred_score and the pred_label per image, same order as the input.
+
+        Example:
+        >>> scores = anomalib_test.PredictScores(images=[read_image("a.jpg", as_tensor=True)])
+        """
+        assert self.inferencer_ is not None, "Inferencer is not set"
+        if len(images) == 0:
+            return []
+
+        predictions = self.Forward(images=images)
+
+        # Without image_shape post_process keeps the map at the model resolution, the score does not depend on it
+        metadata: dict[str, Any] = dict(self.inferencer_.metadata)
+        metadata.pop("image_shape", None)
+
+        scores: list[tuple[float, Optional[bool]]] = []
+        for index in range(len(images)):
+            output = self.inferencer_.post_process(self.SplitPrediction(predictions=predictions, index=index), metadata=metadata)
+            pred_label = output["pred_label"]
+            scores.append((float(output["pred_score"]), None if pred_label is None else bool(pred_label)))
+        return scores
+
+    def PredictTiled(self, *, image: torch.Tensor, tile_size: Optional[int] = None, overlap: float = 0.25, top_k: int = 1) -> ImageResult:
+        """
+        Score one high resolution image without downsizing it: the image is split into overlapping square tiles,
+        the tiles run through the model batch_size_ at a time, and their anomaly maps are blended back together
+        with a Hann window, so tile seams do not show. The window of a tile stays flat on the sides it shares with
+        the image border (see TileWindow). Pixels where every covering window is 0 (the tile seams when overlap is 0)
+        take the plain mean of their tiles. Images smaller than a tile are upscaled to one tile.
+
+        Args:
+        image : torch.Tensor - CxHxW float tensor in [0, 1], any resolution.
+        tile_size : Optional[int] - Side of the square tiles in pixels, defaults to the model input size (tiles are not resized then).
+        overlap : float - Fraction of a tile shared with its neighbour, in [0, 1). Default is 0.25.
+        top_k : int - Number of highest tile scores averaged into the image score, 1 for the max. Default is 1.
+
+        Returns:
+        ImageResult - The full resolution image with the stitched anomaly map, the pred_mask at the 0.5 normalized threshold and the top-k score.
+
+        Example:
+        >>> result = anomalib_test.PredictTiled(image=read_image("photo.jpg", as_tensor=True), tile_size=256, overlap=0.25, top_k=3)
+        """
+        assert self.inferencer_ is not None, "Inferencer is not set"
+        assert 0 <= overlap < 1, "Overlap must be in [0, 1)"
+        assert top_k > 0, "top_k must be positive"
+        tile_height, tile_width = self.InputSize() if tile_size is None else (tile_size, tile_size)
+
+        # Upscale images smaller than a tile, keeping the aspect ratio
+        height, width = image.shape[-2:]
+        if height < tile_height or width < tile_width:
+            scale = max(tile_height / height, tile_width / width)
+            image = self.ResizeTensor(image=image, size=(max(tile_height, ceil(height * scale)), max(tile_width, ceil(width * scale))))
+            height, width = image.shape[-2:]
+
+        tops = self.TileOrigins(length=height, tile=tile_height, overlap=overlap)
+        lefts = self.TileOrigins(length=width, tile=tile_width, overlap=overlap)
+        origins = [(top, left) for top in tops for left in lefts]
+        tiles = [image[:, top:top + tile_height, left:left + tile_width] for top, left in origins]
+
+        row_windows = {top: self.TileWindow(tile=tile_height, first=top == 0, last=top + tile_height == height) for top in tops}
+        column_windows = {left: self.TileWindow(tile=tile_width, first=left == 0, last=left + tile_width == width) for left in lefts}
+        anomaly_sum = np.zeros((height, width), dtype=np.float32)
+        weight_sum = np.zeros((height, width), dtype=np.float32)
+        plain_sum = np.zeros((height, width), dtype=np.float32)
+        tile_count = np.zeros((height, width), dtype=np.float32)
+        metadata: dict[str, Any] = dict(self.inferencer_.metadata)
+        metadata["image_shape"] = (tile_height, tile_width)
+
+        scores: list[float] = []
+        for start in range(0, len(tiles), self.batch_size_):
+            predictions = self.Forward(images=tiles[start:start + self.batch_size_])
+            for index, (top, left) in enumerate(origins[start:start + self.batch_size_]):
+                output = self.inferencer_.post_process(self.SplitPrediction(predictions=predictions, index=index), metadata=metadata)
+                scores.append(float(output["pred_score"]))
+                if output["anomaly_map"] is not None:
+                    tile_map = np.squeeze(output["anomaly_map"]).astype(np.float32)
+                    window = np.outer(row_windows[top], column_windows[left]).astype(np.float32)
+                    anomaly_sum[top:top + tile_height, left:left + tile_width] += tile_map * window
+                    weight_sum[top:top + tile_height, left:left + tile_width] += window
+                    plain_sum[top:top + tile_height, left:left + tile_width] += tile_map
+                    tile_count[top:top + tile_height, left:left + tile_width] += 1
+
+        top_scores = sorted(scores, reverse=True)[:top_k]
+        pred_score = sum(top_scores) / len(top_scores)
+        anomaly_map = None
+        if tile_count.any():
+            anomaly_map = plain_sum / np.maximum(tile_count, 1)
+            np.divide(anomaly_sum, weight_sum, out=anomaly_map, where=weight_sum > 0)
+
+        from anomalib.utils.visualization.image import ImageResult
+
+        return ImageResult(
+            image=(image.numpy().transpose(1, 2, 0) * 255).astype(np.uint8),
+            pred_score=pred_score,
+            pred_label=bool(pred_score >= 0.5),
+            anomaly_map=anomaly_map,
+            pred_mask=None if anomaly_map is None else (anomaly_map >= 0.5).astype(np.uint8),
+        )
+
+    def TileWindow(self, *, tile: int, first: bool, last: bool) -> np.ndarray:
+        """
+        Get the blending weights of a tile along one side, a Hann window that tapers towards the neighbouring tiles.
+        A tile edge on the image border has no neighbour to blend with, so the window stays flat up to it, otherwise
+        the pixels along the border would get almost no weight from any tile and the padded edges of the tiles would show.
+
+        Args:
+        tile : int - Length of the tile in pixels.
+        first : bool - Whether the tile starts on the image border.
+        last : bool - Whether the tile ends on the image border.
+
+        Returns:
+        np.ndarray - The weight of each pixel along the side.
+        """
+        window = np.hanning(tile)
+        center = tile // 2
+        if first:
+            window[:center] = window[center]
+        if last:
+            window[center:] = window[center]
+        return window
+
+    def TileOrigins(self, *, length: int, tile: int, overlap: float) -> list[int]:
+        """
+        Get the start of every tile along one side, evenly strided, the last tile ends on the border.
+
+        Args:
+        length : int - Length of the side in pixels, at least tile.
+        tile : int - Length of a tile in pixels.
+        overlap : float - Fraction of a tile shared with its neighbour.
+
+        Returns:
+        list[int] - The tile starts, in increasing order.
+        """
+        if length <= tile:
+            return [0]
+        stride = max(1, int(tile * (1 - overlap)))
+        return list(range(0, length - tile, stride)) + [length - tile]
+
+    def Forward(self, *, images: list[torch.Tensor]) -> Any:
+        """
+        Resize the images to the model input size, stack them and run one forward pass.
+
+        Args:
+        images : list[torch.Tensor] - CxHxW float tensors in [0, 1], at least one.
+
+        Returns:
+        Any - The batched output of the model, split per image with SplitPrediction.
+        """
+        import torch
+
+        assert self.inferencer_ is not None, "Inferencer is not set"
+        input_size = self.InputSize()
+        batch = torch.stack([self.ResizeTensor(image=image, size=input_size) for image in images])
+
+        # The batch is already NCHW, pre_process is skipped: it takes a first dimension of 3 for the channels
+        # of a single image, and would add a batch dimension to a batch of three images
+        if self.graph_:
+            # The graph runtime takes an NCHW float32 array, its outputs are arrays keyed by output port
+            return self.inferencer_.forward(np.ascontiguousarray(batch.numpy(), dtype=np.float32))
+        with torch.inference_mode():
+            return self.inferencer_.forward(batch.to(self.inferencer_.device))
+
+    def SplitPrediction(self, *, predictions: Any, index: int) -> Any:
+        """
+        Take the slice of a batched model output that belongs to one image, keeping a batch dimension of 1.
+        Models return a tensor (or array), a mapping of tensors or a sequence of tensors, all three are handled.
+        OpenVINO returns an OVDict, a Mapping but not a dict, it is sliced into a dict with the same output keys.
+
+        Args:
+        predictions : Any - The batched output of the model forward pass.
+        index : int - Index of the image in the batch.
+
+        Returns:
+        Any - The output for a single image, in the same structure as the input.
+        """
+        import torch
+
+        if isinstance(predictions, (torch.Tensor, np.ndarray)):
+            return predictions[index:index + 1]
+        if isinstance(predictions, Mapping):
+            return {key: self.SplitPrediction(predictions=value, index=index) for key, value in predictions.items()}
+        if isinstance(predictions, (list, tuple)):
+            return type(predictions)(self.SplitPrediction(predictions=value, index=index) for value in predictions)
+        return predictions
+
+    def InputSize(self) -> tuple[int, int]:
+        """
+        Get the (height, width) the model expects, read by ReadInputSize when the model was loaded.
+        Images are resized to it before stacking, so the model's own Resize leaves them unchanged.
+
+        Returns:
+        tuple[int, int] - The model input size.
+        """
+        assert self.inferencer_ is not None, "Inferencer is not set"
+        return self.input_size_
+
+    def ReadInputSize(self) -> tuple[int, int]:
+        """
+        Read the (height, width) the loaded model expects.
+        Graphs report it on their input. Torch models are exported as an InferenceModel that applies its transform
+        (Resize, CenterCrop, Normalize) itself, the size is the shape that transform gives, found like
+        AnomalyModule.input_size by passing it a 1x1 image. Models without a transform fall back to their input_size attribute.
+
+        Returns:
+        tuple[int, int] - The model input size, DEFAULT_INPUT_SIZE if the model does not report one.
+        """
+        assert self.inferencer_ is not None, "Inferencer is not set"
+        if self.graph_:
+            # Graphs are exported with a static height and width, only the batch dimension is dynamic
+            shape = self.inferencer_.model.input(0).get_partial_shape()
+            if shape.rank.is_dynamic or shape[2].is_dynamic or shape[3].is_dynamic:
+                return self.DEFAULT_INPUT_SIZE
+            return (shape[2].get_length(), shape[3].get_length())
+
+        import torch
+
+        transform = getattr(self.inferencer_.model, "transform", None)
+        if transform is not None:
+            with torch.inference_mode():
+                height, width = transform(torch.zeros(1, 3, 1, 1, device=self.inferencer_.device)).shape[-2:]
+            if (height, width) != (1, 1):
+                return (int(height), int(width))
+        input_size = getattr(self.inferencer_.model, "input_size", None)
+        if input_size is None:
+            return self.DEFAULT_INPUT_SIZE
+        return (int(input_size[0]), int(input_size[1]))
+
+    def ResizeTensor(self, *, image: torch.Tensor, size: tuple[int, int]) -> torch.Tensor:
+        """
+        Resize a CxHxW tensor to (height, width), antialiased like the model's own Resize transform.
+
+        Args:
+        image : torch.Tensor - CxHxW float tensor.
+        size : tuple[int, int] - Target (height, width).
+
+        Returns:
+        torch.Tensor - The resized CxHxW tensor, the input itself if it already has the size.
+        """
+        from torch.nn.functional import interpolate
+
+        if tuple(image.shape[-2:]) == size:
+            return image
+        return interpolate(image.unsqueeze(0), size=size, mode="bilinear", align_corners=False, antialias=True).squeeze(0)
+
+    def ArrayToTensor(self, *, image: np.ndarray) -> torch.Tensor:
+        """
+        Convert an RGB HxWx3 uint8 array into the CxHxW float tensor in [0, 1] expected by the inferencer.
+        Same layout as anomalib's read_image(path, as_tensor=True).
+
+        Args:
+        image : np.ndarray - RGB image as HxWx3 uint8 array.
+
+        Returns:
+        torch.Tensor - CxHxW float32 tensor scaled to [0, 1].
+        """
+        import torch
+
+        assert image.ndim == 3 and image.shape[2] == 3, "Image must be HxWx3"
+        return torch.from_numpy(np.ascontiguousarray(image)).permute(2, 0, 1).float().div_(255.0)
+
+    @classmethod
+    def Render(cls, *, result: ImageResult) -> Optional[tuple[Image.Image, str]]:
+        """
+        Render every np.ndarray attribute of the result into one image and collect the scalar attributes as text.
+        Arrays are tiled on a white canvas with direct array operations, three per row, each under a "Variable: name" title.
+        The output only depends on the result, and the canvas never exceeds rows x columns tiles of RENDER_TILE_SIZE.
+        No model state is used, so results are rendered without loading a model, e.g. AnomalibTest.Render(result=result).
+
+        Args:
+        result : ImageResult - The prediction from the inferencer.
+
+        Returns:
+        Optional[tuple[Image.Image, str]] - The PIL image and the attributes as a string, None if there is nothing to display.
+        """
+        # Collect np.ndarray attributes for combined display
+        images_to_display = []
+        titles = []
+        attributes_output = []
+
+        for attr_name, attr_value in vars(result).items():
+            if isinstance(attr_value, np.ndarray):
+                images_to_display.append(attr_value)
+                titles.append(attr_name)
+            elif isinstance(attr_value, (float, str)):
+                attributes_output.append(f"{attr_name}: {attr_value}")
+
+        # Combine all attributes into a single string
+        attributes_string = "\n".join(attributes_output) + "\n"
+
+        # Combine and display images
+        if not images_to_display:
+            return None
+
+        num_images = len(images_to_display)
+        rows = ceil(num_images / cls.RENDER_COLUMNS)
+        cols = min(num_images, cls.RENDER_COLUMNS)
+        cell_height = cls.RENDER_TITLE_HEIGHT + cls.RENDER_TILE_SIZE
+
+        canvas = np.full((rows * cell_height, cols * cls.RENDER_TILE_SIZE, 3), 255, dtype=np.uint8)
+
+        for idx, (img, title) in enumerate(zip(images_to_display, titles)):
+            top = (idx // cols) * cell_height
+            left = (idx % cols) * cls.RENDER_TILE_SIZE
+
+            # Variable name at the top of the tile
+            text = f"Variable: {title}"
+            (text_width, text_height), _ = getTextSize(text, FONT_HERSHEY_SIMPLEX, 0.5, 1)
+            putText(canvas, text, (left + max(0, (cls.RENDER_TILE_SIZE - text_width) // 2), top + (cls.RENDER_TITLE_HEIGHT + text_height) // 2), FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1, LINE_AA)
+
+            # Fit the array into the tile keeping its aspect ratio, centred on the white background
+            tile = cls.ArrayToRGB(array=img)
+            scale = cls.RENDER_TILE_SIZE / max(tile.shape[0], tile.shape[1])
+            height = max(1, round(tile.shape[0] * scale))
+            width = max(1, round(tile.shape[1] * scale))
+            tile = resize(tile, (width, height), interpolation=INTER_AREA if scale < 1 else INTER_LINEAR)
+
+            tile_top = top + cls.RENDER_TITLE_HEIGHT + (cls.RENDER_TILE_SIZE - height) // 2
+            tile_left = left + (cls.RENDER_TILE_SIZE - width) // 2
+            canvas[tile_top:tile_top + height, tile_left:tile_left + width] = tile
+
+        return Image.fromarray(canvas), attributes_string
+
+    @staticmethod
+    def ArrayToRGB(*, array: np.ndarray) -> np.ndarray:
+        """
+        Convert an ImageResult array into an RGB uint8 image.
+        Single channel arrays (anomaly_map, pred_mask) are min-max scaled and coloured with viridis, like imshow does.
+        Three channel arrays (image, heat_map, segmentations) are kept, float ones in [0, 1] are scaled to [0, 255].
+
+        Args:
+        array : np.ndarray - HxW or HxWx3 array.
+
+        Returns:
+        np.ndarray - HxWx3 uint8 RGB image.
+        """
+        array = np.squeeze(array)
+
+        if array.ndim == 2:
+            array = array.astype(np.float32)
+            low, high = float(array.min()), float(array.max())
+            scaled = np.zeros(array.shape, dtype=np.uint8) if high <= low else ((array - low) * (255.0 / (high - low))).astype(np.uint8)
+            return cvtColor(applyColorMap(scaled, COLORMAP_VIRIDIS), COLOR_BGR2RGB)
+
+        assert array.ndim == 3 and array.shape[2] in (3, 4), "Array must be HxW or HxWx3"
+        array = array[:, :, :3]
+        if array.dtype == np.uint8:
+            return np.ascontiguousarray(array)
+        if float(array.max()) <= 1.0:
+            array = array * 255.0
+        return np.clip(array, 0, 255).astype(np.uint8)
+
+class AnomalibEnsemble:
+    """
+    The AnomalibEnsemble class scores images with several torch models in one call and combines their normalized outputs.
+    Models with the same frozen pretrained backbone (e.g. resnet18 for fastflow and stfpm, wide_resnet50_2 for cflow,
+    patchcore and reverse_distillation) share one copy of it. Every member must be trained with the same transform,
+    so each batch is transformed once, fed once to every shared backbone for the union of their layers, and then passed
+    to the models without their own transform, every head reusing those features. The cost is one backbone pass per backbone plus the heads.
+    The pred_score and anomaly_map of every model are normalized to [0, 1] with 0.5 at its threshold, the ensemble averages them.
+    The members are torch copies of their own, loaded from model.pt whatever INFERENCE_BACKENDS is, not the models of /predict.
+
+    Attributes:
+    members_ : list[tuple[ModelPathUnit.ModelTypeEnum, AnomalibTest]] - The models, in the order given.
+    shared_ : dict[str, SharedBackbone] - The shared backbones by name.
+    transform_ : Optional[torch.nn.Module] - The transform of every member, run once per batch.
+    input_size_ : tuple[int, int] - The input size of every member, images are resized to it before the transform.
+    batch_size_ : int - Number of images per forward pass of every model.
+    labels_ : tuple[str, str] - Model and week the stage latencies are recorded under.
+    warm_ : bool - Whether the warm-up inferences have run since the models were loaded.
+    warmup_ms_ : list[float] - Latency of each warm-up inference in ms.
+    lock_ : Lock - One batch at a time, the shared backbones hold the features of the batch fed.
+
+    Example:
+    >>> model_path_unit = ModelPathUnit()
+    >>> week = ModelPathUnit.ModelWeekEnum.week3_
+    >>> anomalib_ensemble = AnomalibEnsemble()
+    >>> anomalib_ensemble.Setup(model_paths={types: model_path_unit.ModelPath(types=types, week=week) for types in ModelPathUnit.ModelTypeEnum})
+    >>> anomalib_ensemble.EvaluateArrays(images=[image])
+    """
+
+    def __init__(self, *, batch_size: int = 8, labels: tuple[str, str] = ("ensemble", "unknown")) -> None:
+        """
+        Initialize the AnomalibEnsemble class.
+
+        Args:
+        batch_size : int - Number of images per forward pass of every model. Default is 8.
+        labels : tuple[str, str] - Model and week the stage latencies are recorded under. Default is ("ensemble", "unknown").
+        """
+        assert batch_size > 0, "Batch size must be positive"
+        self.members_ : list[tuple[ModelPathUnit.ModelTypeEnum, AnomalibTest]] = []
+        self.shared_ : dict[str, SharedBackbone] = {}
+        self.transform_ : Optional[torch.nn.Module] = None
+        self.input_size_ : tuple[int, int] = AnomalibTest.DEFAULT_INPUT_SIZE
+        self.batch_size_ : int = batch_size
+        self.labels_ : tuple[str, str] = labels
+        self.warm_ : bool = False
+        self.warmup_ms_ : list[float] = []
+        self.lock_ : Lock = Lock()
+
+    def Setup(self, *, model_paths: dict[ModelPathUnit.ModelTypeEnum, str], warmup: int = 0) -> None:
+        """
+        Load the models, check they share one transform and share their backbones. Only torch models (model.pt)
+        expose their backbone and transform, exported graphs cannot be split and are not accepted.
+
+        Args:
+        model_paths : dict[ModelPathUnit.ModelTypeEnum, str] - The torch artifact of every model.
+        warmup : int - Synthetic inferences run once the backbones are shared, see Warmup. Default is 0.
+        """
+        from classes.ensemble_lib import ShareBackbones
+
+        assert len(model_paths) > 0, "Ensemble needs at least one model"
+        self.members_ = []
+        for types, model_path in model_paths.items():
+            assert model_path.endswith(".pt"), f"Ensemble members must be torch models: {model_path}"
+            anomalib_test = AnomalibTest(batch_size=self.batch_size_, labels=(types.name.rstrip("_"), self.labels_[1]))
+            anomalib_test.Setup(model_path=model_path)
+            self.members_.append((types, anomalib_test))
+
+        # The batch is transformed once for every member, so they must all transform it the same way
+        transforms : dict[str, list[str]] = {}
+        for types, anomalib_test in self.members_:
+            assert anomalib_test.inferencer_ is not None and not anomalib_test.graph_, "Inferencer is not set"
+            assert hasattr(anomalib_test.inferencer_.model, "transform") and hasattr(anomalib_test.inferencer_.model, "model"), f"Ensemble members must be exported with their transform: {types.name}"
+            transforms.setdefault(repr(anomalib_test.inferencer_.model.transform), []).append(types.name.rstrip("_"))
+        assert len(transforms) == 1, f"Ensemble members must share one transform: {list(transforms.values())}"
+        first = self.members_[0][1]
+        self.transform_ = first.inferencer_.model.transform # type: ignore
+        self.input_size_ = first.InputSize()
+
+        # Raw timm extractors do not record their backbone, it comes from the training parameters
+        models : list[tuple[torch.nn.Module, str]] = []
+        for types, anomalib_test in self.members_:
+            model_type_flag = AnomalyModelUnit.ModelTypeFlag[types.name]
+            models.append((anomalib_test.inferencer_.model.model, str(AnomalyModelUnit.MODELS_PARAMS_DICT[model_type_flag].get("backbone", "")))) # type: ignore
+        self.shared_ = ShareBackbones(models)
+        self.warm_, self.warmup_ms_ = False, []
+        if warmup > 0:
+            self.Warmup(runs=warmup)
+
+    def Warmup(self, *, runs: int) -> list[float]:
+        """
+        Run synthetic inferences through every model and the shared backbones, see RunWarmup.
+        The images are made at the input size of the members.
+
+        Args:
+        runs : int - Number of warm-up inferences.
+
+        Returns:
+        list[float] - Latency of each inference in ms.
+        """
+        assert len(self.members_) > 0, "Models are not set"
+        self.warmup_ms_ = RunWarmup(predict=lambda images: self.PredictBatch(images=images), size=self.input_size_, batch_size=self.batch_size_, runs=runs, labels=self.labels_)
+        self.warm_ = True
+        return self.warmup_ms_
+
+    def MemoryBytes(self) -> int:
+        """
+        Estimate the resident size of the models, the shared backbones counted once.
+
+        Returns:
+        int - Size in bytes, 0 if no model is loaded.
+        """
+        sizes : dict[int, int] = {}
+        for _, anomalib_test in self.members_:
+            assert anomalib_test.inferencer_ is not None and not anomalib_test.graph_, "Inferencer is not set"
+            model = anomalib_test.inferencer_.model
+            for tensor in list(model.parameters()) + list(model.buffers()):
+                sizes[tensor.data_ptr()] = tensor.numel() * tensor.element_size()
+        return sum(sizes.values())
+
+    def PredictBatch(self, *, images: list[torch.Tensor]) -> list[tuple[ImageResult, dict[str, float]]]:
+        """
+        Score one batch with every model and combine the results per image. The batch is resized and transformed once,
+        fed to every shared backbone, then run through each model without its transform.
+
+        Args:
+        images : list[torch.Tensor] - CxHxW float tensors in [0, 1].
+
+        Returns:
+        list[tuple[ImageResult, dict[str, float]]] - The combined result and the normalized score of every model, per image.
+        """
+        import torch
+
+        assert self.members_, "Ensemble is not set up"
+        if len(images) == 0:
+            return []
+
+        first = self.members_[0][1]
+        assert first.inferencer_ is not None and self.transform_ is not None, "Ensemble is not set up"
+        batch = torch.stack([first.ResizeTensor(image=image, size=self.input_size_) for image in images]).to(first.inferencer_.device)
+
+        with self.lock_, torch.inference_mode():
+            try:
+                inputs = self.transform_(batch)
+                for shared in self.shared_.values():
+                    shared.Feed(inputs=inputs)
+                member_results = [(types.name.rstrip("_"), anomalib_test.PostProcess(predictions=anomalib_test.inferencer_.model.model(inputs), images=images)) for types, anomalib_test in self.members_] # type: ignore
+            finally:
+                for shared in self.shared_.values():
+                    shared.Clear()
+
+        from anomalib.utils.visualization.image import ImageResult
+
+        combined : list[tuple[ImageResult, dict[str, float]]] = []
+        for index in range(len(images)):
+            scores = {name: float(results[index].pred_score) for name, results in member_results}
+            pred_score = sum(scores.values()) / len(scores)
+            anomaly_maps = [np.squeeze(results[index].anomaly_map) for _, results in member_results if results[index].anomaly_map is not None]
+            anomaly_map = np.mean(anomaly_maps, axis=0) if anomaly_maps else None
+            combined.append((ImageResult(
+                image=member_results[0][1][index].image,
+                pred_score=pred_score,
+                pred_label=bool(pred_score >= 0.5),
+                anomaly_map=anomaly_map,
+                pred_mask=None if anomaly_map is None else (anomaly_map >= 0.5).astype(np.uint8),
+            ), scores))
+        return combined
+
+    def PredictArrays(self, *, images: list[np.ndarray]) -> list[tuple[ImageResult, dict[str, float]]]:
+        """
+        PredictBatch for in-memory images.
+
+        Args:
+        images : list[np.ndarray] - RGB images as HxWx3 uint8 arrays.
+
+        Returns:
+        list[tuple[ImageResult, dict[str, float]]] - The combined result and the normalized score of every model, per image.
+        """
+        assert self.members_, "Ensemble is not set up"
+        return self.PredictBatch(images=[self.members_[0][1].ArrayToTensor(image=image) for image in images])
+
+    @staticmethod
+    def Render(*, result: ImageResult, scores: dict[str, float]) -> Optional[tuple[Image.Image, str]]:
+        """
+        Render a combined result with AnomalibTest.Render, the attributes string ends with the normalized score of every model.
+        No model state is used, so results are rendered without loading the ensemble.
+
+        Args:
+        result : ImageResult - The combined result.
+        scores : dict[str, float] - The normalized score of every model.
+
+        Returns:
+        Optional[tuple[Image.Image, str]] - The PIL image and the attributes as a string, None if there is nothing to display.
+        """
+        rendered = AnomalibTest.Render(result=result)
+        if rendered is None:
+            return None
+        return rendered[0], rendered[1] + "".join(f"{name}_score: {score}\n" for name, score in scores.items())
+
+    def EvaluateArrays(self, *, images: list[np.ndarray], batch_size: Optional[int] = None) -> Iterator[tuple[Image.Image, str]]:
+        """
+        Evaluate the ensemble on in-memory images, results are yielded as soon as their batch is scored.
+        The attributes string ends with the normalized score of every model.
+
+        Args:
+        images : list[np.ndarray] - RGB images as HxWx3 uint8 arrays.
+        batch_size : Optional[int] - Images per forward pass, defaults to batch_size_.
+
+        Yields:
+        tuple[Image.Image, str] - The PIL image and the attributes as a string, one per image.
+        """
+        assert self.members_, "Ensemble is not set up"
+        model, week = self.labels_
+
+        batch_size = self.batch_size_ if batch_size is None else batch_size
+
+        for start in range(0, len(images), batch_size):
+            with STAGE_METRICS.Timer(stage="predict", model=model, week=week):
+                results = self.PredictArrays(images=images[start:start + batch_size])
+            for result, scores in results:
+                with STAGE_METRICS.Timer(stage="render", model=model, week=week):
+                    rendered = self.Render(result=result, scores=scores)
+                if rendered is not None:
+                    yield rendered
+
+ModelKey = tuple[ModelPathUnit.ModelTypeEnum, ModelPathUnit.ModelWeekEnum]
+EnsembleKey = tuple[tuple[ModelPathUnit.ModelTypeEnum, ...], ModelPathUnit.ModelWeekEnum]
+# Path and modification time in nanoseconds of every artifact of a loaded model
+ArtifactSource = tuple[tuple[str, int], ...]
+
+def ModelLabels(key: ModelKey) -> tuple[str, str]:
+    """
+    Get the model and week labels a model key is reported under in the metrics.
+
+    Args:
+    key : ModelKey - The model key.
+
+    Returns:
+    tuple[str, str] - The model type without the trailing underscore and the week number, e.g. ("cflow", "3").
+    """
+    return key[0].name.rstrip("_"), str(key[1].value)
+
+def RunWarmup(*, predict: Callable[[list[torch.Tensor]], Any], size: tuple[int, int], batch_size: int, runs: int, labels: tuple[str, str]) -> list[float]:
+    """
+    Run synthetic inferences on seeded noise images, a single image and a full batch in turn,
+    since the first request and batched traffic get different kernels. Each one is timed into STAGE_METRICS as "warmup".
+
+    Args:
+    predict : Callable[[list[torch.Tensor]], Any] - Predicts a batch of CxHxW float images in [0, 1], e.g. AnomalibTest.PredictBatch.
+    size : tuple[int, int] - The (height, width) of the images.
+    batch_size : int - Images in the full batch.
+    runs : int - Number of inferences.
+    labels : tuple[str, str] - Model and week the latencies are recorded under.
+
+    Returns:
+    list[float] - Latency of each inference in ms.
+    """
+    import torch
+
+    generator = torch.Generator().manual_seed(0)
+    latencies : list[float] = []
+    for run in range(runs):
+        images = [torch.rand(3, size[0], size[1], generator=generator) for _ in range(1 if run % 2 == 0 else batch_size)]
+        start = perf_counter()
+        predict(images)
+        seconds = perf_counter() - start
+        STAGE_METRICS.Observe(stage="warmup", model=labels[0], week=labels[1], seconds=seconds)
+        latencies.append(seconds * 1000)
+    return latencies
+
+class ModelRegistry:
+    """
+    The ModelRegistry class keeps several AnomalibTest instances resident so switching model or week does not reload from disk.
+    Models are keyed by (ModelTypeEnum, ModelWeekEnum) and evicted least recently used first once the memory budget is exceeded.
+    A model is loaded and warmed outside the lock, requests for other models keep being served meanwhile,
+    and concurrent requests for the model being loaded wait for that one load instead of starting their own.
+    A resident model whose artifact was replaced on disk (e.g. retrained or re-exported) is reloaded by the next request for it,
+    so the model served always matches the modification time ResultCache keys its results on.
+
+    Attributes:
+    model_path_unit_ : ModelPathUnit - Resolves the model path of a key.
+    backends_ : Optional[list[ModelPathUnit.ModelBackendEnum]] - Exported artifacts to load, preferred first, None until Backends picks them by device.
+    models_ : OrderedDict[Hashable, AnomalibTest | AnomalibEnsemble] - Loaded models and ensembles by ModelKey or EnsembleKey, least recently used first.
+    sizes_ : dict[Hashable, int] - Estimated size in bytes of each loaded model.
+    sources_ : dict[Hashable, ArtifactSource] - The artifacts each loaded model was read from, see Source.
+    generation_ : int - Counts the models loaded and dropped, InferencePool.Sync forks new workers when it changed.
+    memory_budget_bytes_ : int - Total size the loaded models may use before eviction.
+    batch_size_ : int - Batch size passed to every AnomalibTest.
+    warmup_ : int - Warm-up inferences run by every model when it is loaded.
+    default_key_ : Optional[ModelKey] - Model used when a request does not name one.
+    lock_ : Lock - Guards models_, sizes_, sources_ and loading_, held only to look up, insert and evict, never while a model loads.
+    loading_ : dict[Hashable, Future] - The load in progress of each key, resolves to the model or the error of the load.
+    status_ : dict[Hashable, dict[str, Any]] - Readiness of the loading and loaded models, see Readiness.
+    status_lock_ : Lock - Guards status_, held only briefly so readiness probes never wait for a model to load.
+
+    Example:
+    >>> model_registry = ModelRegistry(memory_budget_mb=4096)
+    >>> model_registry.SetDefault(types=ModelPathUnit.ModelTypeEnum.cflow_, week=ModelPathUnit.ModelWeekEnum.week3_)
+    >>> model_registry.Get(types=ModelPathUnit.ModelTypeEnum.patchcore_, week=ModelPathUnit.ModelWeekEnum.week8_).EvaluateArrays(images=[image])
+    """
+
+    def __init__(self, *, memory_budget_mb: float = 4096, batch_size: int = 8, backends: Optional[list[ModelPathUnit.ModelBackendEnum]] = None, warmup: int = 0) -> None:
+        """
+        Initialize the ModelRegistry class.
+
+        Args:
+        memory_budget_mb : float - Total size in MB the loaded models may use. Default is 4096.
+        batch_size : int - Batch size passed to every AnomalibTest. Default is 8.
+        warmup : int - Warm-up inferences run by every model when it is loaded. Default is 0.
+        backends : Optional[list[ModelPathUnit.ModelBackendEnum]] - Exported artifacts to load, preferred first.
+            Default is torch first with a GPU, OpenVINO then ONNX then torch on CPU only machines.
+        """
+        assert memory_budget_mb > 0, "Memory budget must be positive"
+        assert warmup >= 0, "Warm-up runs must not be negative"
+        self.model_path_unit_ : ModelPathUnit = ModelPathUnit()
+        self.backends_ : Optional[list[ModelPathUnit.ModelBackendEnum]] = backends
+        self.models_ : OrderedDict[Hashable, AnomalibTest | AnomalibEnsemble] = OrderedDict()
+        self.sizes_ : dict[Hashable, int] = {}
+        self.sources_ : dict[Hashable, ArtifactSource] = {}
+        self.generation_ : int = 0
+        self.memory_budget_bytes_ : int = int(memory_budget_mb * 1024 * 1024)
+        self.batch_size_ : int = batch_size
+        self.warmup_ : int = warmup
+        self.default_key_ : Optional[ModelKey] = None
+        self.lock_ : Lock = Lock()
+        self.loading_ : dict[Hashable, Future] = {}
+        self.status_ : dict[Hashable, dict[str, Any]] = {}
+        self.status_lock_ : Lock = Lock()
+        register_at_fork(after_in_child=self.AfterFork)
+
+    def AfterFork(self) -> None:
+        """
+        Give a forked worker fresh locks, they may have been held by another thread of the parent at the time of the fork.
+        The loaded models are kept, the worker shares them with the parent copy-on-write. Loads in progress belong to
+        threads of the parent that do not exist in the worker, they are forgotten.
+        """
+        self.lock_ = Lock()
+        self.loading_ = {}
+        self.status_lock_ = Lock()
+
+    def Get(self, *, types: ModelPathUnit.ModelTypeEnum, week: ModelPathUnit.ModelWeekEnum) -> AnomalibTest:
+        """
+        Get the model for the key, loading it (and evicting others if over budget) when it is not resident.
+
+        Args:
+        types : ModelPathUnit.ModelTypeEnum - The type of the model.
+        week : ModelPathUnit.ModelWeekEnum - The week of the model.
+
+        Returns:
+        AnomalibTest - The loaded model.
+        """
+        key : ModelKey = (types, week)
+        model_path = self.ModelPath(types=types, week=week)
+        def Load() -> AnomalibTest:
+            anomalib_test = AnomalibTest(batch_size=self.batch_size_, labels=ModelLabels(key))
+            anomalib_test.Setup(model_path=model_path, warmup=self.warmup_)
+            return anomalib_test
+        return self.GetOrLoad(key=key, labels=ModelLabels(key), source=self.Source(model_paths=[model_path]), load=Load) # type: ignore
+
+    def GetEnsemble(self, *, types: list[ModelPathUnit.ModelTypeEnum], week: ModelPathUnit.ModelWeekEnum) -> AnomalibEnsemble:
+        """
+        Get the ensemble of the models for the week, loading it when it is not resident.
+        Ensembles always load the torch artifacts, they share the memory budget with the single models.
+
+        Args:
+        types : list[ModelPathUnit.ModelTypeEnum] - The types of the models.
+        week : ModelPathUnit.ModelWeekEnum - The week of the models.
+
+        Returns:
+        AnomalibEnsemble - The loaded ensemble.
+        """
+        key : EnsembleKey = (tuple(types), week)
+        model_paths = {model_type: self.model_path_unit_.ModelPath(types=model_type, week=week) for model_type in types}
+        def Load() -> AnomalibEnsemble:
+            anomalib_ensemble = AnomalibEnsemble(batch_size=self.batch_size_, labels=("ensemble", str(week.value)))
+            anomalib_ensemble.Setup(model_paths=model_paths, warmup=self.warmup_)
+            return anomalib_ensemble
+        labels = ("+".join(model_type.name.rstrip("_") for model_type in types), str(week.value))
+        return self.GetOrLoad(key=key, labels=labels, source=self.Source(model_paths=list(model_paths.values())), load=Load) # type: ignore
+
+    def Source(self, *, model_paths: list[str]) -> ArtifactSource:
+        """
+        Identify the artifacts a model is loaded from by path and modification time, in nanoseconds as ResultCache.ModelTime.
+
+        Args:
+        model_paths : list[str] - The artifacts of the model, one per ensemble member.
+
+        Returns:
+        ArtifactSource - The path and modification time of each artifact, 0 for a missing one.
+        """
+        return tuple((model_path, int(getmtime(model_path) * 1e9) if isfile(model_path) else 0) for model_path in model_paths)
+
+    def GetOrLoad(self, *, key: Hashable, labels: tuple[str, str], source: ArtifactSource, load: Callable[[], AnomalibTest | AnomalibEnsemble]) -> AnomalibTest | AnomalibEnsemble:
+        """
+        Get a resident model, or load it outside the lock. The first request for a key runs the load, the others
+        wait for its future, and a failed load is raised to every waiting request, the next request tries again.
+        lock_ is only taken to look up, insert and evict, so cache hits never wait for a model being loaded or warmed.
+        A resident model loaded from other artifacts than source is dropped and loaded again.
+
+        Args:
+        key : Hashable - The ModelKey or EnsembleKey.
+        labels : tuple[str, str] - The model and week reported by Readiness.
+        source : ArtifactSource - The artifacts load reads, from Source.
+        load : Callable[[], AnomalibTest | AnomalibEnsemble] - Loads and warms the model.
+
+        Returns:
+        AnomalibTest | AnomalibEnsemble - The loaded model.
+        """
+        with self.lock_:
+            if key in self.models_:
+                if self.sources_[key] == source:
+                    self.models_.move_to_end(key)
+                    return self.models_[key]
+                # Retrained or exported again since it was loaded
+                self.Drop(key=key)
+            future = self.loading_.get(key)
+            if future is None:
+                future = self.loading_[key] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return future.result()
+
+        self.SetStatus(key=key, labels=labels, model=None)
+        try:
+            model = load()
+        except BaseException as e:
+            with self.lock_:
+                del self.loading_[key]
+            self.DropStatus(key=key)
+            future.set_exception(e)
+            raise
+
+        with self.lock_:
+            self.models_[key] = model
+            self.sizes_[key] = model.MemoryBytes()
+            self.sources_[key] = source
+            self.generation_ += 1
+            del self.loading_[key]
+            self.SetStatus(key=key, labels=labels, model=model)
+            self.Evict(keep=key)
+        future.set_result(model)
+        return model
+
+    def ModelPath(self, *, types: ModelPathUnit.ModelTypeEnum, week: ModelPathUnit.ModelWeekEnum) -> str:
+        """
+        Get the artifact the registry loads for the key, the first of backends_ that was exported.
+
+        Args:
+        types : ModelPathUnit.ModelTypeEnum - The type of the model.
+        week : ModelPathUnit.ModelWeekEnum - The week of the model.
+
+        Returns:
+        str - The model path.
+        """
+        return self.model_path_unit_.ResolveModelPath(types=types, week=week, backends=self.Backends())
+
+    def Backends(self) -> list[ModelPathUnit.ModelBackendEnum]:
+        """
+        Get the exported artifacts to load, preferred first. Without backends given they are picked by device on the first call,
+        which imports torch, so constructing the registry does not.
+
+        Returns:
+        list[ModelPathUnit.ModelBackendEnum] - torch first with a GPU, OpenVINO then ONNX then torch on CPU only machines.
+        """
+        if self.backends_ is None:
+            import torch
+
+            if torch.cuda.is_available():
+                self.backends_ = [ModelPathUnit.ModelBackendEnum.torch_]
+            else:
+                self.backends_ = [ModelPathUnit.ModelBackendEnum.openvino_, ModelPathUnit.ModelBackendEnum.onnx_, ModelPathUnit.ModelBackendEnum.torch_]
+        return self.backends_
+
+    def SetDefault(self, *, types: ModelPathUnit.ModelTypeEnum, week: ModelPathUnit.ModelWeekEnum) -> AnomalibTest:
+        """
+        Load the model for the key and use it for requests that do not name a model.
+
+        Args:
+        types : ModelPathUnit.ModelTypeEnum - The type of the model.
+        week : ModelPathUnit.ModelWeekEnum - The week of the model.
+
+        Returns:
+        AnomalibTest - The loaded model.
+        """
+        anomalib_test = self.Get(types=types, week=week)
+        self.default_key_ = (types, week)
+        return anomalib_test
+
+    def Default(self) -> Optional[AnomalibTest]:
+        """
+        Get the default model, reloading it if it was evicted.
+
+        Returns:
+        Optional[AnomalibTest] - The default model, None if no default was set up.
+        """
+        if self.default_key_ is None:
+            return None
+        return self.Get(types=self.default_key_[0], week=self.default_key_[1])
+
+    def Evict(self, *, keep: Hashable) -> None:
+        """
+        Drop least recently used models until the loaded models fit the memory budget.
+        The caller must hold lock_.
+
+        Args:
+        keep : Hashable - Key that must stay loaded (the model or ensemble just requested).
+        """
+        while sum(self.sizes_.values()) > self.memory_budget_bytes_ and len(self.models_) > 1:
+            key = next(iter(self.models_))
+            if key == keep:
+                self.models_.move_to_end(key)
+                continue
+            self.Drop(key=key)
+
+    def Drop(self, *, key: Hashable) -> None:
+        """
+        Unload a model, the caller must hold lock_.
+
+        Args:
+        key : Hashable - The ModelKey or EnsembleKey.
+        """
+        del self.models_[key]
+        del self.sizes_[key]
+        del self.sources_[key]
+        self.generation_ += 1
+        self.DropStatus(key=key)
+
+    def Loaded(self) -> list[Hashable]:
+        """
+        Get the keys of the loaded models and ensembles.
+
+        Returns:
+        list[Hashable] - Loaded ModelKey and EnsembleKey keys, least recently used first.
+        """
+        with self.lock_:
+            return list(self.models_.keys())
+
+    def SetStatus(self, *, key: Hashable, labels: tuple[str, str], model: Optional[AnomalibTest | AnomalibEnsemble]) -> None:
+        """
+        Record the readiness of a model, "loading" while it is set up and warmed, "ready" once it serves requests.
+
+        Args:
+        key : Hashable - The ModelKey or EnsembleKey.
+        labels : tuple[str, str] - The model and week reported.
+        model : Optional[AnomalibTest | AnomalibEnsemble] - The loaded model, None while loading.
+        """
+        status : dict[str, Any] = {"model": labels[0], "week": labels[1], "state": "loading", "warm": False, "warmup_ms": []}
+        if model is not None:
+            status.update(state="ready", warm=model.warm_, warmup_ms=[round(latency, 1) for latency in model.warmup_ms_])
+        with self.status_lock_:
+            self.status_[key] = status
+
+    def DropStatus(self, *, key: Hashable) -> None:
+        """
+        Forget the readiness of an evicted model, or one that failed to load.
+
+        Args:
+        key : Hashable - The ModelKey or EnsembleKey.
+        """
+        with self.status_lock_:
+            self.status_.pop(key, None)
+
+    def Readiness(self) -> tuple[bool, list[dict[str, Any]]]:
+        """
+        Report whether the registry can serve requests without a cold start, without waiting for a model being loaded.
+        The registry is ready once the default model (or any model, when no default is set) is loaded and warmed.
+
+        Returns:
+        tuple[bool, list[dict[str, Any]]] - Whether the registry is ready, and per model its week, state ("loading" or "ready"),
+            whether it is warm and the latency of each warm-up inference in ms.
+        """
+        with self.status_lock_:
+            statuses = {key: dict(status) for key, status in self.status_.items()}
+        default_key = self.default_key_
+        if default_key is None:
+            candidates = list(statuses.values())
+        else:
+            candidates = [statuses[default_key]] if default_key in statuses else []
+        ready = any(status["state"] == "ready" and (status["warm"] or self.warmup_ == 0) for status in candidates)
+        return ready, list(statuses.values())
+
 def main():
     """
     Run the testing sequence directly from this file.
@@ -237,10 +1446,8 @@ def main():
     model_path_unit = ModelPathUnit()
     anomalib_test = AnomalibTest()
     anomalib_test.Setup(model_path=model_path_unit.ModelPath(types=ModelPathUnit.ModelTypeEnum.cflow_, week=ModelPathUnit.ModelWeekEnum.week3_))
-    result: list[tuple[Image.Image, str]] = anomalib_test.Evaluate(image_path="testtest/test")
-
-    # show the image with the title be the string
-    for img, title in result:
+    # show the image with the title be the string, each one as soon as it is ready
+    for img, title in anomalib_test.Evaluate(image_path="testtest/test"):
         img.show(title=title)
         print(title)
 
@@ -1,6 +1,8 @@
-from os.path import exists
+from os.path import exists, dirname, join
 from os import makedirs
-from typing import Any, Optional
+from typing import Any, Optional, Callable
+from asyncio import run
+from time import perf_counter
 from classes.general_lib import TrainObject, TrainPathObject, ImageInfoObject
 from classes.dataset_lib import ImageUnit
 from classes.util_lib import Size
@@ -8,6 +10,7 @@ from classes.anomalib_lib import AnomalyModelUnit
 from classes.dataset_lib import DatasetUnit
 from classes.log_lib import LoggerTemplate, AsyncLoggerTemplate, LoggerWebhook
 from classes.discord_lib import MessageObject
+from classes.session_lib import ClosingSessions
 
 class AnomalibTrain:
     """
@@ -25,7 +28,7 @@ class AnomalibTrain:
     >>> anomalib_train = AnomalibTrain(param = param, model_type_flag = model_type_flag)
     """
 
-    def __init__(self, *, param : TrainObject, model_type_flag : AnomalyModelUnit.ModelTypeFlag = AnomalyModelUnit.ModelTypeFlag.padim_ | AnomalyModelUnit.ModelTypeFlag.patchcore_, logger_async : bool, logger_instance : Optional[LoggerTemplate], logger_instance_async : Optional[AsyncLoggerTemplate]) -> None:
+    def __init__(self, *, param : TrainObject, model_type_flag : AnomalyModelUnit.ModelTypeFlag = AnomalyModelUnit.ModelTypeFlag.padim_ | AnomalyModelUnit.ModelTypeFlag.patchcore_, logger_async : bool, logger_instance : Optional[LoggerTemplate], logger_instance_async : Optional[AsyncLoggerTemplate], export_types : AnomalyModelUnit.AnomalibExportTypeFlag = AnomalyModelUnit.AnomalibExportTypeFlag.torch_, quantize : bool = False, progress : Optional[Callable[[int, int, str], None]] = None) -> None:
         """
         Initialize the AnomalibTrain class.
 
@@ -34,6 +37,9 @@ class AnomalibTrain:
         Args:
         param : TrainObject - The TrainObject containing the parameters for training the model.
         model_type_flag : AnomalyModelUnit.ModelTypeFlag - The model type flag for the AnomalyModelUnit.
+        export_types : AnomalyModelUnit.AnomalibExportTypeFlag - The artifacts saved for each model, e.g. torch_ | openvino_ for CPU inference.
+        quantize : bool - Also save an INT8 OpenVINO model and report its AUROC and latency against FP32.
+        progress : Optional[Callable[[int, int, str], None]] - Called with (models done, models total, model name) after each model.
 
         Attributes:
         param : TrainObject - The TrainObject containing the parameters for training the model.
@@ -53,6 +59,9 @@ class AnomalibTrain:
         self.logger_instance_ : Optional[LoggerTemplate] = logger_instance
         self.logger_instance_async_ : Optional[AsyncLoggerTemplate] = logger_instance_async
         self.message_object_ : MessageObject = MessageObject()
+        self.export_types_ : AnomalyModelUnit.AnomalibExportTypeFlag = export_types
+        self.quantize_ : bool = quantize
+        self.progress_ : Optional[Callable[[int, int, str], None]] = progress
 
     def LoadData(self) -> None:
         """
@@ -137,14 +146,74 @@ class AnomalibTrain:
         result = anomaly_model.Evaluate(datamodule=self.dataset_unit_.folder_)
         
         # Save the model
-        anomaly_model.Save(f"{self.param_.path_.model_save_}/{self.param_.image_info_.name_}/{model_type.name}")
+        model_path = f"{self.param_.path_.model_save_}/{self.param_.image_info_.name_}/{model_type.name}"
+        anomaly_model.Save(model_path, export_types=self.export_types_)
+
+        # Optional INT8 model, reported next to the FP32 result so each model can be kept or dropped
+        if self.quantize_:
+            int8_path = anomaly_model.Quantize(model_path, datamodule=self.dataset_unit_.folder_)
+            fp32_path = join(model_path, "weights", "openvino", "model.xml")
+            if not exists(fp32_path):
+                anomaly_model.Save(model_path, export_types=AnomalyModelUnit.AnomalibExportTypeFlag.openvino_)
+            result[0].update(self.CompareQuantized(fp32_path=fp32_path, int8_path=int8_path, fp32_auroc=result[0].get("image_AUROC")))
 
         if not exists(self.param_.path_.model_save_):
             makedirs(self.param_.path_.model_save_)
-        anomaly_model.Save(self.param_.path_.model_save_)
+        anomaly_model.Save(self.param_.path_.model_save_, export_types=self.export_types_)
 
         return result
 
+    def CompareQuantized(self, *, fp32_path : str, int8_path : str, fp32_auroc : Optional[float]) -> dict[str, float]:
+        """
+        Score the test split with the FP32 and INT8 OpenVINO models and compare their AUROC and latency.
+        Both models run through the same inferencer on images decoded once beforehand, so the latency is the inference
+        alone, without reading and decoding the files, and the delta is the quantization speedup.
+
+        Args:
+        fp32_path : str - Path of the FP32 model.xml.
+        int8_path : str - Path of the INT8 model.xml from AnomalyModelUnit.Quantize.
+        fp32_auroc : Optional[float] - The image AUROC from Evaluate, the INT8 AUROC is reported relative to it.
+
+        Returns:
+        dict[str, float] - INT8 AUROC, AUROC delta, per image latency of both models in ms and the latency delta.
+
+        Example:
+        >>> anomalib_train.CompareQuantized(fp32_path="models/name/padim_/weights/openvino/model.xml", int8_path="models/name/padim_/weights/openvino_int8/model.xml", fp32_auroc=0.95)
+        """
+        import numpy as np
+        from PIL import Image
+        from torch import tensor
+        from torchmetrics.functional.classification import binary_auroc
+        from anomalib.deploy.inferencers import OpenVINOInferencer
+
+        assert self.dataset_unit_.folder_ is not None, "Dataset not loaded"
+        samples = self.dataset_unit_.folder_.test_data.samples
+        image_paths : list[str] = list(samples.image_path)
+        labels = tensor(list(samples.label_index))
+        assert len(image_paths) > 0, "Test split is empty"
+        # Decoded as predict does from a path, scaled to [0, 1] so predict does not rescale the arrays in place
+        images : list[np.ndarray] = [np.array(Image.open(image_path), dtype=np.float32) / 255.0 for image_path in image_paths]
+
+        compare : dict[str, float] = {}
+        for name, path in (("fp32", fp32_path), ("int8", int8_path)):
+            inferencer = OpenVINOInferencer(path=path, metadata=join(dirname(path), "metadata.json"), device="CPU")
+            inferencer.predict(image=images[0])  # warm up, the first call compiles the graph
+
+            scores : list[float] = []
+            start = perf_counter()
+            for image in images:
+                scores.append(float(inferencer.predict(image=image).pred_score))
+            compare[f"{name}_latency_ms"] = (perf_counter() - start) * 1000 / len(images)
+            compare[f"{name}_graph_AUROC"] = float(binary_auroc(tensor(scores), labels))
+
+        # Graph AUROC is measured on the same images for both, the delta is applied to the Evaluate AUROC
+        auroc_delta = compare["int8_graph_AUROC"] - compare["fp32_graph_AUROC"]
+        compare["int8_AUROC_delta"] = auroc_delta
+        if fp32_auroc is not None:
+            compare["int8_image_AUROC"] = float(fp32_auroc) + auroc_delta
+        compare["int8_latency_delta_ms"] = compare["int8_latency_ms"] - compare["fp32_latency_ms"]
+        return compare
+
     def Run(self) -> None:
         """
         Run the training sequence.
@@ -160,7 +229,8 @@ class AnomalibTrain:
 
         self.LoadData()
 
-        for model_type in self.model_type_flag_:
+        total = len(list(self.model_type_flag_))
+        for done, model_type in enumerate(self.model_type_flag_, start=1):
             try:
                 self.logger_instance_.Output(text=f"Training {self.param_.image_info_.name_} on {model_type.name} model")
                 result = self.TrainTestSequence(model_type=model_type)
@@ -169,6 +239,8 @@ class AnomalibTrain:
                     self.logger_instance_.Output(text=f"{key}: {value}")
             except Exception as e:
                 self.logger_instance_.Output(text=f"Error training for {self.param_.image_info_.name_} on {model_type.name} model: {e}")
+            if self.progress_ is not None:
+                self.progress_(done, total, model_type.name)
             continue
         self.logger_instance_.Close()
 
@@ -189,7 +261,8 @@ class AnomalibTrain:
 
         await self.LoadDataAsync()
 
-        for model_type in self.model_type_flag_:
+        total = len(list(self.model_type_flag_))
+        for done, model_type in enumerate(self.model_type_flag_, start=1):
             try:
                 # Output before training
                 self.message_object_.SetMessage(f"Training {self.param_.image_info_.name_} on {model_type.name} model")
@@ -211,6 +284,8 @@ class AnomalibTrain:
                 self.message_object_.SetMessage(f"Error training for {self.param_.image_info_.name_} on {model_type.name} model: {e}")
                 await self.logger_instance_async_.Output(message_object=self.message_object_)
                 self.message_object_.ClearMessage()
+            if self.progress_ is not None:
+                self.progress_(done, total, model_type.name)
             continue
         await self.logger_instance_async_.Close()
 
@@ -224,7 +299,7 @@ class AnomalibTest:
     def __init__(self) -> None:
         ...
 
-def RunModel(model_type_flag : AnomalyModelUnit.ModelTypeFlag, logger_instance : Optional[LoggerTemplate], name : str) -> None:
+def RunModel(model_type_flag : AnomalyModelUnit.ModelTypeFlag, logger_instance : Optional[LoggerTemplate], name : str, export_types : AnomalyModelUnit.AnomalibExportTypeFlag = AnomalyModelUnit.AnomalibExportTypeFlag.torch_, quantize : bool = False) -> None:
     """
     Allow the model to run as a package.
 
@@ -246,12 +321,12 @@ def RunModel(model_type_flag : AnomalyModelUnit.ModelTypeFlag, logger_instance :
         )
     )
     if logger_instance is None:
-        anomalib_train : AnomalibTrain = AnomalibTrain(param=train_object, model_type_flag=model_type_flag, logger_async=False, logger_instance=LoggerTemplate(), logger_instance_async=None)
+        anomalib_train : AnomalibTrain = AnomalibTrain(param=train_object, model_type_flag=model_type_flag, logger_async=False, logger_instance=LoggerTemplate(), logger_instance_async=None, export_types=export_types, quantize=quantize)
     else:
-        anomalib_train = AnomalibTrain(param=train_object, model_type_flag=model_type_flag, logger_async=False, logger_instance=logger_instance, logger_instance_async=None)
+        anomalib_train = AnomalibTrain(param=train_object, model_type_flag=model_type_flag, logger_async=False, logger_instance=logger_instance, logger_instance_async=None, export_types=export_types, quantize=quantize)
     anomalib_train.Run()
 
-async def RunModelAsync(model_type_flag : AnomalyModelUnit.ModelTypeFlag, logger_instance_async : Optional[AsyncLoggerTemplate], name : str) -> None:
+async def RunModelAsync(model_type_flag : AnomalyModelUnit.ModelTypeFlag, logger_instance_async : Optional[AsyncLoggerTemplate], name : str, export_types : AnomalyModelUnit.AnomalibExportTypeFlag = AnomalyModelUnit.AnomalibExportTypeFlag.torch_, quantize : bool = False, progress : Optional[Callable[[int, int, str], None]] = None) -> None:
     """
     Allow the model to run as a package asynchronously.
 
@@ -281,9 +356,24 @@ async def RunModelAsync(model_type_flag : AnomalyModelUnit.ModelTypeFlag, logger
             assert isinstance(logger_instance_async, LoggerWebhook), "logger_instance_async is not LoggerDiscord"
            
 
-    anomalib_train : AnomalibTrain = AnomalibTrain(param=train_object, model_type_flag=model_type_flag, logger_async=True, logger_instance=None, logger_instance_async=logger_instance_async)
+    anomalib_train : AnomalibTrain = AnomalibTrain(param=train_object, model_type_flag=model_type_flag, logger_async=True, logger_instance=None, logger_instance_async=logger_instance_async, export_types=export_types, quantize=quantize, progress=progress)
     await anomalib_train.RunAsync()
 
+def RunModelProcess(model_type_flag : AnomalyModelUnit.ModelTypeFlag, name : str, webhook_link : str, progress_queue : Any, export_types : AnomalyModelUnit.AnomalibExportTypeFlag = AnomalyModelUnit.AnomalibExportTypeFlag.torch_, quantize : bool = False) -> None:
+    """
+    Entry point of a training job subprocess (see classes/job_lib.py), logs to the webhook and reports progress on the queue.
+
+    Args:
+    model_type_flag : AnomalyModelUnit.ModelTypeFlag - The models to train.
+    name : str - The name of the run.
+    webhook_link : str - The webhook the training log is sent to.
+    progress_queue : Any - Receives (models done, models total, model name) with put, a ProgressWriter of classes/job_lib.py.
+    export_types : AnomalyModelUnit.AnomalibExportTypeFlag - The artifacts saved for each model.
+    quantize : bool - Also save and compare an INT8 model.
+    """
+    logger_instance : LoggerWebhook = LoggerWebhook(webhook_link=webhook_link, clone_cmd="~clone", close_cmd="~close")
+    run(ClosingSessions(RunModelAsync(model_type_flag=model_type_flag, logger_instance_async=logger_instance, name=name, export_types=export_types, quantize=quantize, progress=lambda done, total, model: progress_queue.put((done, total, model)))))
+
 def main():
     """
     Run the model directly on this file.
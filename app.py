@@ -5,9 +5,13 @@ Bot Method or characteristic will be written in channel.py
 """
 
 from os import getenv
+from asyncio import run as asyncio_run
 from dotenv import load_dotenv
 from discord import Client, Message, Intents
+from discord.utils import setup_logging
 from channel import MESSAGE_UNIT, RegisterChannelConfig, RegisterChannel, SendMessage
+from classes.session_lib import ClosingSessions
+from classes.dispatch_lib import COMMAND_DISPATCHER
 
 load_dotenv()
 TOKEN : str = str(getenv('TOKEN_BOT_GITHUB'))
@@ -38,9 +42,25 @@ async def on_message(message: Message) -> None:
     
     await SendMessage(message)
 
+async def Start() -> None:
+    """
+    Run the bot until it disconnects, the event loop is kept open until the pooled webhook session is closed.
+    Queued commands are cancelled first, they would otherwise run on a closed session.
+    """
+    try:
+        async with CLIENT:
+            await CLIENT.start(token=TOKEN)
+    finally:
+        await COMMAND_DISPATCHER.Shutdown()
+
 def run() -> None:
     SystemInit()
-    CLIENT.run(token=TOKEN)
+    # Same as CLIENT.run, which would close the loop before the session pool could close its session
+    setup_logging()
+    try:
+        asyncio_run(ClosingSessions(Start()))
+    except KeyboardInterrupt:
+        return
 
 if __name__ == "__main__":
     run()
\ No newline at end of file
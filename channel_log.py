@@ -1,7 +1,9 @@
 from discord import Message
 from enum import Enum, auto, unique
 from dotenv import load_dotenv
-from requests import Response, get
+from asyncio import TimeoutError as AsyncTimeoutError
+from aiohttp import ClientError
+from classes.client_lib import INFERENCE_CLIENT
 from classes.discord_lib import MessageObject
 from channel_template import ChannelMessageTemplate, CommandObject
 from classes.util_lib import Unused
@@ -93,10 +95,21 @@ async def ResTrain(message : Message, message_object : MessageObject) -> None:
     #         await message.thread.send(f"Train {a}")
     await SHARE_LOGGER.Open(message=message, name=f'{" ".join(message.content.split(" ")[1:])} Thread', duration=1440)
 
-    # send to flask to train the model
-    get(f"http://127.0.0.1:5000/train")
+    # send to flask to queue the training job
+    name = ' '.join(message.content.split(' ')[1:])
+    try:
+        response = await INFERENCE_CLIENT.Request("GET", "/train", params={"name": name})
+    except (ClientError, AsyncTimeoutError) as e:
+        message_object.SetMessage(f"Server unreachable: {e}")
+        return
 
-    message_object.SetMessage(f"Succesfully started training: {' '.join(message.content.split(' ')[1:])}")
+    async with response:
+        if response.status != 202:
+            message_object.SetMessage(f"Error {response.status}: {' '.join((await INFERENCE_CLIENT.ErrorDetail(response)).splitlines())}")
+            return
+
+        job = await response.json()
+    message_object.SetMessage(f"Succesfully queued training: {name} (job {job['job_id']}, {job['status']})")
 
 def Setup() -> None:
     """
@@ -125,5 +138,6 @@ def Setup() -> None:
         command_object=CommandObject(
             name="train", 
             description="Train Log Output (INTERNAL)", 
-            function=ResTrain))
+            function=ResTrain,
+            heavy=True))
     CHANNEL_MESSAGE_LOG.SetupCommand()
\ No newline at end of file
@@ -1,13 +1,16 @@
-from aiohttp import ClientSession, FormData
+from typing import AsyncIterator, Optional, Final
+from aiohttp import ClientError, ClientResponse
 from io import BytesIO
-from discord import Message, File
-from PIL.Image import open
+from discord import Message, Attachment
+from asyncio import gather, TimeoutError as AsyncTimeoutError
 from enum import Enum, auto, unique
 from classes.discord_lib import MessageObject
 from channel_template import ChannelMessageTemplate, CommandObject
 from classes.util_lib import Unused
 from classes.channel_enum import ChannelEnum
-from classes.message_lib import WebhookSend
+from classes.client_lib import INFERENCE_CLIENT
+from classes.outbox_lib import WebhookOutbox
+from classes.response_lib import PredictFormatEnum, ReadFrames
 import base64
 
 
@@ -29,6 +32,32 @@ class CommandEnum(Enum):
     setup_ = auto()
 
 CHANNEL_MESSAGE_PREDICT : ChannelMessageTemplate = ChannelMessageTemplate()
+# Leading bytes of the image formats the server decodes (OpenCV imdecode), with their content type
+IMAGE_SIGNATURES : Final[tuple[tuple[bytes, str], ...]] = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+)
+
+def ImageContentType(data : bytes) -> Optional[str]:
+    """
+    Identify an uploaded image from its leading bytes, without decoding it.
+
+    Args:
+    data : bytes - The file content.
+
+    Returns:
+    Optional[str] - The content type, None when it is not an image format the server decodes.
+    """
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    return None
+
 async def ResPredict(message: Message, message_object: MessageObject) -> None:
     """
     This is used for the debug of the system
@@ -44,169 +73,156 @@ async def ResPredict(message: Message, message_object: MessageObject) -> None:
     if not message.attachments:
         message_object.SetMessage("No attachment found")
 
-    form_data = FormData()
-    for attachment in message.attachments:
-        # Check if the attachment is an image
-        if not attachment.content_type.startswith("image/"): # type: ignore
-            continue
+    # Check the attachments are images from their content type header, then download them all at once
+    attachments : list[Attachment] = [attachment for attachment in message.attachments if (attachment.content_type or "").startswith("image/")]
+    contents : list[bytes] = list(await gather(*(attachment.read() for attachment in attachments)))
 
-        file: File = await attachment.to_file()
-        image = open(file.fp)  # type: ignore
-        if not image:
-            message_object.SetMessage("Failed to open the image.")
+    # The raw bytes are forwarded as they are, the server decodes them, only their magic bytes are checked here
+    uploads : list[tuple[bytes, str, str]] = []
+    for attachment, data in zip(attachments, contents):
+        content_type = ImageContentType(data)
+        if content_type is None:
+            message_object.SetMessage(f"Unsupported image format: {attachment.filename}")
             return
-
-        # Convert the image to bytes
-        image_buffer = BytesIO()
-        image.save(image_buffer, format=image.format)
-        image_buffer.seek(0)
-
-        # Add the image to the form data
-        form_data.add_field(
-            "images",
-            image_buffer,
-            filename=file.filename,
-            content_type=attachment.content_type
-        )
+        uploads.append((data, attachment.filename, content_type))
     
-    # Validate if FormData is empty
-    if not form_data._fields:  # _fields contains all the fields added to FormDatapart():
+    # Validate if there is any image
+    if not uploads:
         message_object.SetMessage("No valid images found in the attachments.")
         return
+    image_count = len(uploads)
 
-    # Send all images to the server in one request
-    url = "http://127.0.0.1:5000/predict"
-    async with ClientSession() as session:
-        async with session.post(url, data=form_data) as response:
-            if response.status != 200:
-                # Check if the response is JSON
-                if response.content_type == "application/json":
-                    try:
-                        error_result = await response.json()
-                        error_messages = error_result.get("messages", [])
-                        error_detail = "\n".join(error_messages)
-                    except Exception:
-                        error_detail = "Invalid JSON response from server."
-                else:
-                    error_detail = await response.text()  # Fallback to plain text
-
-                message_object.SetMessage(f"Error {response.status}: {error_detail}")
-                return
-
-            # Check if the response is JSON
-            if response.content_type == "application/json":
-                try:
-                    result = await response.json()
-                except Exception:
-                    message_object.SetMessage("Invalid JSON response from server.")
-                    return
-            else:
-                result = {"messages": [], "images": []}  # Default empty result if not JSON
-
-            response_messages = result.get("messages", [])
-            images_base64 = result.get("images", [])
-
-            if images_base64 is None or response_messages is None:
-                message_object.SetMessage("No images or messages found in the response.")
-                return
-
-            if len(response_messages) == 1 and len(images_base64) == 1:
-                # Single response case
-                response_message = response_messages[0]
-                processed_image_buffer = BytesIO(base64.b64decode(images_base64[0]))
-                processed_image_buffer.seek(0)
-
-                # Extract the score from the response_message
-                try:
-                    pred_score = float(response_message.split(":")[1].strip())
-                except (IndexError, ValueError):
-                    pred_score = None
-
-                # Determine the anomaly level and set the title and color
-                if pred_score is not None:
-                    if pred_score > 0.7:
-                        title = "Anomaly Detected"
-                        colour = MessageObject.EmbedColourEnum.red_.value
-                    elif pred_score > 0.5:
-                        title = "Potential Anomaly"
-                        colour = MessageObject.EmbedColourEnum.yellow_.value
-                    elif pred_score > 0.3:
-                        title = "Potential Normal"
-                        colour = MessageObject.EmbedColourEnum.blue_.value
-                    else:
-                        title = "Normal"
-                        colour = MessageObject.EmbedColourEnum.green_.value
-                else:
-                    title = "Prediction"
-                    colour = MessageObject.EmbedColourEnum.random_.value
-
-                # Set the file in the message object
-                message_object.SetFile(
-                    fp=processed_image_buffer,
-                    filename="processed_image.png",
-                    description="Processed image"
-                )
-
-                # Create an embed with the response
-                message_object.CreateEmbed(
-                    title=title,
-                    description=response_message,
-                    colour=colour
-                )
-
-                # Attach the image to the embed
-                message_object.EmbedSetImage(url="attachment://processed_image.png")
+    # Send all images to the server in one request, the raw bytes are sent again as they are on a retry
+    try:
+        response = await INFERENCE_CLIENT.Request("POST", "/predict", files=[("images", data, filename, content_type) for data, filename, content_type in uploads], headers={"Accept": PredictFormatEnum.msgpack_.value})
+    except (ClientError, AsyncTimeoutError) as e:
+        message_object.SetMessage(f"Server unreachable: {e}")
+        return
+
+    async with response:
+        if response.status != 200:
+            message_object.SetMessage(f"Error {response.status}: {await INFERENCE_CLIENT.ErrorDetail(response)}")
+            return
+
+        # Results arrive one by one, a single image is the reply itself, several are posted as they come in
+        try:
+            if image_count == 1:
+                async for response_message, image_bytes, pred_score in PredictResults(response):
+                    SetPredictResult(message_object, response_message, image_bytes, pred_score)
             else:
-                # Multiple responses case
                 webhook_url = CHANNEL_MESSAGE_PREDICT.channel_object_dict_[ChannelEnum.predict_].webhook_url_
-                for response_message, image_base64 in zip(response_messages, images_base64):
-                    processed_image_buffer = BytesIO(base64.b64decode(image_base64))
-                    processed_image_buffer.seek(0)
-
-                    # Extract the score from the response_message
-                    try:
-                        pred_score = float(response_message.split(":")[1].strip())
-                    except (IndexError, ValueError):
-                        pred_score = None
-
-                    # Determine the anomaly level and set the title and color
-                    if pred_score is not None:
-                        if pred_score > 0.7:
-                            title = "Anomaly Detected"
-                            colour = MessageObject.EmbedColourEnum.red_.value
-                        elif pred_score > 0.5:
-                            title = "Potential Anomaly"
-                            colour = MessageObject.EmbedColourEnum.yellow_.value
-                        elif pred_score > 0.3:
-                            title = "Potential Normal"
-                            colour = MessageObject.EmbedColourEnum.blue_.value
-                        else:
-                            title = "Normal"
-                            colour = MessageObject.EmbedColourEnum.green_.value
-                    else:
-                        title = "Prediction"
-                        colour = MessageObject.EmbedColourEnum.random_.value
-
-                    # Create a new message object for each response
-                    new_message_object = MessageObject()
-                    new_message_object.SetFile(
-                        fp=processed_image_buffer,
-                        filename="processed_image.png",
-                        description="Processed image"
-                    )
-                    new_message_object.CreateEmbed(
-                        title=title,
-                        description=response_message,
-                        colour=colour
-                    )
-                    new_message_object.EmbedSetImage(url="attachment://processed_image.png")
-
-                    # Send the message object via webhook
-                    await WebhookSend(webhook_url=webhook_url, message_object=new_message_object)
+                # Results are packed up to 10 per webhook call, sent while the next ones are still being read
+                async with WebhookOutbox(webhook_url=webhook_url) as outbox:
+                    async for response_message, image_bytes, pred_score in PredictResults(response):
+                        # Create a new message object for each response
+                        new_message_object = MessageObject()
+                        SetPredictResult(new_message_object, response_message, image_bytes, pred_score)
+                        outbox.Put(message_object=new_message_object)
 
                 # Leave the original message object blank
                 if not message_object.EmptyMessage():
                     message_object.ClearMessage()
+        except ValueError as e:
+            message_object.SetMessage(str(e))
+
+async def PredictResults(response : ClientResponse) -> AsyncIterator[tuple[str, bytes, Optional[float]]]:
+    """
+    Read the results of /predict, each result is yielded as soon as its frame has arrived.
+    Binary frames carry the raw PNG and the score, JSON carries base64 images (older servers) and is read whole.
+
+    Args:
+    response : ClientResponse - The successful /predict response.
+
+    Yields:
+    tuple[str, bytes, Optional[float]] - The result string, the PNG bytes and the score (None when not sent).
+
+    Raises:
+    ValueError - The response is invalid or the server failed part way through.
+    """
+    if response.content_type == PredictFormatEnum.msgpack_.value:
+        try:
+            async for frame in ReadFrames(response.content):
+                if "error" in frame:
+                    raise ValueError(frame["error"])
+                yield frame["message"], frame["image"], frame["score"]
+        except ValueError:
+            raise
+        except Exception:
+            raise ValueError("Invalid msgpack response from server.")
+        return
+
+    # Check if the response is JSON
+    if response.content_type == "application/json":
+        try:
+            result = await response.json()
+        except Exception:
+            raise ValueError("Invalid JSON response from server.")
+    else:
+        result = {"messages": [], "images": []}  # Default empty result if not JSON
+
+    response_messages = result.get("messages", [])
+    images_base64 = result.get("images", [])
+
+    if images_base64 is None or response_messages is None:
+        raise ValueError("No images or messages found in the response.")
+
+    for response_message, image_base64 in zip(response_messages, images_base64):
+        yield response_message, base64.b64decode(image_base64), None
+
+def SetPredictResult(message_object : MessageObject, response_message : str, image_bytes : bytes, pred_score : Optional[float]) -> None:
+    """
+    Fill a message object with the processed image and an embed coloured by the anomaly level.
+
+    Args:
+    message_object : MessageObject - The message object to fill.
+    response_message : str - The result string of the image.
+    image_bytes : bytes - The processed PNG.
+    pred_score : Optional[float] - The prediction score, parsed from response_message when None.
+    """
+    processed_image_buffer = BytesIO(image_bytes)
+    processed_image_buffer.seek(0)
+
+    # Extract the score from the response_message when the server did not send it
+    if pred_score is None:
+        try:
+            pred_score = float(response_message.split(":")[1].strip())
+        except (IndexError, ValueError):
+            pred_score = None
+
+    # Determine the anomaly level and set the title and color
+    if pred_score is not None:
+        if pred_score > 0.7:
+            title = "Anomaly Detected"
+            colour = MessageObject.EmbedColourEnum.red_.value
+        elif pred_score > 0.5:
+            title = "Potential Anomaly"
+            colour = MessageObject.EmbedColourEnum.yellow_.value
+        elif pred_score > 0.3:
+            title = "Potential Normal"
+            colour = MessageObject.EmbedColourEnum.blue_.value
+        else:
+            title = "Normal"
+            colour = MessageObject.EmbedColourEnum.green_.value
+    else:
+        title = "Prediction"
+        colour = MessageObject.EmbedColourEnum.random_.value
+
+    # Set the file in the message object
+    message_object.SetFile(
+        fp=processed_image_buffer,
+        filename="processed_image.png",
+        description="Processed image"
+    )
+
+    # Create an embed with the response
+    message_object.CreateEmbed(
+        title=title,
+        description=response_message,
+        colour=colour
+    )
+
+    # Attach the image to the embed
+    message_object.EmbedSetImage(url="attachment://processed_image.png")
 
 async def ResSetup(message: Message, message_object: MessageObject) -> None:
     """
@@ -234,27 +250,26 @@ async def ResSetup(message: Message, message_object: MessageObject) -> None:
             message_object.SetMessage("Invalid format. Ensure one part is a model (string) and the other is a week (integer).")
             return
 
-    # Prepare the form data for the server
-    form_data = FormData()
-    form_data.add_field("week", str(week))
-    form_data.add_field("name", model)
-
     # Send the setup request to the server
-    url = "http://127.0.0.1:5000/predict_setup"
-    async with ClientSession() as session:
-        async with session.post(url, data=form_data) as response:
-            if response.status != 200:
-                error_detail = await response.text()  # Await the coroutine
-                message_object.SetMessage(f"Error: {response.status} - {error_detail}")
-                return
-
-            # Check if the response is JSON
-            if response.content_type == "application/json":
-                result = await response.json()
-            else:
-                result = await response.text()
+    try:
+        response = await INFERENCE_CLIENT.Request("POST", "/predict_setup", fields={"week": str(week), "name": model})
+    except (ClientError, AsyncTimeoutError) as e:
+        message_object.SetMessage(f"Server unreachable: {e}")
+        return
+
+    async with response:
+        if response.status != 200:
+            error_detail = await response.text()  # Await the coroutine
+            message_object.SetMessage(f"Error: {response.status} - {error_detail}")
+            return
+
+        # Check if the response is JSON
+        if response.content_type == "application/json":
+            result = await response.json()
+        else:
+            result = await response.text()
 
-            message_object.SetMessage(f"Setup successful: {result}")
+        message_object.SetMessage(f"Setup successful: {result}")
 
 async def ResHelp(message : Message, message_object : MessageObject) -> None:
     """
@@ -292,11 +307,13 @@ def Setup() -> None:
         command_object=CommandObject(
             name="predict", 
             description="Predict Command", 
-            function=ResPredict))
+            function=ResPredict,
+            heavy=True))
     CHANNEL_MESSAGE_PREDICT.RegisterCommand(
         command_enum=CommandEnum.setup_, 
         command_object=CommandObject(
             name="setup", 
             description="Setup Command", 
-            function=ResSetup))
+            function=ResSetup,
+            heavy=True))
     CHANNEL_MESSAGE_PREDICT.SetupCommand()
\ No newline at end of file
@@ -4,6 +4,7 @@ from enum import Enum, auto, unique
 from classes.discord_lib import MessageObject
 from classes.message_lib import ChannelObject
 from classes.channel_enum import ChannelEnum
+from classes.dispatch_lib import COMMAND_DISPATCHER
 
 """
 ChannelMessageTemplate Usage Guide
@@ -17,6 +18,7 @@ incoming messages to execute the appropriate command logic.
 1. **Command Registration**:
    - Use the `RegisterCommand` method to register a command with a unique `Enum` identifier and a `CommandObject`.
    - The `CommandObject` contains the command's name, description, and the function to execute.
+   - Commands that wait on the server or other slow work (e.g. `predict`) are registered with `heavy=True`.
 
 2. **Command Setup**:
    - Call the `SetupCommand` method after registering all commands. This maps command names to their respective `Enum` identifiers.
@@ -28,6 +30,9 @@ incoming messages to execute the appropriate command logic.
 4. **Message Handling**:
    - The `ResMessage` method processes incoming messages. It extracts the command name from the message content, 
      looks up the corresponding function, and executes it.
+   - Heavy commands are handed to `COMMAND_DISPATCHER` (classes/dispatch_lib.py), which runs them as tasks limited per channel
+     and per user (COMMAND_MAX_PER_CHANNEL, COMMAND_MAX_PER_USER). The message is answered with its queue position when it has to wait
+     and the result is sent as a reply when it is done, so quick commands are answered while heavy ones run.
 
 5. **Function Execution**:
    - The `RunFunc` method is used internally to execute the function associated with a command. It passes the 
@@ -96,11 +101,12 @@ class CommandObject():
     name_ : str - The name of the command.
     description_ : str - The description of the command.
     function_ : Callable - The function of the command.
+    heavy_ : bool - Whether the command runs as a queued task instead of being answered at once.
 
     Example:
     >>> command_object = CommandObject(name="help", description="Help Command", function=ResHelp)
     """
-    def __init__(self, name : str, description : str, function : Callable) -> None:
+    def __init__(self, name : str, description : str, function : Callable, heavy : bool = False) -> None:
         """
         Initialize the CommandObject class.
 
@@ -108,11 +114,13 @@ class CommandObject():
         name : str - The name of the command.
         description : str - The description of the command.
         function : Callable - The function of the command.
+        heavy : bool - Whether the command runs as a queued task instead of being answered at once. Default is False.
 
         Attributes:
         name_ : str - The name of the command.
         description_ : str - The description of the command.
         function_ : Callable - The function of the command.
+        heavy_ : bool - Whether the command runs as a queued task.
 
         Example:
         >>> command_object = CommandObject(name="help", description="Help Command", function=ResHelp)
@@ -120,6 +128,7 @@ class CommandObject():
         self.name_ : str = name
         self.description_ : str = description
         self.function_ : Callable = function
+        self.heavy_ : bool = heavy
 
 class ChannelMessageTemplate():
     """
@@ -225,10 +234,15 @@ class ChannelMessageTemplate():
     async def ResMessage(self, message : Message, message_object : MessageObject) -> None:
         """
         Template for responding Messages
+        Heavy commands are queued on COMMAND_DISPATCHER, message_object then only holds their queue position.
         """
         content : str = message.content[1:].split(" ")[0]
         if content in self.command_name_dict_:
-            await self.RunFunc(func=self.command_object_dict_[self.command_name_dict_[content]].function_, message=message, message_object=message_object)
+            command_object : CommandObject = self.command_object_dict_[self.command_name_dict_[content]]
+            if command_object.heavy_:
+                COMMAND_DISPATCHER.Dispatch(function=command_object.function_, message=message, message_object=message_object)
+            else:
+                await self.RunFunc(func=command_object.function_, message=message, message_object=message_object)
         else:
             message_object.SetMessage("Command not found")
 
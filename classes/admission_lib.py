@@ -0,0 +1,110 @@
+from typing import Optional
+from threading import Lock
+
+class AdmissionController:
+    """
+    The AdmissionController class bounds the work a /predict request may bring and the inferences running at once,
+    so one large upload cannot pin every core and inflate the latency of everyone else.
+    Request limits are checked before the upload is parsed, the in-flight limit before any image is decoded.
+    A request over a limit is refused at once with a Retry-After hint instead of waiting in the queue.
+
+    Attributes:
+    max_images_ : int - Most images in one request.
+    max_bytes_ : int - Most bytes in one request body.
+    max_in_flight_ : int - Most images admitted to the model and not finished yet, over all requests.
+    retry_after_s_ : int - Seconds a refused client is asked to wait.
+    in_flight_ : int - Images admitted and not finished yet.
+    rejected_ : int - Requests refused for lack of capacity.
+    lock_ : Lock - Guards in_flight_ and rejected_.
+
+    Example:
+    >>> admission = AdmissionController(max_images=16, max_bytes=32 * 1024 * 1024, max_in_flight=64)
+    >>> if admission.Admit(count=3):
+    >>>     future.add_done_callback(lambda _: admission.Release(count=1))
+    """
+
+    def __init__(self, *, max_images: int = 16, max_bytes: int = 32 * 1024 * 1024, max_in_flight: int = 64, retry_after_s: int = 1) -> None:
+        """
+        Initialize the AdmissionController class.
+
+        Args:
+        max_images : int - Most images in one request. Default is 16.
+        max_bytes : int - Most bytes in one request body. Default is 32 MiB.
+        max_in_flight : int - Most images in flight, at least max_images so a full request can always be admitted. Default is 64.
+        retry_after_s : int - Seconds a refused client is asked to wait. Default is 1.
+        """
+        assert max_images > 0, "max_images must be positive"
+        assert max_bytes > 0, "max_bytes must be positive"
+        assert max_in_flight >= max_images, "max_in_flight must be at least max_images"
+        assert retry_after_s > 0, "retry_after_s must be positive"
+        self.max_images_ : int = max_images
+        self.max_bytes_ : int = max_bytes
+        self.max_in_flight_ : int = max_in_flight
+        self.retry_after_s_ : int = retry_after_s
+        self.in_flight_ : int = 0
+        self.rejected_ : int = 0
+        self.lock_ : Lock = Lock()
+
+    def CheckRequest(self, *, content_length: Optional[int], images: int) -> Optional[str]:
+        """
+        Check the size of a request against the per-request limits.
+
+        Args:
+        content_length : Optional[int] - Size of the request body, None when unknown (chunked upload), those are capped
+            while the body is read by Flask's MAX_CONTENT_LENGTH, set to max_bytes_ by the server.
+        images : int - Number of images in the request.
+
+        Returns:
+        Optional[str] - Why the request is refused, None when it is within the limits.
+        """
+        if content_length is not None and content_length > self.max_bytes_:
+            return f"Request is {content_length} bytes, the limit is {self.max_bytes_} bytes."
+        if images > self.max_images_:
+            return f"Request has {images} images, the limit is {self.max_images_} images."
+        return None
+
+    def Admit(self, *, count: int) -> bool:
+        """
+        Reserve in-flight capacity for images about to be queued, never blocks.
+        Every admitted image must be given back with Release once its inference has finished or failed.
+
+        Args:
+        count : int - Number of images to queue.
+
+        Returns:
+        bool - True when admitted, False when the capacity is used up.
+        """
+        with self.lock_:
+            if self.in_flight_ + count > self.max_in_flight_:
+                self.rejected_ += 1
+                return False
+            self.in_flight_ += count
+            return True
+
+    def Release(self, *, count: int) -> None:
+        """
+        Give back in-flight capacity.
+
+        Args:
+        count : int - Number of images finished.
+        """
+        with self.lock_:
+            self.in_flight_ -= count
+            assert self.in_flight_ >= 0, "Released more images than admitted"
+
+    def Stats(self) -> dict[str, int]:
+        """
+        Get the limits and the current load.
+
+        Returns:
+        dict[str, int] - in_flight, max_in_flight, max_images, max_bytes, rejected and retry_after.
+        """
+        with self.lock_:
+            return {
+                "in_flight": self.in_flight_,
+                "max_in_flight": self.max_in_flight_,
+                "max_images": self.max_images_,
+                "max_bytes": self.max_bytes_,
+                "rejected": self.rejected_,
+                "retry_after": self.retry_after_s_
+            }
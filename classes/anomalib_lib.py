@@ -1,24 +1,22 @@
+from __future__ import annotations
 from enum import Enum, unique, Flag, auto
 
-from typing import Optional, Final, Any
-from pandas import DataFrame
+from typing import Optional, Final, Any, TYPE_CHECKING
 
-from anomalib.models.components import AnomalyModule
-from anomalib.models import AiVad, Cfa, Cflow, Csflow, Draem, Dfkde, Dfm, Dsr, EfficientAd, Fastflow, Fre, Ganomaly, Padim, Patchcore, ReverseDistillation, Rkde, Stfpm, Uflow, VlmAd, WinClip, get_available_models
-from anomalib.engine import Engine
+# anomalib only defines its enums at the top level, the models, engine and exporters are imported on first use
 from anomalib import TaskType, LearningType
-from anomalib.loggers import AnomalibCometLogger, AnomalibMLFlowLogger, AnomalibTensorBoardLogger, AnomalibWandbLogger
-from anomalib.models.components.classification import FeatureScalingMethod
-from anomalib.models.image.reverse_distillation.anomaly_map import AnomalyMapGenerationMode
-from anomalib.utils.normalization import NormalizationMethod
-from anomalib.data.image.folder import Folder
-from anomalib.deploy import ExportType
-from anomalib.models.image.efficient_ad.torch_model import EfficientAdModelSize
-from anomalib.models.image.rkde.region_extractor import RoiStage
 
-from lightning.pytorch.callbacks.early_stopping import EarlyStopping
+from os import makedirs
+from os.path import exists, join
+from shutil import move, rmtree
 
 from classes.util_lib import Deprecated, TimeIt
+from classes.lazy_lib import LazyImport, Resolved
+
+if TYPE_CHECKING:
+    from anomalib.models.components import AnomalyModule
+    from anomalib.engine import Engine
+    from anomalib.data.image.folder import Folder
 
 class AnomalyModelUnit: 
     """
@@ -30,10 +28,12 @@ class AnomalyModelUnit:
         AnomalibLoggerTypeEnum : Enum for different types of logger for anomaly detection models.
         AnomalibTaskTypeEnum : Enum for different types of task for anomaly detection models.
         AnomalibLearningTypeEnum : Enum for different types of learning for anomaly detection models
+        AnomalibExportTypeFlag : Flag for the artifacts written by Save.
     
     Dictionary:
+        MODEL_CLASS_REGISTRY : Dict[ModelTypeFlag, LazyImport] : Model class of each model type, imported on first use.
         VALID_MODELS_DICT : Dict[ModelTypeFlag, bool] : Dictionary for valid models.
-        MODELS_PARAMS_DICT : Dict[ModelTypeFlag, Dict[str, Any]] : Dictionary for model parameters.
+        MODELS_PARAMS_DICT : Dict[ModelTypeFlag, Dict[str, Any]] : Dictionary for model parameters, LazyImport values are resolved by ModelParams.
 
     Attributes:
         model_ : Optional[AnomalyModule] : Internal Anomalib model.
@@ -48,7 +48,10 @@ class AnomalyModelUnit:
         Evaluate : Evaluate the model.
         Predict : Predict anomalies in the dataset.
         Save : Save the model.
+        Quantize : Save an INT8 OpenVINO model calibrated on the training data.
         ModelValid : Check if the model is valid.
+        ModelClass : Get the model class of a model type, importing it on first use.
+        ModelParams : Get the constructor parameters of a model type.
 
     Example:
     >>> model = AnomalyModelUnit()
@@ -106,27 +109,27 @@ class AnomalyModelUnit:
         vlm_ad_ = auto()
         win_clip_ = auto()
 
-    ModelTypeFlagName : Final[dict[ModelTypeFlag, Any]] = {
-        ModelTypeFlag.ai_vad_ : AiVad,
-        ModelTypeFlag.cfa_ : Cfa,
-        ModelTypeFlag.cflow_ : Cflow,
-        ModelTypeFlag.csflow_ : Csflow,
-        ModelTypeFlag.draem_ : Draem,
-        ModelTypeFlag.dfkde_ : Dfkde,
-        ModelTypeFlag.dfm_ : Dfm,
-        ModelTypeFlag.dsr_ : Dsr,
-        ModelTypeFlag.efficient_ad_ : EfficientAd,
-        ModelTypeFlag.fastflow_ : Fastflow,
-        ModelTypeFlag.fre_ : Fre,
-        ModelTypeFlag.ganomaly_ : Ganomaly,
-        ModelTypeFlag.padim_ : Padim,
-        ModelTypeFlag.patchcore_ : Patchcore,
-        ModelTypeFlag.reverse_distillation_ : ReverseDistillation,
-        ModelTypeFlag.rkde_ : Rkde,
-        ModelTypeFlag.stfpm_ : Stfpm,
-        ModelTypeFlag.uflow_ : Uflow,
-        ModelTypeFlag.vlm_ad_ : VlmAd,
-        ModelTypeFlag.win_clip_ : WinClip
+    MODEL_CLASS_REGISTRY : Final[dict[ModelTypeFlag, LazyImport]] = {
+        ModelTypeFlag.ai_vad_ : LazyImport("anomalib.models:AiVad"),
+        ModelTypeFlag.cfa_ : LazyImport("anomalib.models:Cfa"),
+        ModelTypeFlag.cflow_ : LazyImport("anomalib.models:Cflow"),
+        ModelTypeFlag.csflow_ : LazyImport("anomalib.models:Csflow"),
+        ModelTypeFlag.draem_ : LazyImport("anomalib.models:Draem"),
+        ModelTypeFlag.dfkde_ : LazyImport("anomalib.models:Dfkde"),
+        ModelTypeFlag.dfm_ : LazyImport("anomalib.models:Dfm"),
+        ModelTypeFlag.dsr_ : LazyImport("anomalib.models:Dsr"),
+        ModelTypeFlag.efficient_ad_ : LazyImport("anomalib.models:EfficientAd"),
+        ModelTypeFlag.fastflow_ : LazyImport("anomalib.models:Fastflow"),
+        ModelTypeFlag.fre_ : LazyImport("anomalib.models:Fre"),
+        ModelTypeFlag.ganomaly_ : LazyImport("anomalib.models:Ganomaly"),
+        ModelTypeFlag.padim_ : LazyImport("anomalib.models:Padim"),
+        ModelTypeFlag.patchcore_ : LazyImport("anomalib.models:Patchcore"),
+        ModelTypeFlag.reverse_distillation_ : LazyImport("anomalib.models:ReverseDistillation"),
+        ModelTypeFlag.rkde_ : LazyImport("anomalib.models:Rkde"),
+        ModelTypeFlag.stfpm_ : LazyImport("anomalib.models:Stfpm"),
+        ModelTypeFlag.uflow_ : LazyImport("anomalib.models:Uflow"),
+        ModelTypeFlag.vlm_ad_ : LazyImport("anomalib.models:VlmAd"),
+        ModelTypeFlag.win_clip_ : LazyImport("anomalib.models:WinClip")
     }
 
     VALID_MODELS_DICT: Final[dict[ModelTypeFlag, bool]] = {
@@ -228,7 +231,7 @@ class AnomalyModelUnit:
             "layers" : ('layer4',),
             "pre_trained" : True,
             "n_pca_components" : 16,
-            "feature_scaling_method" : FeatureScalingMethod.SCALE,
+            "feature_scaling_method" : LazyImport("anomalib.models.components.classification:FeatureScalingMethod.SCALE"),
             "max_training_points" : 40000
         },
         ModelTypeFlag.dfm_ : {
@@ -250,7 +253,7 @@ class AnomalyModelUnit:
         ModelTypeFlag.efficient_ad_ : {#imagenet_dir='./datasets/imagenette', teacher_out_channels=384, model_size=EfficientAdModelSize.S, lr=0.0001, weight_decay=1e-05, padding=False, pad_maps=True
             "imagenet_dir" : './datasets/imagenette',
             "teacher_out_channels" : 384,
-            "model_size" : EfficientAdModelSize.S,
+            "model_size" : LazyImport("anomalib.models.image.efficient_ad.torch_model:EfficientAdModelSize.S"),
             "lr" : 0.0001,
             "weight_decay" : 1e-05,
             "padding" : False,
@@ -301,17 +304,17 @@ class AnomalyModelUnit:
         ModelTypeFlag.reverse_distillation_ : {
             "backbone" : "wide_resnet50_2",
             "layers" : ["layer1", "layer2", "layer3"],
-            "anomaly_map_mode" : AnomalyMapGenerationMode.ADD,
+            "anomaly_map_mode" : LazyImport("anomalib.models.image.reverse_distillation.anomaly_map:AnomalyMapGenerationMode.ADD"),
             "pre_trained" : True
         },
         ModelTypeFlag.rkde_ : {
-            "roi_stage" : RoiStage.RCNN,
+            "roi_stage" : LazyImport("anomalib.models.image.rkde.region_extractor:RoiStage.RCNN"),
             "roi_score_threshold" : 0.001,
             "min_box_size" : 25,
             "iou_threshold" : 0.3,
             "max_detections_per_image" : 100,
             "n_pca_components" : 16,
-            "feature_scaling_method" : FeatureScalingMethod.SCALE,
+            "feature_scaling_method" : LazyImport("anomalib.models.components.classification:FeatureScalingMethod.SCALE"),
             "max_training_points" : 40000
         },
         ModelTypeFlag.stfpm_ : {
@@ -347,10 +350,10 @@ class AnomalyModelUnit:
         TENSORBOARD : TensorBoard Logger
         WANDB : Wandb Logger
         """
-        comet_ = AnomalibCometLogger
-        mlflow_ = AnomalibMLFlowLogger
-        tensorboard_ = AnomalibTensorBoardLogger
-        wandb_ = AnomalibWandbLogger
+        comet_ = LazyImport("anomalib.loggers:AnomalibCometLogger")
+        mlflow_ = LazyImport("anomalib.loggers:AnomalibMLFlowLogger")
+        tensorboard_ = LazyImport("anomalib.loggers:AnomalibTensorBoardLogger")
+        wandb_ = LazyImport("anomalib.loggers:AnomalibWandbLogger")
         none_ = None
 
     @unique
@@ -385,6 +388,27 @@ class AnomalyModelUnit:
         zero_shot_ = LearningType.ZERO_SHOT
         few_shot_ = LearningType.FEW_SHOT
 
+    @unique
+    class AnomalibExportTypeFlag(Flag):
+        """
+        Flag for the artifacts written by Save, combine with | to export several.
+        Each artifact is written to <path>/weights/<format>/ with its own metadata.json.
+
+        Export from Anomalib
+        torch_ : weights/torch/model.pt, loaded with TorchInferencer
+        onnx_ : weights/onnx/model.onnx, loaded with OpenVINOInferencer on CPU
+        openvino_ : weights/openvino/model.xml, loaded with OpenVINOInferencer on CPU
+        """
+        torch_ = auto()
+        onnx_ = auto()
+        openvino_ = auto()
+
+    ExportTypeFlagName : Final[dict[AnomalibExportTypeFlag, LazyImport]] = {
+        AnomalibExportTypeFlag.torch_ : LazyImport("anomalib.deploy:ExportType.TORCH"),
+        AnomalibExportTypeFlag.onnx_ : LazyImport("anomalib.deploy:ExportType.ONNX"),
+        AnomalibExportTypeFlag.openvino_ : LazyImport("anomalib.deploy:ExportType.OPENVINO")
+    }
+
 
     def __init__(self, *, model_type : Optional[ModelTypeFlag] = None, image_metrics : list[str] = ["AUROC"], task : AnomalibTaskTypeEnum = AnomalibTaskTypeEnum.classification_) -> None:
         """
@@ -437,10 +461,15 @@ class AnomalyModelUnit:
 
         if not self.ModelValid(model_type=self.model_type_):
             raise ValueError("Model is not implemented.")
-        
-        self.model_ = self.ModelTypeFlagName[self.model_type_](**self.MODELS_PARAMS_DICT[self.model_type_])
 
-        assert isinstance(self.model_, self.ModelTypeFlagName[self.model_type_]), "Model is not valid."
+        from anomalib.engine import Engine
+        from anomalib.utils.normalization import NormalizationMethod
+        from lightning.pytorch.callbacks.early_stopping import EarlyStopping
+
+        model_class = self.ModelClass(model_type=self.model_type_)
+        self.model_ = model_class(**self.ModelParams(model_type=self.model_type_))
+
+        assert isinstance(self.model_, model_class), "Model is not valid."
 
         early_stopping_callback = EarlyStopping(
             monitor="generator_loss_step" if self.model_type_ in [AnomalyModelUnit.ModelTypeFlag.ganomaly_] else "train_loss_step",
@@ -476,6 +505,9 @@ class AnomalyModelUnit:
         >>> model = AnomalyModelUnit()
         >>> model.Evaluate(datamodule=datamodule)
         """
+        from anomalib.models.components import AnomalyModule
+        from anomalib.engine import Engine
+
         assert isinstance(self.model_, AnomalyModule), "Model is not valid."
         assert isinstance(self.engine_, Engine), "Engine is not valid."
 
@@ -505,25 +537,78 @@ class AnomalyModelUnit:
             >>> test_data = Folder(path="path/to/test/data")
             >>> predictions = model.Predict(data=test_data)
         """
+        from anomalib.models.components import AnomalyModule
+        from anomalib.engine import Engine
+
         assert isinstance(self.model_, AnomalyModule), "Model is not valid."
         assert isinstance(self.engine_, Engine), "Engine is not valid."
         return self.engine_.predict(model=self.model_, datamodule=data)
     
-    def Save(self, path : str) -> None:
+    def Save(self, path : str, export_types : AnomalibExportTypeFlag = AnomalibExportTypeFlag.torch_) -> None:
         """
         Save the model.
+        ONNX and OpenVINO graphs are exported at the model input size with a dynamic batch dimension.
 
         Args:
             path : str : Path to save the model.
+            export_types : AnomalibExportTypeFlag : Artifacts to write. Default is AnomalibExportTypeFlag.torch_.
+
+        Example:
+        >>> model = AnomalyModelUnit()
+        >>> model.Save(path="model", export_types=AnomalyModelUnit.AnomalibExportTypeFlag.torch_ | AnomalyModelUnit.AnomalibExportTypeFlag.openvino_)
+        """
+        from anomalib.models.components import AnomalyModule
+        from anomalib.engine import Engine
+
+        assert isinstance(self.model_, AnomalyModule), "Model is not valid."
+        assert isinstance(self.engine_, Engine), "Engine is not valid."
+        for export_type in AnomalyModelUnit.AnomalibExportTypeFlag:
+            if export_type not in export_types:
+                continue
+            if export_type == AnomalyModelUnit.AnomalibExportTypeFlag.torch_:
+                self.engine_.export(model=self.model_, export_type=AnomalyModelUnit.ExportTypeFlagName[export_type].Resolve(), export_root=path)
+            else:
+                self.engine_.export(model=self.model_, export_type=AnomalyModelUnit.ExportTypeFlagName[export_type].Resolve(), export_root=path, input_size=getattr(self.model_, "input_size", None))
+
+
+    def Quantize(self, path : str, datamodule : Folder) -> str:
+        """
+        Save an INT8 OpenVINO model with post-training quantization, calibrated on the train split of the datamodule.
+        The model is written to <path>/weights/openvino_int8/ so it sits alongside the FP32 exports of Save.
+
+        Args:
+            path : str : Path to save the model, same as for Save.
+            datamodule : Folder : The dataset loaded by DatasetUnit.AnomalibLoadFolder, its train images are the calibration set.
+
+        Returns:
+            str : Path of the INT8 model.xml.
 
         Example:
         >>> model = AnomalyModelUnit()
-        >>> model.Save()
+        >>> model.Save(path="model")
+        >>> model.Quantize(path="model", datamodule=datamodule)
+        'model/weights/openvino_int8/model.xml'
         """
+        from anomalib.models.components import AnomalyModule
+        from anomalib.engine import Engine
+
         assert isinstance(self.model_, AnomalyModule), "Model is not valid."
         assert isinstance(self.engine_, Engine), "Engine is not valid."
-        self.engine_.export(model=self.model_, export_type=ExportType.TORCH, export_root=path)
 
+        from anomalib.deploy import ExportType
+        from anomalib.deploy.export import CompressionType
+
+        # Export into a scratch root first, anomalib always writes to weights/openvino which may hold the FP32 model
+        scratch_path = join(path, "quantize_temp")
+        self.engine_.export(model=self.model_, export_type=ExportType.OPENVINO, export_root=scratch_path, input_size=getattr(self.model_, "input_size", None), compression_type=CompressionType.INT8_PTQ, datamodule=datamodule)
+
+        int8_path = join(path, "weights", "openvino_int8")
+        if exists(int8_path):
+            rmtree(int8_path)
+        makedirs(join(path, "weights"), exist_ok=True)
+        move(join(scratch_path, "weights", "openvino"), int8_path)
+        rmtree(scratch_path)
+        return join(int8_path, "model.xml")
 
     def ModelValid(self, *, model_type : ModelTypeFlag) -> bool:
         """
@@ -540,6 +625,40 @@ class AnomalyModelUnit:
         >>> model.ModelValid(model_type=AnomalyModelType.ganomaly_)
         """
         return self.VALID_MODELS_DICT[model_type]
+
+    def ModelClass(self, *, model_type : ModelTypeFlag) -> type[AnomalyModule]:
+        """
+        Get the model class of a model type, anomalib.models is only imported by the first call.
+
+        Args:
+            model_type : (ModelTypeFlag) : Model for anomaly detection.
+
+        Returns:
+            type[AnomalyModule] : The anomalib model class.
+
+        Example:
+        >>> model = AnomalyModelUnit()
+        >>> model.ModelClass(model_type=AnomalyModelUnit.ModelTypeFlag.cflow_)
+        <class 'anomalib.models.image.cflow.lightning_model.Cflow'>
+        """
+        return self.MODEL_CLASS_REGISTRY[model_type].Resolve()
+
+    def ModelParams(self, *, model_type : ModelTypeFlag) -> dict[str, Any]:
+        """
+        Get the constructor parameters of a model type, with the anomalib enums among them imported.
+
+        Args:
+            model_type : (ModelTypeFlag) : Model for anomaly detection.
+
+        Returns:
+            dict[str, Any] : Keyword arguments of the model class.
+
+        Example:
+        >>> model = AnomalyModelUnit()
+        >>> model.ModelParams(model_type=AnomalyModelUnit.ModelTypeFlag.efficient_ad_)["model_size"]
+        <EfficientAdModelSize.S: 'small'>
+        """
+        return {name: Resolved(value) for name, value in self.MODELS_PARAMS_DICT[model_type].items()}
     
     # Deployment model
     
@@ -553,4 +672,6 @@ def GetModel() -> list[str]:
     
     Use Enum AnomalyModelType instead.
     """
+    from anomalib.models import get_available_models
+
     return list(get_available_models())
@@ -0,0 +1,239 @@
+from typing import Optional, Final
+from enum import Enum
+from collections import OrderedDict
+from threading import Lock, get_ident
+from hashlib import sha256
+from os import makedirs, remove, replace, scandir, utime
+from os.path import getmtime, isfile, join
+from classes.response_lib import PackFrame, UnpackFrames
+
+# message, score, PNG bytes
+CachedResult = tuple[str, float, bytes]
+
+class ResultCache:
+    """
+    The ResultCache class keeps rendered prediction results so re-submitted images skip the model.
+    Entries are content addressed: the hash of the uploaded bytes plus the model type, week and
+    model file modification time, so a retrained model never serves stale results (ModelRegistry reloads
+    a model whose file changed, the results are computed by the model the key names).
+    The memory tier is an LRU of max_entries results, the optional disk tier keeps results in cache_dir
+    as one msgpack frame per file and refills the memory tier on a hit. Once the files written pass
+    max_disk_bytes the least recently used are deleted down to DISK_LOW_WATER of it, reads refresh
+    the modification time of a file so it counts as used. The directory is scanned rather than tracked
+    in memory, so the cap also holds for several server processes sharing it.
+
+    Constants:
+    DISK_LOW_WATER : float - Fraction of max_disk_bytes the disk tier is trimmed down to, so trimming is not run on every write.
+
+    Attributes:
+    max_entries_ : int - Most results held in memory.
+    cache_dir_ : Optional[str] - Directory of the disk tier, None to disable it.
+    max_disk_bytes_ : int - Most bytes of results kept on disk.
+    disk_bytes_ : int - Bytes on disk at the last trim plus the bytes written since.
+    entries_ : OrderedDict[str, CachedResult] - Results in memory, least recently used first.
+    hits_ : int - Lookups served from memory.
+    disk_hits_ : int - Lookups served from disk.
+    misses_ : int - Lookups that had to run the model.
+    lock_ : Lock - Guards entries_, disk_bytes_ and the counters.
+
+    Example:
+    >>> result_cache = ResultCache(max_entries=256, cache_dir="results/cache", max_disk_bytes=1024 * 1024 * 1024)
+    >>> key = result_cache.Key(data=image_bytes, types=ModelPathUnit.ModelTypeEnum.cflow_, week=ModelPathUnit.ModelWeekEnum.week3_, model_mtime=result_cache.ModelTime(model_path=path))
+    >>> if (cached := result_cache.Get(key=key)) is None:
+    >>>     result_cache.Put(key=key, result=(message, score, png_bytes))
+    """
+
+    DISK_LOW_WATER : Final[float] = 0.9
+
+    def __init__(self, *, max_entries: int = 256, cache_dir: Optional[str] = None, max_disk_bytes: int = 1024 * 1024 * 1024) -> None:
+        """
+        Initialize the ResultCache class, results already in cache_dir over max_disk_bytes are deleted.
+
+        Args:
+        max_entries : int - Most results held in memory, 0 disables the memory tier. Default is 256.
+        cache_dir : Optional[str] - Directory of the disk tier, created if missing. Default is None (memory only).
+        max_disk_bytes : int - Most bytes of results kept in cache_dir. Default is 1 GiB.
+        """
+        assert max_entries >= 0, "max_entries must not be negative"
+        assert max_disk_bytes > 0, "max_disk_bytes must be positive"
+        self.max_entries_ : int = max_entries
+        self.cache_dir_ : Optional[str] = cache_dir
+        self.max_disk_bytes_ : int = max_disk_bytes
+        self.disk_bytes_ : int = 0
+        self.entries_ : OrderedDict[str, CachedResult] = OrderedDict()
+        self.hits_ : int = 0
+        self.disk_hits_ : int = 0
+        self.misses_ : int = 0
+        self.lock_ : Lock = Lock()
+        if self.cache_dir_ is not None:
+            makedirs(self.cache_dir_, exist_ok=True)
+            self.TrimDisk()
+
+    def ModelTime(self, *, model_path: str) -> int:
+        """
+        Get the modification time of a model file, part of the key so results are dropped when the model changes.
+
+        Args:
+        model_path : str - Path of the model file.
+
+        Returns:
+        int - The modification time in nanoseconds.
+        """
+        return int(getmtime(model_path) * 1e9)
+
+    def Key(self, *, data: bytes, types: Enum, week: Enum, model_mtime: int, variant: str = "") -> str:
+        """
+        Build the key of an upload for a model.
+
+        Args:
+        data : bytes - The uploaded image bytes, as received.
+        types : Enum - The model type, e.g. ModelPathUnit.ModelTypeEnum.cflow_.
+        week : Enum - The model week, e.g. ModelPathUnit.ModelWeekEnum.week3_.
+        model_mtime : int - The model file modification time from ModelTime.
+        variant : str - How the result was computed when it differs from the plain prediction, e.g. the tiling. Default is "".
+
+        Returns:
+        str - The hex key.
+        """
+        return sha256(data + f"|{types.name}|{week.name}|{model_mtime}|{variant}".encode("utf-8")).hexdigest()
+
+    def Get(self, *, key: str) -> Optional[CachedResult]:
+        """
+        Look up a result, memory first then disk.
+
+        Args:
+        key : str - The key from Key.
+
+        Returns:
+        Optional[CachedResult] - The message, score and PNG bytes, or None on a miss.
+        """
+        with self.lock_:
+            if key in self.entries_:
+                self.entries_.move_to_end(key)
+                self.hits_ += 1
+                return self.entries_[key]
+
+        result = self.ReadDisk(key=key)
+        with self.lock_:
+            if result is None:
+                self.misses_ += 1
+                return None
+            self.disk_hits_ += 1
+            self.Remember(key=key, result=result)
+        return result
+
+    def Put(self, *, key: str, result: CachedResult) -> None:
+        """
+        Store a result in both tiers.
+
+        Args:
+        key : str - The key from Key.
+        result : CachedResult - The message, score and PNG bytes.
+        """
+        with self.lock_:
+            self.Remember(key=key, result=result)
+        self.WriteDisk(key=key, result=result)
+
+    def Remember(self, *, key: str, result: CachedResult) -> None:
+        """
+        Insert into the memory tier and drop the least recently used results over max_entries, caller holds lock_.
+
+        Args:
+        key : str - The key from Key.
+        result : CachedResult - The message, score and PNG bytes.
+        """
+        if self.max_entries_ == 0:
+            return
+        self.entries_[key] = result
+        self.entries_.move_to_end(key)
+        while len(self.entries_) > self.max_entries_:
+            self.entries_.popitem(last=False)
+
+    def ReadDisk(self, *, key: str) -> Optional[CachedResult]:
+        """
+        Read a result from the disk tier.
+
+        Args:
+        key : str - The key from Key.
+
+        Returns:
+        Optional[CachedResult] - The result, or None when the disk tier is off, the file is missing or unreadable.
+        """
+        if self.cache_dir_ is None:
+            return None
+        path = join(self.cache_dir_, f"{key}.msgpack")
+        if not isfile(path):
+            return None
+        try:
+            with open(path, "rb") as file:
+                frame = UnpackFrames(file.read())[0]
+            # Mark it used, TrimDisk deletes the oldest modification times first
+            utime(path)
+            return frame["message"], frame["score"], frame["image"]
+        except Exception:
+            return None
+
+    def WriteDisk(self, *, key: str, result: CachedResult) -> None:
+        """
+        Write a result to the disk tier, through a temporary file so readers never see a partial frame.
+
+        Args:
+        key : str - The key from Key.
+        result : CachedResult - The message, score and PNG bytes.
+        """
+        if self.cache_dir_ is None:
+            return
+        path = join(self.cache_dir_, f"{key}.msgpack")
+        message, score, image = result
+        frame = PackFrame(message=message, score=score, image=image)
+        temp_path = f"{path}.{get_ident()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(frame)
+        replace(temp_path, path)
+        with self.lock_:
+            self.disk_bytes_ += len(frame)
+            over = self.disk_bytes_ > self.max_disk_bytes_
+        if over:
+            self.TrimDisk()
+
+    def TrimDisk(self) -> None:
+        """
+        Delete the least recently used results of the disk tier until it is under DISK_LOW_WATER of max_disk_bytes.
+        Files deleted meanwhile by another process are skipped.
+        """
+        if self.cache_dir_ is None:
+            return
+        files : list[tuple[float, int, str]] = []
+        with scandir(self.cache_dir_) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".msgpack"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        if total > self.max_disk_bytes_:
+            low_water = int(self.max_disk_bytes_ * self.DISK_LOW_WATER)
+            for _, size, path in sorted(files):
+                if total <= low_water:
+                    break
+                try:
+                    remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        with self.lock_:
+            self.disk_bytes_ = total
+
+    def Stats(self) -> dict[str, int]:
+        """
+        Get the hit and miss counters.
+
+        Returns:
+        dict[str, int] - hits, disk_hits, misses, the number of entries in memory and the bytes on disk.
+        """
+        with self.lock_:
+            return {"hits": self.hits_, "disk_hits": self.disk_hits_, "misses": self.misses_, "entries": len(self.entries_), "disk_bytes": self.disk_bytes_}
@@ -0,0 +1,122 @@
+from typing import Any, Final, Optional
+from os import getenv
+from asyncio import sleep, TimeoutError as AsyncTimeoutError
+from aiohttp import ClientConnectorError, ClientResponse, ClientTimeout, FormData
+from classes.session_lib import SESSION_POOL
+
+class InferenceClient:
+    """
+    The InferenceClient class is the bot's async client of the inference server (server.py). Every call runs on the
+    pooled session of the event loop, with connect and read timeouts, so no command blocks the loop or hangs on a stuck server.
+    Calls refused by a busy server (429/503) are sent again after the Retry-After it asked for, when that is short enough,
+    and calls that could not connect are retried with backoff. A request that reached the server is never sent twice for an error,
+    so a training job is not queued twice.
+
+    Constants:
+    MAX_RETRIES : int - Times a call is sent again.
+    MAX_RETRY_AFTER_S : float - Longest Retry-After waited for, longer ones (e.g. a full training queue) are returned to the caller.
+    BACKOFF_S : float - Wait before the first retry of a call that could not connect, doubled for each further retry.
+    CONNECT_TIMEOUT_S : float - Seconds to connect to the server.
+    READ_TIMEOUT_S : float - Seconds to wait for the next bytes of the response, results of /predict are streamed.
+
+    Example:
+    >>> async with await INFERENCE_CLIENT.Request("GET", "/train", params={"name": "run"}) as response:
+    >>>     job = await response.json()
+    """
+
+    MAX_RETRIES : Final[int] = 3
+    MAX_RETRY_AFTER_S : Final[float] = 10.0
+    BACKOFF_S : Final[float] = 0.5
+    CONNECT_TIMEOUT_S : Final[float] = 5.0
+    READ_TIMEOUT_S : Final[float] = 120.0
+
+    def BaseUrl(self) -> str:
+        """
+        Get the address of the server, from SERVER_HOST and SERVER_PORT like server.py, read on every call since the bot
+        loads its .env after importing the channels.
+
+        Returns:
+        str - e.g. "http://127.0.0.1:5000".
+        """
+        return f"http://{getenv('SERVER_HOST', '127.0.0.1')}:{getenv('SERVER_PORT', '5000')}"
+
+    async def Request(self, method: str, path: str, *, params: Optional[dict[str, str]] = None, fields: Optional[dict[str, str]] = None, files: Optional[list[tuple[str, bytes, str, str]]] = None, headers: Optional[dict[str, str]] = None) -> ClientResponse:
+        """
+        Send a request to the server, the form is rebuilt for every attempt.
+
+        Args:
+        method : str - "GET" or "POST".
+        path : str - The route, e.g. "/predict".
+        params : Optional[dict[str, str]] - Query arguments. Default is None.
+        fields : Optional[dict[str, str]] - Form fields. Default is None.
+        files : Optional[list[tuple[str, bytes, str, str]]] - Form files as (field, content, filename, content type). Default is None.
+        headers : Optional[dict[str, str]] - Request headers. Default is None.
+
+        Returns:
+        ClientResponse - The response of the last attempt, the caller reads and releases it (async with).
+
+        Raises:
+        ClientConnectorError - The server could not be reached after MAX_RETRIES retries.
+        asyncio.TimeoutError - The server did not answer in time.
+        """
+        timeout = ClientTimeout(total=None, sock_connect=self.CONNECT_TIMEOUT_S, sock_read=self.READ_TIMEOUT_S)
+        for attempt in range(self.MAX_RETRIES + 1):
+            data : Optional[FormData] = None
+            if fields is not None or files is not None:
+                data = FormData()
+                for name, value in (fields or {}).items():
+                    data.add_field(name, value)
+                for name, content, filename, content_type in files or []:
+                    data.add_field(name, content, filename=filename, content_type=content_type)
+
+            try:
+                response = await SESSION_POOL.Session().request(method, f"{self.BaseUrl()}{path}", params=params, data=data, headers=headers, timeout=timeout)
+            except ClientConnectorError:
+                if attempt == self.MAX_RETRIES:
+                    raise
+                await sleep(self.BACKOFF_S * 2 ** attempt)
+                continue
+
+            # Back off while the server is busy, as long as it asks for
+            retry_after = RetryAfter(response.headers.get("Retry-After"))
+            if response.status not in (429, 503) or attempt == self.MAX_RETRIES or retry_after > self.MAX_RETRY_AFTER_S:
+                return response
+            response.release()
+            await sleep(retry_after)
+        raise AssertionError("unreachable")
+
+    async def ErrorDetail(self, response: ClientResponse) -> str:
+        """
+        Read the error of a failed call, the "messages" of a JSON error or the text of the body.
+
+        Args:
+        response : ClientResponse - The failed response.
+
+        Returns:
+        str - The error, one message per line.
+        """
+        if response.content_type == "application/json":
+            try:
+                result : Any = await response.json()
+                return "\n".join(result.get("messages", []))
+            except Exception:
+                return "Invalid JSON response from server."
+        return await response.text()
+
+def RetryAfter(value: Optional[str]) -> float:
+    """
+    Parse a Retry-After header given in seconds.
+
+    Args:
+    value : Optional[str] - The header.
+
+    Returns:
+    float - The seconds, 1 when missing or not a number.
+    """
+    try:
+        return max(0.0, float(value)) if value is not None else 1.0
+    except ValueError:
+        return 1.0
+
+# Shared by the bot commands, sessions are per event loop (see classes/session_lib.py)
+INFERENCE_CLIENT : InferenceClient = InferenceClient()
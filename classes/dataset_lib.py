@@ -1,14 +1,17 @@
-from typing import Final, Optional
+from __future__ import annotations
+from typing import Final, Optional, TYPE_CHECKING
 from enum import Enum, unique
 from os import listdir, makedirs
 from os.path import isfile, join, exists, dirname
-from cv2 import imread, imshow, waitKey, destroyAllWindows, imwrite, cvtColor, resize, IMREAD_COLOR, IMREAD_GRAYSCALE, INTER_NEAREST, INTER_LINEAR, INTER_CUBIC, INTER_LANCZOS4, COLOR_RGB2GRAY, COLOR_GRAY2RGB
-from numpy import ndarray
-from anomalib.data.image.folder import Folder, TestSplitMode
+from cv2 import imread, imdecode, imshow, waitKey, destroyAllWindows, imwrite, cvtColor, resize, IMREAD_COLOR, IMREAD_GRAYSCALE, INTER_NEAREST, INTER_LINEAR, INTER_CUBIC, INTER_LANCZOS4, COLOR_RGB2GRAY, COLOR_GRAY2RGB, COLOR_BGR2RGB
+from numpy import ndarray, frombuffer, uint8
 from anomalib import TaskType
 
 from classes.util_lib import Size, Rect 
 
+if TYPE_CHECKING:
+    from anomalib.data.image.folder import Folder
+
 # Create a image processing class
 class ImageUnit:
     """
@@ -23,6 +26,7 @@ class ImageUnit:
 
     Methods:
         LoadImage : Load image from file.
+        DecodeImage : Decode image from an in-memory encoded buffer.
         SaveImage : Save image to file.
         ResizeImage : Resize image.
         ConvertColor : Convert color of image.
@@ -54,9 +58,11 @@ class ImageUnit:
 
         rgb2gray_ : RGB to Grayscale conversion
         gray2rgb_ : Grayscale to RGB
+        bgr2rgb_ : BGR (OpenCV default) to RGB
         """
         rgb2gray_ = COLOR_RGB2GRAY
         gray2rgb_ = COLOR_GRAY2RGB
+        bgr2rgb_ = COLOR_BGR2RGB
 
     @unique
     class ImageInterpolationEnum(Enum):
@@ -96,6 +102,28 @@ class ImageUnit:
         image : ndarray = imread(path, color_mode.value)
         return image
 
+    def DecodeImage(self, data: bytes, color_mode: ColorModeEnum) -> Optional[ndarray]:
+        """
+        Decode image from an in-memory encoded buffer (jpg, png, ...).
+        No file is written, the buffer is wrapped without copying.
+
+        Args:
+            data : (bytes) Encoded image bytes.
+            color_mode : (ColorMode) Color mode of the image.
+
+        Returns:
+            Optional[ndarray]: Image data (BGR for rgb_), None if the buffer cannot be decoded.
+
+        :example:
+        >>> image_unit : ImageUnit = ImageUnit()
+        >>> image : ndarray = image_unit.DecodeImage(request_file.read(), ColorMode.rgb)
+        """
+        if len(data) == 0:
+            return None
+
+        image : Optional[ndarray] = imdecode(frombuffer(data, dtype=uint8), color_mode.value)
+        return image
+
     def SaveImage(self, path: str, image: ndarray) -> None:
         """
         Save image to file.
@@ -588,6 +616,9 @@ class DatasetUnit:
         >>>     task=TaskType.CLASSIFICATION
         >>> )
         """
+        # The datamodule pulls in lightning and torchvision, only needed when training
+        from anomalib.data.image.folder import Folder
+
         self.folder_ = Folder(
             name=datalib_name,
             root=root_path,
@@ -612,4 +643,6 @@ class DatasetUnit:
         >>> dataset_unit : DatasetUnit = DatasetUnit()
         >>> dataset_unit.AnomalibDatasetValidation() # Output: Folder not initialized
         """
+        from anomalib.data.image.folder import Folder
+
         assert isinstance(self.folder_, Folder), "Folder not initialized"
@@ -32,9 +32,9 @@ class MessageObject:
     - GetEmbed: Get the embed object
     - GetFile: Get the file object
 
-    TODO:
-    - Discord allows a maximum of 10 embeds per message. The current implementation does not handle this limitation.
-      Future upgrades may require splitting messages or managing multiple embeds.
+    NOTE:
+    - A message object holds one embed and one file. Discord allows 10 embeds per message,
+      classes/outbox_lib.py WebhookOutbox packs up to 10 message objects into one webhook call.
 
     Example:
     >>> message_object_ = MessageObject()
@@ -0,0 +1,172 @@
+from typing import Awaitable, Callable, Final
+from os import getenv
+from sys import stderr
+from asyncio import CancelledError, Semaphore, Task, create_task, gather
+from discord import Message
+from classes.discord_lib import MessageObject
+
+class CommandDispatcher:
+    """
+    The CommandDispatcher class runs the heavy bot commands (e.g. ~predict) as tracked tasks, so the message that asked
+    for one is answered with its place in the queue while quick commands (help, test) keep being answered at once.
+    Commands of a channel and of a user run a limited number at a time, the others wait for a slot in order.
+    The result of a command is sent to its channel as a reply when it is done.
+
+    Constants:
+    MAX_PER_CHANNEL : int - Default of COMMAND_MAX_PER_CHANNEL, heavy commands running at once in a channel.
+    MAX_PER_USER : int - Default of COMMAND_MAX_PER_USER, heavy commands running at once for a user over all channels.
+    MAX_QUEUED : int - Default of COMMAND_MAX_QUEUED, heavy commands waiting in a channel, refused beyond that.
+
+    Attributes:
+    channel_slots_ : dict[int, Semaphore] - The slots of each channel.
+    user_slots_ : dict[int, Semaphore] - The slots of each user.
+    channel_commands_ : dict[int, int] - Commands holding a slot of their user and waiting for or holding a slot of each channel.
+    user_commands_ : dict[int, int] - Commands waiting for or holding a slot of each user.
+    tasks_ : set[Task] - The commands queued or running.
+
+    Example:
+    >>> if command_object.heavy_:
+    >>>     COMMAND_DISPATCHER.Dispatch(function=command_object.function_, message=message, message_object=message_object)
+    """
+
+    MAX_PER_CHANNEL : Final[int] = 2
+    MAX_PER_USER : Final[int] = 1
+    MAX_QUEUED : Final[int] = 16
+
+    def __init__(self) -> None:
+        """
+        Initialize the CommandDispatcher class, the slots are created on first use since the bot loads its .env after importing the channels.
+        """
+        self.channel_slots_ : dict[int, Semaphore] = {}
+        self.user_slots_ : dict[int, Semaphore] = {}
+        self.channel_commands_ : dict[int, int] = {}
+        self.user_commands_ : dict[int, int] = {}
+        self.tasks_ : set[Task] = set()
+
+    def Limit(self, env: str, default: int) -> int:
+        """
+        Read a limit, at least 1.
+
+        Args:
+        env : str - The variable of the limit.
+        default : int - The limit when the variable is not set.
+
+        Returns:
+        int - The limit.
+        """
+        return max(1, int(getenv(env, str(default))))
+
+    def Slots(self, slots: dict[int, Semaphore], key: int, limit: int) -> Semaphore:
+        """
+        Get the slots of a channel or user, created on first use.
+
+        Args:
+        slots : dict[int, Semaphore] - channel_slots_ or user_slots_.
+        key : int - The channel or user ID.
+        limit : int - The commands running at once.
+
+        Returns:
+        Semaphore - The slots.
+        """
+        if key not in slots:
+            slots[key] = Semaphore(limit)
+        return slots[key]
+
+    def Dispatch(self, *, function: Callable[[Message, MessageObject], Awaitable[None]], message: Message, message_object: MessageObject) -> None:
+        """
+        Queue a heavy command. message_object is the immediate answer: empty when the command starts at once,
+        its place in the queue when it has to wait, or a refusal when the channel queue is full.
+
+        Args:
+        function : Callable[[Message, MessageObject], Awaitable[None]] - The command function.
+        message : Message - The message of the command.
+        message_object : MessageObject - The immediate answer.
+        """
+        channel_id, user_id = message.channel.id, message.author.id
+        channel_limit = self.Limit('COMMAND_MAX_PER_CHANNEL', self.MAX_PER_CHANNEL)
+        user_limit = self.Limit('COMMAND_MAX_PER_USER', self.MAX_PER_USER)
+        channel_slots = self.Slots(self.channel_slots_, channel_id, channel_limit)
+        user_slots = self.Slots(self.user_slots_, user_id, user_limit)
+
+        # Counted here rather than from the slots, tasks created in the same tick have not asked for a slot yet.
+        # A command waiting for a slot of its user is not counted in its channel until it gets that slot
+        channel_commands = self.channel_commands_.get(channel_id, 0)
+        user_commands = self.user_commands_.get(user_id, 0)
+        user_free = user_commands < user_limit
+        position = max(channel_commands - channel_limit + 1, user_commands - user_limit + 1, 0)
+        if position > 0:
+            if position > self.Limit('COMMAND_MAX_QUEUED', self.MAX_QUEUED):
+                message_object.SetMessage(f"Too many commands queued ({position - 1}), try again later")
+                return
+            message_object.SetMessage(f"Queued, position {position}")
+
+        if user_free:
+            self.channel_commands_[channel_id] = channel_commands + 1
+        self.user_commands_[user_id] = user_commands + 1
+        task = create_task(self.Run(function=function, message=message, channel_slots=channel_slots, user_slots=user_slots, counted=user_free))
+        self.tasks_.add(task)
+        task.add_done_callback(self.tasks_.discard)
+
+    async def Run(self, *, function: Callable[[Message, MessageObject], Awaitable[None]], message: Message, channel_slots: Semaphore, user_slots: Semaphore, counted: bool) -> None:
+        """
+        Wait for a slot of the user then of the channel, so a user over their limit does not hold a channel slot, run the command and send its result.
+
+        Args:
+        function : Callable[[Message, MessageObject], Awaitable[None]] - The command function.
+        message : Message - The message of the command.
+        channel_slots : Semaphore - The slots of the channel.
+        user_slots : Semaphore - The slots of the user.
+        counted : bool - Whether Dispatch already counted the command in its channel, when a slot of the user was free.
+        """
+        channel_id, user_id = message.channel.id, message.author.id
+        try:
+            async with user_slots:
+                if not counted:
+                    self.channel_commands_[channel_id] = self.channel_commands_.get(channel_id, 0) + 1
+                    counted = True
+                async with channel_slots:
+                    message_object = MessageObject()
+                    try:
+                        await function(message, message_object)
+                    except CancelledError:
+                        raise
+                    except Exception as e:
+                        # Nobody awaits the task, report the failure instead of losing it
+                        print(f"Error: command {message.content!r} failed: {e!r}", file=stderr)
+                        message_object = MessageObject()
+                        message_object.SetMessage(f"Command failed: {e}")
+
+                    if not message_object.EmptyMessage():
+                        await message.reply(message_object.message_, embed=message_object.embed_, file=message_object.file_) # type: ignore
+        finally:
+            # A command cancelled while waiting for a slot of its user was never counted in its channel
+            for commands, key, held in ((self.channel_commands_, channel_id, counted), (self.user_commands_, user_id, True)):
+                if not held:
+                    continue
+                commands[key] -= 1
+                if commands[key] == 0:
+                    del commands[key]
+
+    def Stats(self) -> dict[str, int]:
+        """
+        Get the number of heavy commands.
+
+        Returns:
+        dict[str, int] - tasks, the commands queued or running, and channels and users with a command queued or running.
+        """
+        return {"tasks": len(self.tasks_), "channels": len(self.channel_commands_), "users": len(self.user_commands_)}
+
+    async def Shutdown(self) -> None:
+        """
+        Cancel the commands queued or running, run it before the pooled session of the loop is closed.
+        """
+        tasks = list(self.tasks_)
+        for task in tasks:
+            task.cancel()
+        await gather(*tasks, return_exceptions=True)
+        # A task cancelled before its first step never ran the finally of Run that uncounts it
+        self.channel_commands_.clear()
+        self.user_commands_.clear()
+
+# Shared by the ChannelMessageTemplate of every channel, so the per-user limit holds over all channels
+COMMAND_DISPATCHER : CommandDispatcher = CommandDispatcher()
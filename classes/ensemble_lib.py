@@ -0,0 +1,176 @@
+from typing import Optional
+from anomalib.models.components.feature_extractors import TimmFeatureExtractor
+from timm import create_model
+from timm.models import FeatureListNet
+import torch
+
+class SharedBackbone(torch.nn.Module):
+    """
+    The SharedBackbone class runs one frozen pretrained backbone for several models. The ensemble feeds it each batch once,
+    after the transform every model shares, and every model head that is then called with that same tensor gets its features
+    without running the backbone again. Called with any other tensor (a model used on its own) it runs the backbone for that call.
+
+    Attributes:
+    backbone_ : str - The timm name of the backbone, e.g. "wide_resnet50_2".
+    layers_ : list[str] - The layers returned, shallowest first, the union of the layers of every model sharing it.
+    feature_extractor : FeatureListNet - The timm feature extractor, cut after the deepest layer.
+    inputs_ : Optional[torch.Tensor] - The batch fed, until Clear.
+    features_ : Optional[dict[str, torch.Tensor]] - The features of the batch fed by layer.
+
+    Example:
+    >>> shared = SharedBackbone(backbone="resnet18", layers=["layer1", "layer2", "layer3"], state_dict=extractor.state_dict())
+    >>> shared.Feed(inputs=batch)
+    >>> features = shared.Features(inputs=batch)
+    >>> shared.Clear()
+    """
+
+    def __init__(self, *, backbone: str, layers: list[str], state_dict: dict[str, torch.Tensor]) -> None:
+        """
+        Initialize the SharedBackbone class, the weights come from the models, nothing is downloaded.
+
+        Args:
+        backbone : str - The timm name of the backbone.
+        layers : list[str] - The layers to return.
+        state_dict : dict[str, torch.Tensor] - Weights of the backbone up to at least the deepest layer.
+        """
+        super().__init__()
+        module_names : list[str] = create_model(backbone, pretrained=False, features_only=True, exportable=True).feature_info.module_name()
+        indices = sorted(module_names.index(layer) for layer in set(layers))
+        self.backbone_ : str = backbone
+        self.layers_ : list[str] = [module_names[index] for index in indices]
+        self.feature_extractor : FeatureListNet = create_model(backbone, pretrained=False, features_only=True, exportable=True, out_indices=indices)
+        missing, _ = self.feature_extractor.load_state_dict(state_dict, strict=False)
+        assert not missing, f"Weights missing for the shared {backbone}: {missing}"
+        self.feature_extractor.eval()
+        self.inputs_ : Optional[torch.Tensor] = None
+        self.features_ : Optional[dict[str, torch.Tensor]] = None
+
+    def Feed(self, *, inputs: torch.Tensor) -> None:
+        """
+        Run the backbone once for a batch, the heads called with this tensor until Clear reuse its features.
+
+        Args:
+        inputs : torch.Tensor - NxCxHxW batch, already transformed.
+        """
+        with torch.no_grad():
+            self.features_ = dict(zip(self.layers_, self.feature_extractor(inputs)))
+        self.inputs_ = inputs
+
+    def Features(self, *, inputs: torch.Tensor) -> dict[str, torch.Tensor]:
+        """
+        Get the features of a batch, those of Feed when it is the tensor fed, otherwise from a backbone pass of its own.
+
+        Args:
+        inputs : torch.Tensor - NxCxHxW batch, already transformed by the model.
+
+        Returns:
+        dict[str, torch.Tensor] - The features by layer.
+        """
+        if inputs is self.inputs_ and self.features_ is not None:
+            return self.features_
+        with torch.no_grad():
+            return dict(zip(self.layers_, self.feature_extractor(inputs)))
+
+    def Clear(self) -> None:
+        """
+        Drop the batch fed and its features.
+        """
+        self.inputs_, self.features_ = None, None
+
+class SharedFeatureDict(torch.nn.Module):
+    """
+    Stands in for a frozen TimmFeatureExtractor (cflow, patchcore, reverse_distillation, the stfpm teacher), returns its layers by name.
+    """
+
+    def __init__(self, *, shared: SharedBackbone, layers: list[str]) -> None:
+        super().__init__()
+        self.shared_ : SharedBackbone = shared
+        self.layers_ : list[str] = list(layers)
+
+    def forward(self, inputs: torch.Tensor) -> dict[str, torch.Tensor]:
+        features = self.shared_.Features(inputs=inputs)
+        return {layer: features[layer] for layer in self.layers_}
+
+class SharedFeatureList(torch.nn.Module):
+    """
+    Stands in for a frozen timm features_only model used directly (fastflow), returns its layers as a list.
+    """
+
+    def __init__(self, *, shared: SharedBackbone, layers: list[str]) -> None:
+        super().__init__()
+        self.shared_ : SharedBackbone = shared
+        self.layers_ : list[str] = list(layers)
+
+    def forward(self, inputs: torch.Tensor) -> list[torch.Tensor]:
+        features = self.shared_.Features(inputs=inputs)
+        return [features[layer] for layer in self.layers_]
+
+def FindExtractors(module: torch.nn.Module, backbone: str) -> list[tuple[torch.nn.Module, str, str, list[str], torch.nn.Module]]:
+    """
+    Find the frozen backbone feature extractors of a model.
+
+    Args:
+    module : torch.nn.Module - The model, searched recursively.
+    backbone : str - Backbone name of raw timm extractors, they do not record it (e.g. from MODELS_PARAMS_DICT).
+
+    Returns:
+    list[tuple[torch.nn.Module, str, str, list[str], torch.nn.Module]] - Parent, attribute name, backbone, layers and the extractor (its timm model).
+    """
+    found : list[tuple[torch.nn.Module, str, str, list[str], torch.nn.Module]] = []
+    for name, child in module.named_children():
+        if isinstance(child, TimmFeatureExtractor):
+            # Trained extractors (the stfpm student) have their own weights and are left alone
+            if not child.requires_grad:
+                found.append((module, name, child.backbone, list(child.layers), child.feature_extractor))
+            continue
+        if isinstance(child, FeatureListNet):
+            if not any(parameter.requires_grad for parameter in child.parameters()):
+                found.append((module, name, backbone, list(child.feature_info.module_name()), child))
+            continue
+        found.extend(FindExtractors(child, backbone))
+    return found
+
+def ShareBackbones(models: list[tuple[torch.nn.Module, str]]) -> dict[str, SharedBackbone]:
+    """
+    Replace the frozen backbone feature extractors of several models with one SharedBackbone per backbone name.
+    An extractor is only replaced when its weights equal the weights of every other extractor of that backbone,
+    so the outputs of every model are unchanged.
+
+    Args:
+    models : list[tuple[torch.nn.Module, str]] - The models with the backbone name of their raw timm extractors.
+
+    Returns:
+    dict[str, SharedBackbone] - The shared backbones by name, replaced modules are freed with the models' references.
+
+    Example:
+    >>> shared = ShareBackbones([(cflow_model, "wide_resnet50_2"), (patchcore_model, "wide_resnet50_2")])
+    >>> list(shared["wide_resnet50_2"].layers_)
+    ['layer2', 'layer3', 'layer4']
+    """
+    groups : dict[str, list[tuple[torch.nn.Module, str, str, list[str], torch.nn.Module]]] = {}
+    for model, backbone in models:
+        for extractor in FindExtractors(model, backbone):
+            groups.setdefault(extractor[2], []).append(extractor)
+
+    shared : dict[str, SharedBackbone] = {}
+    for backbone, extractors in groups.items():
+        # Merge the weights, extractors cut at a shallower layer only hold a prefix of them
+        weights : dict[str, torch.Tensor] = {}
+        accepted : list[tuple[torch.nn.Module, str, str, list[str], torch.nn.Module]] = []
+        for extractor in extractors:
+            state_dict = extractor[4].state_dict()
+            if any(key in weights and not torch.equal(weights[key], value) for key, value in state_dict.items()):
+                continue
+            weights.update(state_dict)
+            accepted.append(extractor)
+        if len(accepted) < 2:
+            continue
+
+        shared[backbone] = SharedBackbone(backbone=backbone, layers=[layer for extractor in accepted for layer in extractor[3]], state_dict=weights)
+        shared[backbone].to(next(accepted[0][4].parameters()).device)
+        for parent, name, _, layers, extractor in accepted:
+            if isinstance(extractor, FeatureListNet) and getattr(parent, name) is extractor:
+                setattr(parent, name, SharedFeatureList(shared=shared[backbone], layers=layers))
+            else:
+                setattr(parent, name, SharedFeatureDict(shared=shared[backbone], layers=layers))
+    return shared
@@ -5,6 +5,9 @@
 
 from flask import Flask, jsonify, Response, request
 from functools import wraps
+from typing import Any, Callable, Coroutine
+from threading import local
+from asyncio import AbstractEventLoop, new_event_loop, set_event_loop
 from enum import Enum, unique
 from aiohttp import ClientSession
 from discord import Webhook, Embed, File
@@ -19,9 +22,16 @@ class CallbackFunctionRoute(Enum):
     - ApiService: Route for the API service.
     - Index: Route for the index page.
     - Test: Route for testing purposes.
-    - Train: Route for training models.
+    - Train: Route for queueing a training job.
+    - TrainStatus: Route for the status and progress of training jobs.
+    - TrainCancel: Route for cancelling a training job.
     - Predict: Route for making predictions.
     - PredictSetup: Route for setting up prediction configurations.
+    - PredictEnsemble: Route for predicting with an ensemble of models sharing their backbones.
+    - CacheStats: Route for the prediction result cache counters.
+    - PredictStatus: Route for the load and admission limits of /predict.
+    - Metrics: Route for the per-stage latency histograms in the Prometheus text format.
+    - Ready: Route for the readiness and warm-up latency of the loaded models.
 
     Example:
     >>> CALLBACK_FUNCTION_ROUTE["ApiService"]
@@ -31,14 +41,71 @@ class CallbackFunctionRoute(Enum):
     Index = "/"
     Test = "/test"
     Train = "/train"
+    TrainStatus = "/train_status"
+    TrainCancel = "/train_cancel"
     Predict = "/predict"
     PredictSetup = "/predict_setup"
+    PredictEnsemble = "/predict_ensemble"
+    CacheStats = "/cache_stats"
+    PredictStatus = "/predict_status"
+    Metrics = "/metrics"
+    Ready = "/ready"
 
 # Dictionary mapping function names to routes
 CALLBACK_FUNCTION_ROUTE: dict[str, str] = {i.name: i.value for i in CallbackFunctionRoute}
 
+class AsyncFlask(Flask):
+    """
+    Flask application that runs async routes on one persistent event loop per server thread.
+
+    Flask's default async_to_sync goes through asgiref, which creates a new event loop (and a thread to run it on)
+    for every request. Here each server thread creates its loop once and runs the route coroutine on it directly,
+    in the request context of that thread.
+
+    Attributes:
+    loops_ : local - The event loop of each server thread.
+
+    Example:
+    >>> APP = AsyncFlask(__name__)
+    >>> @APP.route("/")
+    >>> async def Index():
+    >>>     return "Hello World"
+    """
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.loops_ : local = local()
+
+    def ThreadLoop(self) -> AbstractEventLoop:
+        """
+        Get the event loop of the calling thread, created on first use.
+
+        Returns:
+        AbstractEventLoop - The loop of this thread.
+        """
+        loop = getattr(self.loops_, "loop", None)
+        if loop is None or loop.is_closed():
+            loop = new_event_loop()
+            set_event_loop(loop)
+            self.loops_.loop = loop
+        return loop
+
+    def async_to_sync(self, func: Callable[..., Coroutine[Any, Any, Any]]) -> Callable[..., Any]:
+        """
+        Wrap an async route so the WSGI server can call it, the coroutine runs on the loop of the calling thread.
+
+        Args:
+        func : Callable[..., Coroutine[Any, Any, Any]] - The async route.
+
+        Returns:
+        Callable[..., Any] - The sync wrapper.
+        """
+        @wraps(func)
+        def Wrapper(*args: Any, **kwargs: Any) -> Any:
+            return self.ThreadLoop().run_until_complete(func(*args, **kwargs))
+        return Wrapper
+
 # Flask application instance
-APP: Flask = Flask(__name__, template_folder="templates")
+APP: AsyncFlask = AsyncFlask(__name__, template_folder="templates")
 
 # Decorators for registering routes
 def Callback(func):
@@ -0,0 +1,394 @@
+from typing import Any, BinaryIO, Callable, Optional, Final
+from enum import Enum, unique
+from collections import deque
+from threading import Condition, Thread
+from subprocess import PIPE, Popen
+import subprocess
+from pickle import dumps, load
+from json import dumps as json_dumps, loads as json_loads
+from time import time
+from uuid import uuid4
+import os
+import signal
+import sys
+
+class ProgressWriter:
+    """
+    The ProgressWriter class is the progress_queue of a job subprocess, each put is one JSON line to the TrainJobManager.
+
+    Attributes:
+    file_ : BinaryIO - The pipe read by the TrainJobManager.
+
+    Example:
+    >>> progress_queue.put((1, 5, "cflow"))
+    """
+
+    def __init__(self, file : BinaryIO) -> None:
+        self.file_ : BinaryIO = file
+
+    def put(self, item : tuple[int, int, str]) -> None:
+        """
+        Report progress, same call as multiprocessing.Queue.put.
+
+        Args:
+        item : tuple[int, int, str] - Models done, models total and the model just finished.
+        """
+        self.file_.write(json_dumps(list(item)).encode("utf-8") + b"\n")
+        self.file_.flush()
+
+def JobProcessEntry(target : Callable[..., None], kwargs : dict[str, Any], niceness : int, threads : int) -> None:
+    """
+    First function run in a job subprocess, lowers its priority and caps its threads before running the job,
+    so a training run does not starve the inference threads of the server.
+
+    Args:
+    target : Callable[..., None] - The job, a module level function.
+    kwargs : dict[str, Any] - The arguments of the job.
+    niceness : int - Added to the process niceness (ignored where unsupported, e.g. Windows), 0 to keep the priority.
+    threads : int - Torch intra-op threads, 0 to keep the default.
+    """
+    if niceness > 0 and hasattr(os, "nice"):
+        os.nice(niceness)
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+    target(**kwargs)
+
+def JobProcessMain() -> None:
+    """
+    Main of a job subprocess (python -m classes.job_lib), started by TrainJobManager. Only this module and the job's own
+    module are imported, never the server. The job is read pickled from stdin, stdout is kept for the progress lines
+    and everything the job prints goes to stderr.
+    """
+    progress_file = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    target, kwargs, niceness, threads = load(sys.stdin.buffer)
+    JobProcessEntry(target, dict(kwargs, progress_queue=ProgressWriter(progress_file)), niceness, threads)
+
+class TrainJob:
+    """
+    The TrainJob class holds the state of one job of the TrainJobManager.
+
+    Attributes:
+    job_id_ : str - Unique ID of the job.
+    name_ : str - Name of the run.
+    status_ : TrainJobManager.JobStatusEnum - Current status.
+    progress_ : tuple[int, int, str] - Models done, models total and the last model reported.
+    created_ : float - Submit time (epoch seconds).
+    started_ : Optional[float] - Start time of the subprocess.
+    finished_ : Optional[float] - End time of the subprocess.
+    cancelled_ : Optional[float] - When a running job was asked to stop, it is killed after TrainJobManager.CANCEL_GRACE_S.
+    error_ : Optional[str] - Why the job failed.
+    target_ : Callable[..., None] - The job function.
+    kwargs_ : dict[str, Any] - The arguments of the job function.
+    process_ : Optional[Popen] - The subprocess while running.
+    reader_ : Optional[Thread] - Reads the progress of the subprocess until it closes its stdout.
+    """
+    def __init__(self, *, name : str, target : Callable[..., None], kwargs : dict[str, Any]) -> None:
+        self.job_id_ : str = uuid4().hex
+        self.name_ : str = name
+        self.status_ : TrainJobManager.JobStatusEnum = TrainJobManager.JobStatusEnum.queued_
+        self.progress_ : tuple[int, int, str] = (0, 0, "")
+        self.created_ : float = time()
+        self.started_ : Optional[float] = None
+        self.finished_ : Optional[float] = None
+        self.cancelled_ : Optional[float] = None
+        self.error_ : Optional[str] = None
+        self.target_ : Callable[..., None] = target
+        self.kwargs_ : dict[str, Any] = kwargs
+        self.process_ : Optional[Popen] = None
+        self.reader_ : Optional[Thread] = None
+
+    def ToDict(self) -> dict[str, Any]:
+        """
+        Get the public state of the job.
+
+        Returns:
+        dict[str, Any] - JSON serialisable state.
+        """
+        done, total, model = self.progress_
+        return {
+            "job_id": self.job_id_,
+            "name": self.name_,
+            "status": self.status_.value,
+            "progress": {"done": done, "total": total, "model": model},
+            "created": self.created_,
+            "started": self.started_,
+            "finished": self.finished_,
+            "error": self.error_
+        }
+
+class TrainJobManager:
+    """
+    The TrainJobManager class runs training jobs in subprocesses, max_running at a time, with a bounded queue.
+    Jobs run in fresh interpreters (python -m classes.job_lib, see JobProcessMain) rather than forked or spawned
+    multiprocessing children, so they start clean of the server threads, locks and loaded models and never re-import
+    the server, and at a lower priority with a capped thread count, so inference keeps its cores.
+    Every job is the leader of its own process group, cancelling it and reaping it kill the whole group,
+    so the DataLoader workers of a training run never outlive it. Only the last max_finished finished jobs are kept.
+
+    Enums:
+    JobStatusEnum : Enum - Status of a job.
+
+    Constants:
+    MONITOR_INTERVAL_S : float - How often running jobs are checked.
+    CANCEL_GRACE_S : float - How long a cancelled job may take to exit after SIGTERM before its group is killed.
+    MAX_FINISHED : int - Default of max_finished.
+
+    Attributes:
+    max_running_ : int - Most jobs running at once.
+    max_queued_ : int - Most jobs waiting to run.
+    max_finished_ : int - Most finished jobs kept for /train_status, the oldest are forgotten.
+    niceness_ : int - Niceness added to every job subprocess.
+    threads_ : int - Torch threads of every job subprocess, 0 for the default.
+    jobs_ : dict[str, TrainJob] - The queued, running and last finished jobs by ID, oldest first.
+    queue_ : deque[str] - IDs of the waiting jobs, oldest first.
+    finished_ : deque[str] - IDs of the finished jobs, oldest first.
+    condition_ : Condition - Guards the jobs and wakes the monitor.
+    thread_ : Optional[Thread] - Starts queued jobs and collects finished ones, started on the first Submit.
+
+    Example:
+    >>> train_job_manager = TrainJobManager(max_running=1, max_queued=4)
+    >>> job = train_job_manager.Submit(name="week3", target=RunModelProcess, kwargs={...})
+    >>> train_job_manager.Get(job_id=job.job_id_).ToDict()["status"]
+    'queued'
+    """
+
+    @unique
+    class JobStatusEnum(Enum):
+        """
+        Enum for the status of a job.
+
+        Attributes:
+        queued_ : Waiting for a free slot.
+        running_ : Subprocess running.
+        succeeded_ : Subprocess exited with 0.
+        failed_ : Subprocess exited with an error.
+        cancelled_ : Cancelled before or while running.
+        """
+        queued_ = "queued"
+        running_ = "running"
+        succeeded_ = "succeeded"
+        failed_ = "failed"
+        cancelled_ = "cancelled"
+
+    MONITOR_INTERVAL_S : Final[float] = 0.5
+    CANCEL_GRACE_S : Final[float] = 10
+    MAX_FINISHED : Final[int] = 32
+
+    def __init__(self, *, max_running : int = 1, max_queued : int = 4, niceness : int = 10, threads : int = 0, max_finished : int = MAX_FINISHED) -> None:
+        """
+        Initialize the TrainJobManager class.
+
+        Args:
+        max_running : int - Most jobs running at once. Default is 1.
+        max_queued : int - Most jobs waiting to run. Default is 4.
+        niceness : int - Niceness added to every job subprocess. Default is 10.
+        threads : int - Torch threads of every job subprocess, 0 for the default. Default is 0.
+        max_finished : int - Most finished jobs kept. Default is MAX_FINISHED.
+        """
+        assert max_running > 0, "max_running must be positive"
+        assert max_queued >= 0, "max_queued must not be negative"
+        assert max_finished >= 0, "max_finished must not be negative"
+        self.max_running_ : int = max_running
+        self.max_queued_ : int = max_queued
+        self.max_finished_ : int = max_finished
+        self.niceness_ : int = niceness
+        self.threads_ : int = threads
+        self.jobs_ : dict[str, TrainJob] = {}
+        self.queue_ : deque[str] = deque()
+        self.finished_ : deque[str] = deque()
+        self.condition_ : Condition = Condition()
+        self.thread_ : Optional[Thread] = None
+
+    def Submit(self, *, name : str, target : Callable[..., None], kwargs : dict[str, Any]) -> Optional[TrainJob]:
+        """
+        Queue a job, target is called in a subprocess with kwargs plus progress_queue.
+
+        Args:
+        name : str - Name of the run.
+        target : Callable[..., None] - The job, a module level function taking progress_queue (see ProgressWriter),
+            not defined in __main__ since the subprocess does not import it.
+        kwargs : dict[str, Any] - The other arguments of the job, must be picklable.
+
+        Returns:
+        Optional[TrainJob] - The queued job, None when the queue is full.
+        """
+        assert target.__module__ != "__main__", "Job target must be importable by the subprocess"
+        with self.condition_:
+            # Queued jobs beyond the free running slots are what waits
+            if len(self.queue_) >= self.max_queued_ + self.max_running_ - self.Running():
+                return None
+            job = TrainJob(name=name, target=target, kwargs=kwargs)
+            self.jobs_[job.job_id_] = job
+            self.queue_.append(job.job_id_)
+            if self.thread_ is None:
+                self.thread_ = Thread(target=self.Loop, name="TrainJobManager", daemon=True)
+                self.thread_.start()
+            self.condition_.notify()
+            return job
+
+    def Get(self, *, job_id : str) -> Optional[TrainJob]:
+        """
+        Get a job by ID.
+
+        Args:
+        job_id : str - ID of the job.
+
+        Returns:
+        Optional[TrainJob] - The job, None if unknown or forgotten.
+        """
+        with self.condition_:
+            return self.jobs_.get(job_id)
+
+    def Jobs(self) -> list[dict[str, Any]]:
+        """
+        Get the state of every job.
+
+        Returns:
+        list[dict[str, Any]] - The jobs, oldest first.
+        """
+        with self.condition_:
+            return [job.ToDict() for job in self.jobs_.values()]
+
+    def Cancel(self, *, job_id : str) -> Optional[TrainJob]:
+        """
+        Cancel a job, a queued job is dropped, a running job has its process group terminated (killed after CANCEL_GRACE_S).
+
+        Args:
+        job_id : str - ID of the job.
+
+        Returns:
+        Optional[TrainJob] - The job, None if unknown.
+        """
+        with self.condition_:
+            job = self.jobs_.get(job_id)
+            if job is None:
+                return None
+            if job.status_ == TrainJobManager.JobStatusEnum.queued_:
+                self.queue_.remove(job_id)
+                job.status_ = TrainJobManager.JobStatusEnum.cancelled_
+                job.finished_ = time()
+                self.Finish(job=job)
+            elif job.status_ == TrainJobManager.JobStatusEnum.running_:
+                assert job.process_ is not None, "Running job has no process"
+                self.Signal(process=job.process_, kill=False)
+                job.status_ = TrainJobManager.JobStatusEnum.cancelled_
+                job.cancelled_ = time()
+            self.condition_.notify()
+            return job
+
+    def Running(self) -> int:
+        """
+        Get the number of running jobs, the caller holds condition_.
+
+        Returns:
+        int - Number of jobs with a live subprocess.
+        """
+        return sum(1 for job in self.jobs_.values() if job.process_ is not None)
+
+    def Start(self, *, job : TrainJob) -> None:
+        """
+        Start the subprocess of a queued job in a new session and hand it the job on stdin, the caller holds condition_.
+
+        Args:
+        job : TrainJob - The job.
+        """
+        # The subprocess imports classes.job_lib and the job's module from the root of the repository, whatever the working directory
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in (root, os.environ.get("PYTHONPATH", "")) if path))
+        group = {"creationflags": getattr(subprocess, "CREATE_NEW_PROCESS_GROUP", 0)} if sys.platform == "win32" else {"start_new_session": True}
+        job.process_ = Popen([sys.executable, "-m", "classes.job_lib"], stdin=PIPE, stdout=PIPE, env=env, **group) # type: ignore
+        assert job.process_.stdin is not None and job.process_.stdout is not None
+        try:
+            job.process_.stdin.write(dumps((job.target_, job.kwargs_, self.niceness_, self.threads_)))
+            job.process_.stdin.close()
+        except BrokenPipeError:
+            # Exited before reading the job, its exit code is collected by Loop
+            pass
+        job.reader_ = Thread(target=self.ReadProgress, args=(job, job.process_.stdout), name=f"TrainJob-{job.job_id_}", daemon=True)
+        job.reader_.start()
+        job.status_ = TrainJobManager.JobStatusEnum.running_
+        job.started_ = time()
+
+    def ReadProgress(self, job : TrainJob, stdout : BinaryIO) -> None:
+        """
+        Reader thread of a job, takes each progress line of the subprocess until it exits, then closes the pipe.
+
+        Args:
+        job : TrainJob - The running job.
+        stdout : BinaryIO - The stdout of its subprocess.
+        """
+        with stdout:
+            for line in stdout:
+                try:
+                    done, total, model = json_loads(line)
+                except ValueError:
+                    # Printed before JobProcessMain moved stdout to stderr, e.g. by an __init__ of a package
+                    continue
+                with self.condition_:
+                    job.progress_ = (int(done), int(total), str(model))
+
+    def Signal(self, *, process : Popen, kill : bool) -> None:
+        """
+        Terminate or kill the process group of a job, the job process and every process it started (e.g. DataLoader workers).
+
+        Args:
+        process : Popen - The job subprocess, leader of its group.
+        kill : bool - SIGKILL instead of SIGTERM.
+        """
+        if sys.platform == "win32":
+            if process.poll() is None:
+                Popen(["taskkill", "/T", "/F", "/PID", str(process.pid)]).wait()
+            return
+        try:
+            os.killpg(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            # The group is gone, every process of the job has exited
+            pass
+
+    def Finish(self, *, job : TrainJob) -> None:
+        """
+        Record a finished job and forget the oldest finished jobs beyond max_finished, the caller holds condition_.
+
+        Args:
+        job : TrainJob - The job that just finished.
+        """
+        self.finished_.append(job.job_id_)
+        while len(self.finished_) > self.max_finished_:
+            self.jobs_.pop(self.finished_.popleft(), None)
+
+    def Loop(self) -> None:
+        """
+        Monitor thread, collects finished subprocesses, kills cancelled ones past their grace time and starts queued jobs in free slots.
+        """
+        while True:
+            with self.condition_:
+                for job in list(self.jobs_.values()):
+                    if job.process_ is None:
+                        continue
+                    exitcode = job.process_.poll()
+                    if exitcode is None:
+                        if job.cancelled_ is not None and time() - job.cancelled_ >= self.CANCEL_GRACE_S:
+                            self.Signal(process=job.process_, kill=True)
+                        continue
+                    # Children the job left behind are in its group
+                    self.Signal(process=job.process_, kill=True)
+                    job.finished_ = time()
+                    if job.status_ == TrainJobManager.JobStatusEnum.running_:
+                        if exitcode == 0:
+                            job.status_ = TrainJobManager.JobStatusEnum.succeeded_
+                        else:
+                            job.status_ = TrainJobManager.JobStatusEnum.failed_
+                            job.error_ = f"Exit code {exitcode}"
+                    job.process_ = None
+                    self.Finish(job=job)
+
+                while self.queue_ and self.Running() < self.max_running_:
+                    self.Start(job=self.jobs_[self.queue_.popleft()])
+
+                self.condition_.wait(timeout=self.MONITOR_INTERVAL_S)
+
+if __name__ == "__main__":
+    JobProcessMain()
@@ -0,0 +1,102 @@
+from typing import Any, Optional
+from importlib import import_module
+from subprocess import run
+from sys import executable
+from threading import Lock
+
+class LazyImport:
+    """
+    The LazyImport class names a module attribute and imports it on first use, so a module can list heavy
+    dependencies (model classes, loggers, enums of other packages) without importing them at its own import time.
+
+    Attributes:
+    path_ : str - "package.module:Attribute" or "package.module:Attribute.member".
+    value_ : Any - The resolved attribute, None until Resolve.
+    resolved_ : bool - Whether value_ is set (the attribute itself may be None).
+    lock_ : Lock - Guards the first import.
+
+    Example:
+    >>> cflow = LazyImport("anomalib.models:Cflow")
+    >>> model = cflow.Resolve()(backbone="wide_resnet50_2")
+    >>> LazyImport("anomalib.deploy:ExportType.TORCH").Resolve()
+    <ExportType.TORCH: 'torch'>
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initialize the LazyImport class, nothing is imported yet.
+
+        Args:
+        path : str - "package.module:Attribute", the attribute may be dotted.
+        """
+        assert ":" in path, "Path must be 'module:attribute'"
+        self.path_ : str = path
+        self.value_ : Any = None
+        self.resolved_ : bool = False
+        self.lock_ : Lock = Lock()
+
+    def Resolve(self) -> Any:
+        """
+        Import the module on the first call and get the attribute.
+
+        Returns:
+        Any - The attribute.
+        """
+        if self.resolved_:
+            return self.value_
+        with self.lock_:
+            if not self.resolved_:
+                module_name, _, attribute = self.path_.partition(":")
+                value : Any = import_module(module_name)
+                for name in attribute.split("."):
+                    value = getattr(value, name)
+                self.value_ = value
+                self.resolved_ = True
+        return self.value_
+
+    def __repr__(self) -> str:
+        return f"LazyImport({self.path_!r})"
+
+def Resolved(value: Any) -> Any:
+    """
+    Resolve a value that may be a LazyImport, other values are returned as they are.
+
+    Args:
+    value : Any - A LazyImport or any value.
+
+    Returns:
+    Any - The attribute of the LazyImport, or the value.
+    """
+    return value.Resolve() if isinstance(value, LazyImport) else value
+
+def ImportCost(module: str, *, top: Optional[int] = 15) -> tuple[float, list[tuple[str, float]]]:
+    """
+    Measure the cost of importing a module from a cold interpreter, with python -X importtime in a subprocess,
+    so modules already imported by the caller do not hide their cost.
+
+    Args:
+    module : str - The module to import, e.g. "server".
+    top : Optional[int] - Number of most expensive modules returned, None for all. Default is 15.
+
+    Returns:
+    tuple[float, list[tuple[str, float]]] - The total import time in ms, and the modules with their own import time in ms, most expensive first.
+
+    Example:
+    >>> total_ms, modules = ImportCost("server")
+    >>> print(f"server imports in {total_ms:.0f} ms, {modules[0][0]} costs {modules[0][1]:.0f} ms")
+    """
+    completed = run([executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+    assert completed.returncode == 0, f"Importing {module} failed: {completed.stderr.strip().splitlines()[-1:]}"
+
+    total_ms : float = 0.0
+    modules : list[tuple[str, float]] = []
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules.append((name.strip(), int(self_us) / 1000))
+        if name.strip() == module:
+            total_ms = int(cumulative_us) / 1000
+    modules.sort(key=lambda item: item[1], reverse=True)
+    return total_ms, modules if top is None else modules[:top]
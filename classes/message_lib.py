@@ -2,15 +2,15 @@ from typing import Callable, Any
 from sys import stderr
 from enum import Enum
 from discord import Message, Webhook
-from aiohttp import ClientSession
 from classes.discord_lib import MessageObject
+from classes.session_lib import SESSION_POOL
 
 INIT_PHRASE : str = "ginie"
 
 # Webhook 
 async def WebhookSend(webhook_url : str, *, message_object: MessageObject) -> None:
     """
-    Sends a message to the webhook URL.
+    Sends a message to the webhook URL, over the pooled session of the running loop (see classes/session_lib.py).
 
     Args:
     - webhook_url (str): The URL of the webhook.
@@ -29,8 +29,7 @@ async def WebhookSend(webhook_url : str, *, message_object: MessageObject) -> No
         conv_dict["file"] = message_object.file_
 
     try:
-        async with ClientSession() as session:
-            await Webhook.from_url(webhook_url, session=session).send(**conv_dict)# type: ignore
+        await Webhook.from_url(webhook_url, session=SESSION_POOL.Session()).send(**conv_dict)# type: ignore
     except Exception as e:
         print(f"Error: {e}", file=stderr)
 
@@ -0,0 +1,179 @@
+from typing import Final, Iterator
+from contextlib import contextmanager
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+from os import register_at_fork
+
+class LatencyHistogram:
+    """
+    The LatencyHistogram class counts latencies into fixed buckets, so recording is O(log buckets) and memory does not grow
+    with the number of requests. Quantiles are estimated by linear interpolation inside the bucket they fall into.
+
+    Constants:
+    BUCKETS_S : tuple[float, ...] - Upper bounds of the buckets in seconds, the last bucket (+Inf) is implicit.
+
+    Attributes:
+    counts_ : list[int] - Observations per bucket, not cumulative, one more than BUCKETS_S for +Inf.
+    sum_ : float - Sum of every observation in seconds.
+    count_ : int - Number of observations.
+
+    Example:
+    >>> histogram = LatencyHistogram()
+    >>> histogram.Observe(seconds=0.012)
+    >>> histogram.Quantile(quantile=0.5)
+    """
+
+    BUCKETS_S : Final[tuple[float, ...]] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self) -> None:
+        """
+        Initialize the LatencyHistogram class.
+        """
+        self.counts_ : list[int] = [0] * (len(self.BUCKETS_S) + 1)
+        self.sum_ : float = 0.0
+        self.count_ : int = 0
+
+    def Observe(self, *, seconds: float) -> None:
+        """
+        Record one latency, the caller serialises calls.
+
+        Args:
+        seconds : float - The latency in seconds.
+        """
+        self.counts_[bisect_left(self.BUCKETS_S, seconds)] += 1
+        self.sum_ += seconds
+        self.count_ += 1
+
+    def Quantile(self, *, quantile: float) -> float:
+        """
+        Estimate a quantile of the recorded latencies.
+
+        Args:
+        quantile : float - The quantile in [0, 1], e.g. 0.95.
+
+        Returns:
+        float - The latency in seconds, 0 with no observations, the largest bound when it falls in the +Inf bucket.
+        """
+        if self.count_ == 0:
+            return 0.0
+        rank = quantile * self.count_
+        seen = 0
+        for index, count in enumerate(self.counts_):
+            if count > 0 and seen + count >= rank:
+                if index == len(self.BUCKETS_S):
+                    return self.BUCKETS_S[-1]
+                lower = self.BUCKETS_S[index - 1] if index > 0 else 0.0
+                return lower + (self.BUCKETS_S[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.BUCKETS_S[-1]
+
+class StageMetrics:
+    """
+    The StageMetrics class keeps one latency histogram per stage, model and week, and renders them
+    in the Prometheus text exposition format. A scrape copies each histogram under the lock and formats
+    outside of it, so scraping never holds up a request for longer than the copy.
+
+    Constants:
+    QUANTILES : tuple[float, ...] - Quantiles exported next to the histograms.
+    METRIC_NAME : str - Name of the exported histogram.
+
+    Attributes:
+    histograms_ : dict[tuple[str, str, str], LatencyHistogram] - The histograms by (stage, model, week).
+    lock_ : Lock - Guards histograms_ and their contents.
+
+    Example:
+    >>> with STAGE_METRICS.Timer(stage="decode", model="cflow", week="3"):
+    >>>     image = image_unit.DecodeImage(data, ImageUnit.ColorModeEnum.rgb_)
+    >>> STAGE_METRICS.Render()
+    """
+
+    QUANTILES : Final[tuple[float, ...]] = (0.5, 0.95, 0.99)
+    METRIC_NAME : Final[str] = "predict_stage_seconds"
+
+    def __init__(self) -> None:
+        """
+        Initialize the StageMetrics class.
+        """
+        self.histograms_ : dict[tuple[str, str, str], LatencyHistogram] = {}
+        self.lock_ : Lock = Lock()
+        register_at_fork(after_in_child=self.AfterFork)
+
+    def AfterFork(self) -> None:
+        """
+        Give a forked inference worker a fresh lock, a request thread of the parent may have held it at the time of the fork.
+        """
+        self.lock_ = Lock()
+
+    def Observe(self, *, stage: str, model: str, week: str, seconds: float) -> None:
+        """
+        Record the latency of one stage.
+
+        Args:
+        stage : str - The stage, e.g. "decode" or "render".
+        model : str - The model type, e.g. "cflow".
+        week : str - The model week, e.g. "3".
+        seconds : float - The latency in seconds.
+        """
+        key = (stage, model, week)
+        with self.lock_:
+            histogram = self.histograms_.get(key)
+            if histogram is None:
+                histogram = self.histograms_[key] = LatencyHistogram()
+            histogram.Observe(seconds=seconds)
+
+    @contextmanager
+    def Timer(self, *, stage: str, model: str, week: str) -> Iterator[None]:
+        """
+        Time the body of a with block as one stage, recorded even when the body raises.
+
+        Args:
+        stage : str - The stage.
+        model : str - The model type.
+        week : str - The model week.
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.Observe(stage=stage, model=model, week=week, seconds=perf_counter() - start)
+
+    def Render(self) -> str:
+        """
+        Render every histogram in the Prometheus text format, plus a gauge of the estimated p50/p95/p99.
+
+        Returns:
+        str - The exposition, newline terminated.
+        """
+        with self.lock_:
+            snapshot : list[tuple[tuple[str, str, str], list[int], float, int]] = [
+                (key, list(histogram.counts_), histogram.sum_, histogram.count_) for key, histogram in sorted(self.histograms_.items())
+            ]
+
+        lines : list[str] = [
+            f"# HELP {self.METRIC_NAME} Latency of each stage of /predict and of AnomalibTest evaluation.",
+            f"# TYPE {self.METRIC_NAME} histogram"
+        ]
+        quantile_lines : list[str] = [
+            f"# HELP {self.METRIC_NAME}_quantile Estimated latency quantiles of each stage, from the histogram buckets.",
+            f"# TYPE {self.METRIC_NAME}_quantile gauge"
+        ]
+        for (stage, model, week), counts, total, count in snapshot:
+            labels = f'stage="{stage}",model="{model}",week="{week}"'
+            cumulative = 0
+            for bound, bucket_count in zip(LatencyHistogram.BUCKETS_S, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.METRIC_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.METRIC_NAME}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{self.METRIC_NAME}_sum{{{labels}}} {total}")
+            lines.append(f"{self.METRIC_NAME}_count{{{labels}}} {count}")
+
+            histogram = LatencyHistogram()
+            histogram.counts_, histogram.sum_, histogram.count_ = counts, total, count
+            for quantile in self.QUANTILES:
+                quantile_lines.append(f'{self.METRIC_NAME}_quantile{{{labels},quantile="{quantile}"}} {histogram.Quantile(quantile=quantile)}')
+
+        return "\n".join(lines + quantile_lines) + "\n"
+
+# Shared by the server routes and AnomalibTest, one per process
+STAGE_METRICS : StageMetrics = StageMetrics()
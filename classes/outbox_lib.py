@@ -0,0 +1,360 @@
+from typing import Any, Final, Optional
+from types import TracebackType
+from asyncio import Queue, Task, create_task, sleep, wait_for, TimeoutError as AsyncTimeoutError
+from json import dumps
+from sys import stderr
+from threading import Lock
+from time import monotonic
+from aiohttp import ClientError, FormData
+from discord import Embed, File
+from classes.discord_lib import MessageObject
+from classes.session_lib import SESSION_POOL
+
+class RateLimitBuckets:
+    """
+    The RateLimitBuckets class tracks the Discord rate limit buckets of webhooks from the X-RateLimit headers, so a sender
+    waits for the bucket to refill instead of being answered 429. Each call takes a token locally, so concurrent senders
+    to the same webhook do not all spend the last one. Shared by every loop and thread of the process.
+
+    Attributes:
+    webhook_bucket_ : dict[str, str] - The bucket of each webhook URL, from X-RateLimit-Bucket.
+    remaining_ : dict[str, int] - Calls left in each bucket (keyed by bucket, or by URL until the bucket is known).
+    reset_at_ : dict[str, float] - Monotonic time each bucket refills.
+    global_until_ : float - Monotonic time a global rate limit ends.
+    lock_ : Lock - Guards the buckets.
+
+    Example:
+    >>> delay = RATE_LIMITS.Acquire(webhook_url=webhook_url)
+    >>> if delay == 0:
+    >>>     response = await session.post(webhook_url, data=form_data)
+    >>>     RATE_LIMITS.Update(webhook_url=webhook_url, headers=response.headers)
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize the RateLimitBuckets class.
+        """
+        self.webhook_bucket_ : dict[str, str] = {}
+        self.remaining_ : dict[str, int] = {}
+        self.reset_at_ : dict[str, float] = {}
+        self.global_until_ : float = 0.0
+        self.lock_ : Lock = Lock()
+
+    def Acquire(self, *, webhook_url: str) -> float:
+        """
+        Take a token of the webhook's bucket.
+
+        Args:
+        webhook_url : str - The webhook URL.
+
+        Returns:
+        float - 0 when a token was taken, otherwise the seconds to wait before asking again.
+        """
+        now = monotonic()
+        with self.lock_:
+            if self.global_until_ > now:
+                return self.global_until_ - now
+            bucket = self.webhook_bucket_.get(webhook_url, webhook_url)
+            # Unknown or refilled buckets allow the call, the response tells the real budget
+            if bucket not in self.remaining_ or self.reset_at_[bucket] <= now:
+                self.remaining_.pop(bucket, None)
+                return 0.0
+            if self.remaining_[bucket] > 0:
+                self.remaining_[bucket] -= 1
+                return 0.0
+            return self.reset_at_[bucket] - now
+
+    def Update(self, *, webhook_url: str, headers: Any, retry_after: Optional[float] = None, is_global: bool = False) -> None:
+        """
+        Record the budget reported by a webhook response.
+
+        Args:
+        webhook_url : str - The webhook URL.
+        headers : Any - The response headers (a mapping).
+        retry_after : Optional[float] - Seconds from the body of a 429 response. Default is None.
+        is_global : bool - Whether the 429 is a global rate limit. Default is False.
+        """
+        now = monotonic()
+        with self.lock_:
+            if is_global and retry_after is not None:
+                self.global_until_ = max(self.global_until_, now + retry_after)
+                return
+            bucket = headers.get("X-RateLimit-Bucket")
+            if bucket:
+                self.webhook_bucket_[webhook_url] = bucket
+            bucket = self.webhook_bucket_.get(webhook_url, webhook_url)
+            try:
+                remaining = int(headers.get("X-RateLimit-Remaining", ""))
+                reset_after = float(headers.get("X-RateLimit-Reset-After", ""))
+            except ValueError:
+                remaining, reset_after = None, None
+            if retry_after is not None:
+                remaining, reset_after = 0, max(retry_after, reset_after or 0.0)
+            if remaining is not None and reset_after is not None:
+                self.remaining_[bucket] = remaining
+                self.reset_at_[bucket] = now + reset_after
+
+class WebhookOutbox:
+    """
+    The WebhookOutbox class queues the messages for one webhook and sends them from a background task, packing
+    consecutive messages into one webhook call: up to 10 embeds and 10 files, within the content, embed and upload size
+    limits of Discord. The first queued message waits up to LINGER_S for others to join its call, a full call is sent at once.
+    Calls wait for their rate limit bucket and are retried with backoff on 429, 5xx and connection errors.
+    Files that share a name are uploaded under a new one, and the attachment:// URLs of their embeds follow, the queued messages are not changed.
+
+    Constants:
+    MAX_EMBEDS : int - Embeds in one message.
+    MAX_FILES : int - Files in one message.
+    MAX_CONTENT : int - Characters of content in one message.
+    MAX_EMBED_CHARS : int - Characters over every embed of one message.
+    MAX_UPLOAD_BYTES : int - Bytes of files in one message, the limit of servers without boosts.
+    LINGER_S : float - Seconds the first queued message waits for others to join its call.
+    MAX_RETRIES : int - Times a failed call is sent again.
+    BACKOFF_S : float - Wait before the first retry of a failed call, doubled for each further retry.
+
+    Attributes:
+    webhook_url_ : str - The webhook.
+    queue_ : Optional[Queue[Optional[MessageObject]]] - Queued messages, None asks the sender to finish.
+    sender_ : Optional[Task] - The background sender.
+    calls_ : int - Webhook calls made.
+    sent_ : int - Messages delivered.
+
+    Example:
+    >>> async with WebhookOutbox(webhook_url=webhook_url) as outbox:
+    >>>     for message_object in message_objects:
+    >>>         outbox.Put(message_object=message_object)
+    >>> outbox.calls_
+    3
+    """
+
+    MAX_EMBEDS : Final[int] = 10
+    MAX_FILES : Final[int] = 10
+    MAX_CONTENT : Final[int] = 2000
+    MAX_EMBED_CHARS : Final[int] = 6000
+    MAX_UPLOAD_BYTES : Final[int] = 8 * 1024 * 1024
+    LINGER_S : Final[float] = 1.0
+    MAX_RETRIES : Final[int] = 5
+    BACKOFF_S : Final[float] = 1.0
+
+    def __init__(self, *, webhook_url: str) -> None:
+        """
+        Initialize the WebhookOutbox class, the sender starts with async with.
+
+        Args:
+        webhook_url : str - The webhook the messages are sent to.
+        """
+        self.webhook_url_ : str = webhook_url
+        self.queue_ : Optional[Queue[Optional[MessageObject]]] = None
+        self.sender_ : Optional[Task] = None
+        self.calls_ : int = 0
+        self.sent_ : int = 0
+
+    async def __aenter__(self) -> "WebhookOutbox":
+        self.queue_ = Queue()
+        self.sender_ = create_task(self.Sender())
+        return self
+
+    async def __aexit__(self, exc_type: Optional[type[BaseException]], exc: Optional[BaseException], traceback: Optional[TracebackType]) -> None:
+        await self.Close()
+
+    def Put(self, *, message_object: MessageObject) -> None:
+        """
+        Queue a message, never blocks. Empty messages are dropped.
+
+        Args:
+        message_object : MessageObject - The message, not to be changed once queued.
+        """
+        assert self.queue_ is not None, "Outbox is not started, use async with"
+        if not message_object.EmptyMessage():
+            self.queue_.put_nowait(message_object)
+
+    async def Close(self) -> None:
+        """
+        Send every queued message and stop the sender.
+        """
+        if self.queue_ is None or self.sender_ is None:
+            return
+        self.queue_.put_nowait(None)
+        await self.sender_
+        self.queue_, self.sender_ = None, None
+
+    async def Sender(self) -> None:
+        """
+        Background task, takes the queued messages in order and sends them in packed calls.
+        """
+        assert self.queue_ is not None, "Outbox is not started"
+        carry : Optional[MessageObject] = None
+        closing : bool = False
+        while True:
+            if carry is not None:
+                first, carry = carry, None
+            elif not self.queue_.empty() or not closing:
+                first = await self.queue_.get()
+            else:
+                return
+            if first is None:
+                return
+            pack : list[MessageObject] = [first]
+
+            deadline = monotonic() + self.LINGER_S
+            while len(pack) < self.MAX_EMBEDS:
+                if self.queue_.empty() and closing:
+                    break
+                try:
+                    # Take what is queued, then wait for the rest of the linger time
+                    message_object = self.queue_.get_nowait() if not self.queue_.empty() else await wait_for(self.queue_.get(), timeout=max(0.0, deadline - monotonic()))
+                except AsyncTimeoutError:
+                    break
+                if message_object is None:
+                    closing = True
+                    continue
+                if not self.Fits(pack=pack, message_object=message_object):
+                    carry = message_object
+                    break
+                pack.append(message_object)
+
+            await self.Send(pack=pack)
+
+    def Fits(self, *, pack: list[MessageObject], message_object: MessageObject) -> bool:
+        """
+        Check whether a message can join a pack without going over the limits of one Discord message.
+
+        Args:
+        pack : list[MessageObject] - The messages of the call.
+        message_object : MessageObject - The message to add.
+
+        Returns:
+        bool - True when it fits.
+        """
+        messages = pack + [message_object]
+        embeds = [message.embed_ for message in messages if message.embed_ is not None]
+        files = [message.file_ for message in messages if message.file_ is not None]
+        content = "\n".join(message.message_ for message in messages if message.message_ is not None)
+        return (
+            len(embeds) <= self.MAX_EMBEDS and
+            len(files) <= self.MAX_FILES and
+            len(content) <= self.MAX_CONTENT and
+            sum(len(embed) for embed in embeds) <= self.MAX_EMBED_CHARS and
+            sum(FileSize(file) for file in files) <= self.MAX_UPLOAD_BYTES
+        )
+
+    def Payload(self, *, pack: list[MessageObject]) -> tuple[dict[str, Any], list[tuple[str, bytes]]]:
+        """
+        Build the JSON payload of one webhook call, files that share a name are uploaded under a new one.
+        The queued messages are left unchanged: the new names only exist in the payload, the form parts and embed copies.
+        The files are read into memory, aiohttp closes file objects once uploaded and a retry must send them again.
+
+        Args:
+        pack : list[MessageObject] - The messages of the call.
+
+        Returns:
+        tuple[dict[str, Any], list[tuple[str, bytes]]] - The payload_json and the filename and content of each file, files[i] is attachment i.
+        """
+        contents : list[str] = []
+        embeds : list[Embed] = []
+        files : list[tuple[str, File]] = []
+        names : set[str] = set()
+        for message_object in pack:
+            if message_object.message_ is not None:
+                contents.append(message_object.message_)
+            embed = message_object.embed_
+            file = message_object.file_
+            if file is not None:
+                filename = file.filename
+                while filename in names:
+                    filename = f"{len(files)}_{filename}"
+                if filename != file.filename and embed is not None:
+                    embed = RenameAttachment(embed=embed, old=file.filename, new=filename)
+                names.add(filename)
+                files.append((filename, file))
+            if embed is not None:
+                embeds.append(embed)
+
+        payload : dict[str, Any] = {
+            "content": "\n".join(contents) or None,
+            "embeds": [embed.to_dict() for embed in embeds],
+            "attachments": [{"id": index, "filename": filename, "description": file.description} for index, (filename, file) in enumerate(files)]
+        }
+        uploads : list[tuple[str, bytes]] = []
+        for filename, file in files:
+            file.reset()
+            uploads.append((filename, file.fp.read()))
+            # Leave the stream where it was, for the next Payload of the same message
+            file.reset()
+        return payload, uploads
+
+    async def Send(self, *, pack: list[MessageObject]) -> None:
+        """
+        Send one packed call, waiting for the rate limit bucket and retrying with backoff.
+        Errors are printed like WebhookSend, the outbox keeps sending the next calls.
+
+        Args:
+        pack : list[MessageObject] - The messages of the call.
+        """
+        payload, files = self.Payload(pack=pack)
+        for attempt in range(self.MAX_RETRIES + 1):
+            delay = RATE_LIMITS.Acquire(webhook_url=self.webhook_url_)
+            while delay > 0:
+                await sleep(delay)
+                delay = RATE_LIMITS.Acquire(webhook_url=self.webhook_url_)
+
+            form_data = FormData()
+            form_data.add_field("payload_json", dumps(payload), content_type="application/json")
+            for index, (filename, data) in enumerate(files):
+                form_data.add_field(f"files[{index}]", data, filename=filename, content_type="application/octet-stream")
+
+            try:
+                async with SESSION_POOL.Session().post(self.webhook_url_, data=form_data) as response:
+                    self.calls_ += 1
+                    if response.status == 429:
+                        body = await response.json(content_type=None)
+                        RATE_LIMITS.Update(webhook_url=self.webhook_url_, headers=response.headers, retry_after=float(body.get("retry_after", 1.0)), is_global=bool(body.get("global", False)))
+                        continue
+                    RATE_LIMITS.Update(webhook_url=self.webhook_url_, headers=response.headers)
+                    if response.status < 300:
+                        self.sent_ += len(pack)
+                        return
+                    if response.status < 500:
+                        print(f"Error: webhook answered {response.status}: {await response.text()}", file=stderr)
+                        return
+            except (ClientError, AsyncTimeoutError) as e:
+                print(f"Error: {e}", file=stderr)
+            await sleep(self.BACKOFF_S * 2 ** attempt)
+        print(f"Error: webhook call of {len(pack)} messages dropped after {self.MAX_RETRIES} retries", file=stderr)
+
+def FileSize(file: File) -> int:
+    """
+    Get the bytes left to upload of a discord File, the position of its stream is kept.
+
+    Args:
+    file : File - The file.
+
+    Returns:
+    int - Size in bytes.
+    """
+    position = file.fp.tell()
+    size = file.fp.seek(0, 2) - position
+    file.fp.seek(position)
+    return size
+
+def RenameAttachment(*, embed: Embed, old: str, new: str) -> Embed:
+    """
+    Point the image and thumbnail of an embed at a renamed attachment.
+
+    Args:
+    embed : Embed - The embed, left unchanged.
+    old : str - The previous filename.
+    new : str - The new filename.
+
+    Returns:
+    Embed - A copy of the embed with the attachment:// URLs updated.
+    """
+    embed = embed.copy()
+    if embed.image.url == f"attachment://{old}":
+        embed.set_image(url=f"attachment://{new}")
+    if embed.thumbnail.url == f"attachment://{old}":
+        embed.set_thumbnail(url=f"attachment://{new}")
+    return embed
+
+# Rate limits are per webhook and shared by every outbox of the process
+RATE_LIMITS : RateLimitBuckets = RateLimitBuckets()
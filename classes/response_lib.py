@@ -0,0 +1,171 @@
+from typing import Any, Optional, AsyncIterator
+from enum import Enum, unique
+from asyncio import StreamReader, IncompleteReadError
+from base64 import b64encode
+from json import dumps
+from msgpack import packb, unpackb
+
+"""
+Wire format of the /predict response, shared by the Flask server and the Discord bot.
+
+The binary format is a sequence of frames, one per image.
+Each frame is a 4 byte big-endian length followed by a msgpack map:
+    {"message": str, "score": Optional[float], "image": bytes}
+The image is the raw PNG, no base64, so it is neither inflated nor copied twice.
+
+The streaming JSON format is NDJSON, one line per image:
+    {"message": str, "score": Optional[float], "image": str (base64 PNG)}
+
+Both streamed formats are written as soon as each image is scored. An error after the
+response has started is sent as a final frame or line of the form {"error": str}.
+"""
+
+FRAME_HEADER_SIZE : int = 4
+
+@unique
+class PredictFormatEnum(Enum):
+    """
+    Enum class for the response formats of /predict, the value is the mimetype used for content negotiation.
+
+    Attributes:
+    json_: JSON with base64 images, kept for backward compatibility
+    msgpack_: Length-prefixed msgpack frames with raw image bytes, streamed
+    ndjson_: One JSON line per image with a base64 image, streamed
+
+    Example:
+    >>> PredictFormatEnum.msgpack_.value
+    'application/x-msgpack'
+    """
+    json_ = "application/json"
+    msgpack_ = "application/x-msgpack"
+    ndjson_ = "application/x-ndjson"
+
+def PackFrame(*, message : str, score : Optional[float], image : bytes) -> bytes:
+    """
+    Pack the result of one image into a length-prefixed msgpack frame.
+
+    Args:
+    - message (str): The result string of the image.
+    - score (Optional[float]): The prediction score of the image.
+    - image (bytes): The encoded result image.
+
+    Returns:
+    - bytes: The frame.
+
+    Example:
+    >>> frame = PackFrame(message="pred_score: 0.2", score=0.2, image=png_bytes)
+    """
+    body : bytes = packb({"message": message, "score": score, "image": image}, use_bin_type=True)
+    return len(body).to_bytes(FRAME_HEADER_SIZE, "big") + body
+
+def PackErrorFrame(error : str) -> bytes:
+    """
+    Pack an error raised after the response has started into a final msgpack frame.
+
+    Args:
+    - error (str): The error message.
+
+    Returns:
+    - bytes: The frame.
+    """
+    body : bytes = packb({"error": error}, use_bin_type=True)
+    return len(body).to_bytes(FRAME_HEADER_SIZE, "big") + body
+
+def PackLine(*, message : str, score : Optional[float], image : bytes) -> bytes:
+    """
+    Pack the result of one image into an NDJSON line.
+
+    Args:
+    - message (str): The result string of the image.
+    - score (Optional[float]): The prediction score of the image.
+    - image (bytes): The encoded result image, base64 encoded into the line.
+
+    Returns:
+    - bytes: The line, newline terminated.
+    """
+    return dumps({"message": message, "score": score, "image": b64encode(image).decode("utf-8")}).encode("utf-8") + b"\n"
+
+def PackErrorLine(error : str) -> bytes:
+    """
+    Pack an error raised after the response has started into a final NDJSON line.
+
+    Args:
+    - error (str): The error message.
+
+    Returns:
+    - bytes: The line, newline terminated.
+    """
+    return dumps({"error": error}).encode("utf-8") + b"\n"
+
+def UnpackFrame(body : bytes) -> dict[str, Any]:
+    """
+    Unpack the body of one frame (without its length header).
+
+    Args:
+    - body (bytes): The msgpack body of the frame.
+
+    Returns:
+    - dict[str, Any]: The frame with the keys "message", "score" and "image".
+    """
+    return unpackb(body, raw=False)
+
+def UnpackFrames(data : bytes) -> list[dict[str, Any]]:
+    """
+    Unpack a complete buffer of frames.
+
+    Args:
+    - data (bytes): Concatenated frames.
+
+    Returns:
+    - list[dict[str, Any]]: The frames in order.
+
+    Raises:
+    - ValueError: The buffer ends inside a frame.
+
+    Example:
+    >>> frames = UnpackFrames(PackFrame(message="a", score=0.1, image=b"") + PackFrame(message="b", score=0.9, image=b""))
+    >>> [frame["message"] for frame in frames]
+    ['a', 'b']
+    """
+    frames : list[dict[str, Any]] = []
+    offset : int = 0
+    while offset < len(data):
+        if offset + FRAME_HEADER_SIZE > len(data):
+            raise ValueError("Truncated frame header")
+        size = int.from_bytes(data[offset:offset + FRAME_HEADER_SIZE], "big")
+        offset += FRAME_HEADER_SIZE
+        if offset + size > len(data):
+            raise ValueError("Truncated frame body")
+        frames.append(UnpackFrame(data[offset:offset + size]))
+        offset += size
+    return frames
+
+async def ReadFrames(stream : StreamReader) -> AsyncIterator[dict[str, Any]]:
+    """
+    Read frames one by one from a streamed response body, each frame is yielded as soon as it has fully arrived.
+
+    Args:
+    - stream (StreamReader): The response body, e.g. aiohttp ClientResponse.content.
+
+    Yields:
+    - dict[str, Any]: The frames in order.
+
+    Raises:
+    - ValueError: The body ends inside a frame.
+
+    Example:
+    >>> async for frame in ReadFrames(response.content):
+    >>>     print(frame["message"])
+    """
+    while True:
+        try:
+            header : bytes = await stream.readexactly(FRAME_HEADER_SIZE)
+        except IncompleteReadError as e:
+            if e.partial:
+                raise ValueError("Truncated frame header")
+            return
+        try:
+            body : bytes = await stream.readexactly(int.from_bytes(header, "big"))
+        except IncompleteReadError:
+            raise ValueError("Truncated frame body")
+        yield UnpackFrame(body)
@@ -0,0 +1,178 @@
+from typing import Any, Callable, Hashable, Optional
+from threading import Condition, Semaphore, Thread
+from concurrent.futures import Executor, Future
+from time import monotonic
+
+class BatchScheduler:
+    """
+    The BatchScheduler class collects items submitted from many request threads and runs them together in batches.
+    Items are grouped by key (e.g. the model), a batch is dispatched when it reaches max_batch items
+    or when its oldest item has waited max_wait_ms, whichever comes first.
+    Each item gets its own Future, so every request only waits for its own results.
+    Batches run on the dispatcher thread, or on an executor (e.g. InferencePool) with at most max_in_flight at once,
+    while every slot is busy new items keep joining the pending batches.
+
+    Attributes:
+    run_batch_ : Callable[[Hashable, list[Any]], list[Any]] - Runs one batch for a key, returns one result per item in order.
+    max_wait_s_ : float - Longest time an item waits for more items to join its batch.
+    max_batch_ : int - Most items in one batch.
+    pending_ : dict[Hashable, list[tuple[Any, Future]]] - Items waiting per key, oldest first.
+    arrival_ : dict[Hashable, float] - Arrival time of the oldest pending item per key.
+    condition_ : Condition - Guards pending_ and wakes the dispatcher.
+    thread_ : Optional[Thread] - The dispatcher thread, started on the first Submit.
+    executor_ : Optional[Executor] - Runs the batches, None to run them on the dispatcher thread.
+    slots_ : Semaphore - Free batch slots, max_in_flight in total.
+
+    Example:
+    >>> scheduler = BatchScheduler(run_batch=lambda key, items: [item * 2 for item in items], max_wait_ms=10, max_batch=8)
+    >>> future = scheduler.Submit(key="double", item=21)
+    >>> future.result()
+    42
+    """
+
+    def __init__(self, *, run_batch: Callable[[Hashable, list[Any]], list[Any]], max_wait_ms: float = 10, max_batch: int = 8, executor: Optional[Executor] = None, max_in_flight: int = 1) -> None:
+        """
+        Initialize the BatchScheduler class.
+
+        Args:
+        run_batch : Callable[[Hashable, list[Any]], list[Any]] - Runs one batch for a key, returns one result per item in order.
+        max_wait_ms : float - Longest time in milliseconds an item waits for more items. Default is 10.
+        max_batch : int - Most items in one batch. Default is 8.
+        executor : Optional[Executor] - Runs the batches, run_batch must then be picklable for process pools. Default is None (dispatcher thread).
+        max_in_flight : int - Most batches running at once on the executor, usually its worker count. Default is 1.
+        """
+        assert max_wait_ms >= 0, "max_wait_ms must not be negative"
+        assert max_batch > 0, "max_batch must be positive"
+        assert max_in_flight > 0, "max_in_flight must be positive"
+        self.run_batch_ : Callable[[Hashable, list[Any]], list[Any]] = run_batch
+        self.max_wait_s_ : float = max_wait_ms / 1000
+        self.max_batch_ : int = max_batch
+        self.pending_ : dict[Hashable, list[tuple[Any, Future]]] = {}
+        self.arrival_ : dict[Hashable, float] = {}
+        self.condition_ : Condition = Condition()
+        self.thread_ : Optional[Thread] = None
+        self.executor_ : Optional[Executor] = executor
+        self.slots_ : Semaphore = Semaphore(max_in_flight if executor is not None else 1)
+
+    def Submit(self, *, key: Hashable, item: Any) -> Future:
+        """
+        Queue one item for the batch of its key.
+
+        Args:
+        key : Hashable - Items with the same key are batched together.
+        item : Any - The item passed to run_batch.
+
+        Returns:
+        Future - Resolves to the result of the item, or raises the error of its batch.
+        """
+        future : Future = Future()
+        with self.condition_:
+            if self.thread_ is None:
+                self.thread_ = Thread(target=self.Loop, name="BatchScheduler", daemon=True)
+                self.thread_.start()
+            if key not in self.pending_:
+                self.pending_[key] = []
+                self.arrival_[key] = monotonic()
+            self.pending_[key].append((item, future))
+            self.condition_.notify()
+        return future
+
+    def Pending(self) -> int:
+        """
+        Get the number of items waiting to be dispatched.
+
+        Returns:
+        int - Number of queued items over all keys.
+        """
+        with self.condition_:
+            return sum(len(items) for items in self.pending_.values())
+
+    def NextBatch(self) -> tuple[Hashable, list[tuple[Any, Future]]]:
+        """
+        Block until a batch is ready and take it off the queue.
+        The ready key whose oldest item arrived first is served first.
+
+        Returns:
+        tuple[Hashable, list[tuple[Any, Future]]] - The key and its items.
+        """
+        with self.condition_:
+            while True:
+                now = monotonic()
+                ready = [key for key, items in self.pending_.items() if len(items) >= self.max_batch_ or now - self.arrival_[key] >= self.max_wait_s_]
+                if ready:
+                    key = min(ready, key=lambda ready_key: self.arrival_[ready_key])
+                    batch = self.pending_[key][:self.max_batch_]
+                    remaining = self.pending_[key][self.max_batch_:]
+                    if remaining:
+                        # Leftovers are already overdue, keep the old arrival so they go out next
+                        self.pending_[key] = remaining
+                    else:
+                        del self.pending_[key]
+                        del self.arrival_[key]
+                    return key, batch
+
+                if self.pending_:
+                    oldest = min(self.arrival_.values())
+                    self.condition_.wait(timeout=max(0.0, oldest + self.max_wait_s_ - now))
+                else:
+                    self.condition_.wait()
+
+    def Loop(self) -> None:
+        """
+        Dispatcher thread, waits for a free slot, takes the next batch and runs it inline or on the executor.
+        """
+        while True:
+            self.slots_.acquire()
+            key, batch = self.NextBatch()
+            items = [item for item, _ in batch]
+            if self.executor_ is None:
+                self.Complete(batch=batch, future=None, results=self.RunBatch(key=key, items=items))
+                continue
+            try:
+                batch_future = self.executor_.submit(self.run_batch_, key, items)
+            except Exception as e:
+                self.Complete(batch=batch, future=None, results=e)
+                continue
+            batch_future.add_done_callback(lambda done, batch=batch: self.Complete(batch=batch, future=done, results=None))
+
+    def RunBatch(self, *, key: Hashable, items: list[Any]) -> list[Any] | Exception:
+        """
+        Run one batch on the dispatcher thread.
+
+        Args:
+        key : Hashable - The key of the batch.
+        items : list[Any] - The items of the batch.
+
+        Returns:
+        list[Any] | Exception - The results, or the error of the batch.
+        """
+        try:
+            return self.run_batch_(key, items)
+        except Exception as e:
+            return e
+
+    def Complete(self, *, batch: list[tuple[Any, Future]], future: Optional[Future], results: Optional[list[Any] | Exception]) -> None:
+        """
+        Fan the results of a finished batch back out to the futures of its items and free its slot.
+
+        Args:
+        batch : list[tuple[Any, Future]] - The items of the batch with their futures.
+        future : Optional[Future] - The executor future of the batch, read when results is None.
+        results : Optional[list[Any] | Exception] - The results or the error of the batch.
+        """
+        try:
+            if future is not None:
+                try:
+                    results = future.result()
+                except Exception as e:
+                    results = e
+            if not isinstance(results, Exception) and (results is None or len(results) != len(batch)):
+                results = AssertionError("run_batch must return one result per item")
+            if isinstance(results, Exception):
+                for _, item_future in batch:
+                    item_future.set_exception(results)
+                return
+            for (_, item_future), result in zip(batch, results):
+                item_future.set_result(result)
+        finally:
+            self.slots_.release()
@@ -0,0 +1,133 @@
+from typing import Awaitable, Final, TypeVar
+from asyncio import AbstractEventLoop, get_running_loop, run_coroutine_threadsafe
+from atexit import register
+from os import register_at_fork
+from threading import Lock
+from aiohttp import ClientSession, TCPConnector
+
+T = TypeVar("T")
+
+class SessionPool:
+    """
+    The SessionPool class keeps one long-lived aiohttp ClientSession per event loop, so webhook and server requests reuse
+    kept-alive connections and cached DNS instead of opening a new connection pool and TLS handshake for every message.
+    A session belongs to the loop it was created on, the bot has one loop and the server one per request thread.
+
+    Constants:
+    LIMIT : int - Most open connections of one session.
+    LIMIT_PER_HOST : int - Most open connections of one session to the same host.
+    KEEPALIVE_TIMEOUT_S : float - Seconds an idle connection is kept for reuse.
+    DNS_CACHE_TTL_S : int - Seconds a resolved host is cached.
+
+    Attributes:
+    sessions_ : dict[AbstractEventLoop, ClientSession] - The session of each loop.
+    lock_ : Lock - Guards sessions_.
+
+    Example:
+    >>> session = SESSION_POOL.Session()
+    >>> async with session.post("http://127.0.0.1:5000/predict_setup", data=form_data) as response:
+    >>>     print(response.status)
+    >>> await SESSION_POOL.Close()
+    """
+
+    LIMIT : Final[int] = 100
+    LIMIT_PER_HOST : Final[int] = 20
+    KEEPALIVE_TIMEOUT_S : Final[float] = 60.0
+    DNS_CACHE_TTL_S : Final[int] = 300
+
+    def __init__(self) -> None:
+        """
+        Initialize the SessionPool class, sessions are created on first use in each loop.
+        """
+        self.sessions_ : dict[AbstractEventLoop, ClientSession] = {}
+        self.lock_ : Lock = Lock()
+        register_at_fork(after_in_child=self.AfterFork)
+
+    def AfterFork(self) -> None:
+        """
+        Forget the sessions in a forked child, their sockets belong to the parent and must not be closed or reused here.
+        """
+        self.sessions_ = {}
+        self.lock_ = Lock()
+
+    def Session(self) -> ClientSession:
+        """
+        Get the session of the running loop, created on first use. Must be called from a coroutine.
+        The session is shared, close the responses (async with) but never the session itself.
+
+        Returns:
+        ClientSession - The session of the running loop.
+        """
+        loop = get_running_loop()
+        with self.lock_:
+            # Loops closed without Close (e.g. a finished asyncio.run) leave a dead session behind
+            for closed_loop in [key for key in self.sessions_ if key.is_closed()]:
+                del self.sessions_[closed_loop]
+            session = self.sessions_.get(loop)
+            if session is None or session.closed:
+                connector = TCPConnector(limit=self.LIMIT, limit_per_host=self.LIMIT_PER_HOST, keepalive_timeout=self.KEEPALIVE_TIMEOUT_S, ttl_dns_cache=self.DNS_CACHE_TTL_S)
+                session = self.sessions_[loop] = ClientSession(connector=connector)
+        return session
+
+    async def Close(self) -> None:
+        """
+        Close the session of the running loop, run it before the loop stops.
+        """
+        with self.lock_:
+            session = self.sessions_.pop(get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    def Shutdown(self, *, timeout_s: float = 5.0) -> None:
+        """
+        Close the sessions of every loop still open, registered to run at interpreter exit.
+        Idle loops are run until their session is closed, running loops are asked to close it from their own thread.
+
+        Args:
+        timeout_s : float - Seconds to wait for a running loop to close its session. Default is 5.
+        """
+        with self.lock_:
+            sessions, self.sessions_ = self.sessions_, {}
+        for loop, session in sessions.items():
+            if session.closed or loop.is_closed():
+                continue
+            try:
+                if loop.is_running():
+                    run_coroutine_threadsafe(session.close(), loop).result(timeout=timeout_s)
+                else:
+                    loop.run_until_complete(session.close())
+            except Exception:
+                # Exiting anyway, the sockets are closed with the process
+                pass
+
+    def Stats(self) -> dict[str, int]:
+        """
+        Get the number of sessions.
+
+        Returns:
+        dict[str, int] - sessions, the number of open sessions.
+        """
+        with self.lock_:
+            return {"sessions": sum(1 for session in self.sessions_.values() if not session.closed)}
+
+async def ClosingSessions(awaitable: Awaitable[T]) -> T:
+    """
+    Await a coroutine and close the session of the running loop afterwards, for entry points run with asyncio.run.
+
+    Args:
+    awaitable : Awaitable[T] - The main coroutine.
+
+    Returns:
+    T - Its result.
+
+    Example:
+    >>> run(ClosingSessions(RunModelAsync(...)))
+    """
+    try:
+        return await awaitable
+    finally:
+        await SESSION_POOL.Close()
+
+# Shared by WebhookSend and the bot commands, one per process
+SESSION_POOL : SessionPool = SessionPool()
+register(SESSION_POOL.Shutdown)
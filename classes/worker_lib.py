@@ -0,0 +1,143 @@
+from typing import Any, Callable, Optional
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from threading import Lock
+from os import cpu_count, getpid
+from gc import collect, freeze, unfreeze
+
+def WorkerInitialize(threads : int) -> None:
+    """
+    Run once in every worker after the fork, give each worker its share of the cores so they do not oversubscribe.
+
+    Args:
+    threads : int - Torch intra-op threads for this worker.
+    """
+    import torch
+
+    torch.set_num_threads(threads)
+
+def WorkerPing() -> int:
+    """
+    No-op task used to fork the workers up front.
+
+    Returns:
+    int - The process id of the worker.
+    """
+    return getpid()
+
+class InferencePool(Executor):
+    """
+    The InferencePool class runs inference batches in forked worker processes, so the Python parts of a batch
+    (pre/post-processing, rendering inputs) are not serialised by the GIL of the server process.
+
+    Models are loaded in the parent before Start, the workers are forked from it and share the weights copy-on-write,
+    so resident memory does not grow with the number of workers. gc.freeze moves every object allocated so far out of
+    the collector, otherwise a collection in a worker touches the object headers and copies their pages.
+    Tasks are load balanced by the executor, every idle worker takes the next batch.
+    When the parent loads or drops a model after Start, Sync forks new workers that share the new set of models,
+    the old workers finish the batches they were given and exit, so no worker loads a model of its own.
+
+    Attributes:
+    processes_ : int - Number of worker processes.
+    threads_ : int - Torch threads per worker.
+    executor_ : Optional[ProcessPoolExecutor] - The forked workers, None until Start.
+    generation_ : Optional[int] - The model set the workers were forked with (ModelRegistry.generation_), None until Start.
+    lock_ : Lock - Guards executor_ and generation_.
+
+    Example:
+    >>> model_registry.Get(types=ModelPathUnit.ModelTypeEnum.cflow_, week=ModelPathUnit.ModelWeekEnum.week3_)
+    >>> inference_pool = InferencePool(processes=4)
+    >>> inference_pool.Start(generation=model_registry.generation_)
+    >>> inference_pool.submit(RunPredictBatch, model_key, images).result()
+    >>> model_registry.Get(types=ModelPathUnit.ModelTypeEnum.patchcore_, week=ModelPathUnit.ModelWeekEnum.week8_)
+    >>> inference_pool.Sync(generation=model_registry.generation_)
+    """
+
+    def __init__(self, *, processes: int, threads: Optional[int] = None) -> None:
+        """
+        Initialize the InferencePool class.
+
+        Args:
+        processes : int - Number of worker processes.
+        threads : Optional[int] - Torch threads per worker. Default is the core count divided by processes.
+        """
+        assert processes > 0, "processes must be positive"
+        self.processes_ : int = processes
+        self.threads_ : int = threads if threads is not None else max(1, (cpu_count() or 1) // processes)
+        self.executor_ : Optional[ProcessPoolExecutor] = None
+        self.generation_ : Optional[int] = None
+        self.lock_ : Lock = Lock()
+
+    def Start(self, *, generation: int = 0) -> None:
+        """
+        Fork the workers now. Call after the models are loaded and before serving, so every resident model is shared.
+        Calling it again does nothing, use Sync once the models changed.
+
+        Args:
+        generation : int - The model set loaded in the parent, ModelRegistry.generation_. Default is 0.
+        """
+        with self.lock_:
+            if self.executor_ is None:
+                self.executor_ = self.Fork()
+                self.generation_ = generation
+
+    def Sync(self, *, generation: int) -> None:
+        """
+        Fork new workers when the parent loaded or dropped models since the workers were forked, then retire the old ones.
+        Batches already submitted keep running on the old workers, which exit once they are done.
+
+        Args:
+        generation : int - The model set loaded in the parent now, ModelRegistry.generation_.
+        """
+        with self.lock_:
+            if self.executor_ is not None and self.generation_ == generation:
+                return
+            retired = self.executor_
+            self.executor_ = self.Fork()
+            self.generation_ = generation
+        if retired is not None:
+            retired.shutdown(wait=False)
+
+    def Fork(self) -> ProcessPoolExecutor:
+        """
+        Fork a set of workers from the current state of the parent, the caller holds lock_.
+        Objects frozen for earlier workers are unfrozen first, so dropped models are collected before the fork.
+
+        Returns:
+        ProcessPoolExecutor - The started workers.
+        """
+        unfreeze()
+        collect()
+        freeze()
+        executor = ProcessPoolExecutor(max_workers=self.processes_, mp_context=get_context("fork"), initializer=WorkerInitialize, initargs=(self.threads_,))
+        # A fork context launches every worker on the first submit
+        wait([executor.submit(WorkerPing) for _ in range(self.processes_)])
+        return executor
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        """
+        Run fn(*args, **kwargs) in a worker, starting the workers first if Start was not called.
+        fn and its arguments are pickled, so fn must be a module level function.
+
+        Args:
+        fn : Callable[..., Any] - The function to run.
+
+        Returns:
+        Future - Resolves to the return value of fn.
+        """
+        self.Start()
+        assert self.executor_ is not None, "Pool is not started"
+        return self.executor_.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        """
+        Stop the workers.
+
+        Args:
+        wait : bool - Wait for running batches to finish. Default is True.
+        cancel_futures : bool - Cancel batches not started yet. Default is False.
+        """
+        with self.lock_:
+            if self.executor_ is not None:
+                self.executor_.shutdown(wait=wait, cancel_futures=cancel_futures)
+                self.executor_ = None
@@ -0,0 +1,46 @@
+from typing import Any, Callable
+from gunicorn.app.base import BaseApplication
+
+class GunicornServer(BaseApplication):
+    """
+    The GunicornServer class runs a WSGI application with gunicorn from Python, so `python server.py` needs no command line.
+    The application is created once in the gunicorn master (preload_app) and the workers are forked from it,
+    so the models it loads are shared copy-on-write by every worker. Each gthread worker serves `threads` requests at once
+    on its own thread pool, with keep-alive connections handled by its poller, no ASGI to WSGI bridge in between.
+    Gunicorn needs fork, Linux and macOS only.
+
+    Attributes:
+    app_factory_ : Callable[[], Any] - Creates the WSGI application, run in the master.
+    options_ : dict[str, Any] - Gunicorn settings, e.g. bind, workers, threads and keepalive.
+
+    Example:
+    >>> GunicornServer(app_factory=CreateApp, options={"bind": "127.0.0.1:5000", "workers": 1, "worker_class": "gthread", "threads": 16}).run()
+    """
+
+    def __init__(self, *, app_factory: Callable[[], Any], options: dict[str, Any]) -> None:
+        """
+        Initialize the GunicornServer class.
+
+        Args:
+        app_factory : Callable[[], Any] - Creates the WSGI application.
+        options : dict[str, Any] - Gunicorn settings, see https://docs.gunicorn.org/en/stable/settings.html.
+        """
+        self.app_factory_ : Callable[[], Any] = app_factory
+        self.options_ : dict[str, Any] = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        """
+        Apply options_ to the gunicorn settings, called by gunicorn.
+        """
+        for name, value in self.options_.items():
+            self.cfg.set(name, value)
+
+    def load(self) -> Any:
+        """
+        Create the application, called by gunicorn.
+
+        Returns:
+        Any - The WSGI application.
+        """
+        return self.app_factory_()
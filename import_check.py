@@ -0,0 +1,34 @@
+"""
+This file reports the import cost of the server and the discord bot,
+Heavy libraries (torch, anomalib, lightning, openvino, timm) are imported on first use, so they should not show up here.
+Run it before deploying, it exits with 1 when an entry point is over IMPORT_BUDGET_MS.
+"""
+
+from os import environ, getenv
+from sys import argv, exit
+from dotenv import load_dotenv
+from classes.lazy_lib import ImportCost
+
+def main() -> None:
+    """
+    Print the import time of each entry point and its most expensive modules.
+    The entry points default to server and app, others can be given as arguments, e.g. python import_check.py server.
+    """
+    load_dotenv()
+    budget_ms : float = float(getenv('IMPORT_BUDGET_MS', '0'))
+    # Importing server must not start inference worker processes
+    environ['INFERENCE_PROCESSES'] = '0'
+
+    over_budget : bool = False
+    for module in argv[1:] or ["server", "app"]:
+        total_ms, modules = ImportCost(module, top=int(getenv('IMPORT_CHECK_TOP', '15')))
+        print(f"{module}: {total_ms:.0f} ms")
+        for name, self_ms in modules:
+            print(f"  {self_ms:8.1f} ms  {name}")
+        if budget_ms > 0 and total_ms > budget_ms:
+            print(f"{module} is over the import budget of {budget_ms:.0f} ms")
+            over_budget = True
+    exit(1 if over_budget else 0)
+
+if __name__ == "__main__":
+    main()
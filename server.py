@@ -6,35 +6,218 @@
 # - k_constant_variable
 # - FunctionName
 
-from os import getenv, makedirs
-from os.path import join, exists
-from shutil import rmtree
-from uuid import uuid4
+from __future__ import annotations
+from os import getenv
 from dotenv import load_dotenv
-from asyncio import new_event_loop, set_event_loop
-from threading import Thread
-from sys import stderr
-from flask import request, Response
+from typing import Iterator, Optional, TYPE_CHECKING
+from concurrent.futures import Future
+from time import perf_counter
+from sys import stderr, platform
+from flask import request, Response, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 from io import BytesIO
 from base64 import b64encode
 from json import dumps  # Add this import for JSON serialization
 
 
-from anomalib_train import RunModelAsync
-from anomalib_test import AnomalibTest, ModelPathUnit
-from classes.flask_lib import Get, APP, Post
+from anomalib_train import RunModelProcess
+from anomalib_test import AnomalibTest, AnomalibEnsemble, ModelPathUnit, ModelRegistry, ModelKey, EnsembleKey, ModelLabels
+from classes.flask_lib import Get, APP, Post, AsyncFlask
 from classes.discord_lib import MessageObject
 from classes.message_lib import WebhookSend
 from classes.anomalib_lib import AnomalyModelUnit
-from classes.log_lib import LoggerWebhook
+from classes.dataset_lib import ImageUnit
+from classes.scheduler_lib import BatchScheduler
+from classes.worker_lib import InferencePool
+from classes.job_lib import TrainJobManager
+from classes.cache_lib import ResultCache, CachedResult
+from classes.admission_lib import AdmissionController
+from classes.metrics_lib import STAGE_METRICS
+from classes.response_lib import PredictFormatEnum, PackFrame, PackErrorFrame, PackLine, PackErrorLine
+from numpy import ndarray
+
+if TYPE_CHECKING:
+    from anomalib.utils.visualization.image import ImageResult
 
 
 
 # load the environment variables
 load_dotenv()
 link : str = str(getenv('CHANNEL_WEBHOOK_CLONE'))
-anomalib_test : AnomalibTest = AnomalibTest()
+# Comma separated artifacts to load, preferred first, e.g. "openvino,torch" (empty picks by device)
+model_backends : Optional[list[ModelPathUnit.ModelBackendEnum]] = [ModelPathUnit.ModelBackendEnum[f"{backend.strip()}_"] for backend in getenv('INFERENCE_BACKENDS', '').split(',') if backend.strip()] or None
+model_registry : ModelRegistry = ModelRegistry(memory_budget_mb=float(getenv('MODEL_MEMORY_BUDGET_MB', '4096')), batch_size=int(getenv('PREDICT_BATCH_SIZE', '8')), backends=model_backends, warmup=int(getenv('WARMUP_RUNS', '2')))
 model_path_unit : ModelPathUnit = ModelPathUnit()
+image_unit : ImageUnit = ImageUnit()
+result_cache : ResultCache = ResultCache(max_entries=int(getenv('RESULT_CACHE_ENTRIES', '256')), cache_dir=getenv('RESULT_CACHE_DIR') or None, max_disk_bytes=int(float(getenv('RESULT_CACHE_DISK_MB', '1024')) * 1024 * 1024))
+
+# Tile size (0 for the model input size), overlap and top-k of tiled inference
+Tiling = tuple[int, float, int]
+
+def RunPredictBatch(batch_key : tuple[ModelKey, bool, Optional[Tiling]], images : list[ndarray]) -> list[ImageResult] | list[tuple[float, Optional[bool]]]:
+    """
+    Run one cross-request batch of decoded images through the model of the key, full results or scores only,
+    each image downsized to the model or, with tiling, scored tile by tile at full resolution.
+    Called by predict_scheduler from its dispatcher thread, rendering stays in the request threads.
+    """
+    model_key, scores_only, tiling = batch_key
+    anomalib_test = model_registry.Get(types=model_key[0], week=model_key[1])
+    tensors = [anomalib_test.ArrayToTensor(image=image) for image in images]
+    if tiling is not None:
+        tile_size, overlap, top_k = tiling
+        results = [anomalib_test.PredictTiled(image=tensor, tile_size=tile_size or None, overlap=overlap, top_k=top_k) for tensor in tensors]
+        if scores_only:
+            return [(float(result.pred_score), bool(result.pred_label)) for result in results]
+        return results
+    if scores_only:
+        return anomalib_test.PredictScores(images=tensors)
+    return anomalib_test.PredictBatch(images=tensors)
+
+def RenderResult(result : ImageResult, labels : tuple[str, str]) -> Optional[CachedResult]:
+    """
+    Render a prediction and encode it as PNG, no model is needed (see AnomalibTest.Render).
+
+    Args:
+    result : ImageResult - The prediction.
+    labels : tuple[str, str] - Model and week the render and encode stages are recorded under.
+
+    Returns:
+    Optional[CachedResult] - The result string, the prediction score and the PNG bytes, None if there is nothing to display.
+    """
+    with STAGE_METRICS.Timer(stage="render", model=labels[0], week=labels[1]):
+        rendered = AnomalibTest.Render(result=result)
+    if rendered is None:
+        return None
+    result_image, result_string = rendered
+
+    # Save the result image as PNG (supports RGBA)
+    image_buffer = BytesIO()
+    with STAGE_METRICS.Timer(stage="encode", model=labels[0], week=labels[1]):
+        result_image.save(image_buffer, format="PNG")
+    return result_string, float(result.pred_score), image_buffer.getvalue()
+
+def RunRenderedBatch(batch_key : tuple[ModelKey, bool, Optional[Tiling]], images : list[ndarray]) -> list[Optional[CachedResult]] | list[tuple[float, Optional[bool]]]:
+    """
+    RunPredictBatch for the inference workers: full results are rendered in the worker, so only the result string,
+    the score and the PNG bytes are pickled back to the server process instead of every array of the ImageResult.
+    """
+    results = RunPredictBatch(batch_key, images)
+    if batch_key[1]:
+        return results # type: ignore
+    return [RenderResult(result, ModelLabels(batch_key[0])) for result in results] # type: ignore
+
+def RunEnsembleBatch(ensemble_key : EnsembleKey, images : list[ndarray]) -> list[tuple[ImageResult, dict[str, float]]]:
+    """
+    Run one cross-request batch of decoded images through the ensemble of the key, the combined result and the score
+    of every model per image. Called by ensemble_scheduler like RunPredictBatch.
+    """
+    anomalib_ensemble = model_registry.GetEnsemble(types=list(ensemble_key[0]), week=ensemble_key[1])
+    return anomalib_ensemble.PredictArrays(images=images)
+
+def RenderEnsembleResult(result : ImageResult, scores : dict[str, float], labels : tuple[str, str]) -> Optional[CachedResult]:
+    """
+    RenderResult for an ensemble, the result string ends with the normalized score of every model (see AnomalibEnsemble.Render).
+    """
+    with STAGE_METRICS.Timer(stage="render", model=labels[0], week=labels[1]):
+        rendered = AnomalibEnsemble.Render(result=result, scores=scores)
+    if rendered is None:
+        return None
+    result_image, result_string = rendered
+
+    image_buffer = BytesIO()
+    with STAGE_METRICS.Timer(stage="encode", model=labels[0], week=labels[1]):
+        result_image.save(image_buffer, format="PNG")
+    return result_string, float(result.pred_score), image_buffer.getvalue()
+
+def RunRenderedEnsembleBatch(ensemble_key : EnsembleKey, images : list[ndarray]) -> list[Optional[CachedResult]]:
+    """
+    RunEnsembleBatch for the inference workers, the results are rendered in the worker like RunRenderedBatch.
+    """
+    labels = ("ensemble", str(ensemble_key[1].value))
+    return [RenderEnsembleResult(result, scores, labels) for result, scores in RunEnsembleBatch(ensemble_key, images)]
+
+def SelectTiling() -> Optional[Tiling] | Response:
+    """
+    Read the optional tiled inference fields of a /predict request: 'tiled', 'tile_size', 'tile_overlap' and 'tile_top_k'.
+
+    Returns:
+    Optional[Tiling] | Response - The tiling, None when not tiled, or a JSON error response.
+    """
+    if request.values.get('tiled', '').lower() not in ('1', 'true', 'yes'):
+        return None
+    try:
+        tiling : Tiling = (int(request.values.get('tile_size', '0')), float(request.values.get('tile_overlap', '0.25')), int(request.values.get('tile_top_k', '1')))
+    except ValueError:
+        return Response(dumps({"messages": ["'tile_size' and 'tile_top_k' must be integers, 'tile_overlap' a number."], "images": []}), status=400, mimetype="application/json")
+    if tiling[0] < 0 or not 0 <= tiling[1] < 1 or tiling[2] < 1:
+        return Response(dumps({"messages": ["'tile_size' must not be negative, 'tile_overlap' must be in [0, 1) and 'tile_top_k' positive."], "images": []}), status=400, mimetype="application/json")
+    return tiling
+
+# Worker processes forked from this one for inference, 0 runs inference in this process
+inference_processes : int = int(getenv('INFERENCE_PROCESSES', '0'))
+inference_pool : Optional[InferencePool] = InferencePool(processes=inference_processes) if inference_processes > 0 else None
+train_job_manager : TrainJobManager = TrainJobManager(max_running=int(getenv('TRAIN_MAX_RUNNING', '1')), max_queued=int(getenv('TRAIN_MAX_QUEUED', '4')), niceness=int(getenv('TRAIN_NICE', '10')), threads=int(getenv('TRAIN_THREADS', '0')), max_finished=int(getenv('TRAIN_MAX_FINISHED', str(TrainJobManager.MAX_FINISHED))))
+# Workers render their results, the server process renders the results of its own batches in the request threads
+predict_scheduler : BatchScheduler = BatchScheduler(run_batch=RunRenderedBatch if inference_pool is not None else RunPredictBatch, max_wait_ms=float(getenv('PREDICT_MAX_WAIT_MS', '10')), max_batch=int(getenv('PREDICT_MAX_BATCH', '8')), executor=inference_pool, max_in_flight=max(1, inference_processes))
+# Ensembles are batched across requests the same way, on their own keys
+ensemble_scheduler : BatchScheduler = BatchScheduler(run_batch=RunRenderedEnsembleBatch if inference_pool is not None else RunEnsembleBatch, max_wait_ms=float(getenv('PREDICT_MAX_WAIT_MS', '10')), max_batch=int(getenv('PREDICT_MAX_BATCH', '8')), executor=inference_pool, max_in_flight=max(1, inference_processes))
+admission : AdmissionController = AdmissionController(max_images=int(getenv('PREDICT_MAX_IMAGES', '16')), max_bytes=int(getenv('PREDICT_MAX_BYTES', str(32 * 1024 * 1024))), max_in_flight=int(getenv('PREDICT_MAX_IN_FLIGHT', '64')), retry_after_s=int(getenv('PREDICT_RETRY_AFTER_S', '1')))
+# Werkzeug enforces the byte cap while the body is read, also for chunked uploads that carry no Content-Length
+APP.config["MAX_CONTENT_LENGTH"] = admission.max_bytes_
+
+@APP.errorhandler(RequestEntityTooLarge)
+def RequestTooLarge(error : RequestEntityTooLarge) -> Response:
+    """
+    Answer a body over PREDICT_MAX_BYTES with the JSON 413 of /predict instead of the HTML page of Flask.
+    """
+    return Response(dumps({"messages": [f"Request is over the limit of {admission.max_bytes_} bytes."], "images": []}), status=413, mimetype="application/json", headers=LoadHeaders())
+
+def PreloadModels() -> None:
+    """
+    Load the models listed in PRELOAD_MODELS (e.g. "cflow:3,patchcore:8"), the first is the default.
+    Must run before the server starts, so the server and inference workers share the preloaded models copy-on-write.
+    Models first requested later are loaded by LoadModel, which forks the inference workers again to share them.
+    """
+    for preload in getenv('PRELOAD_MODELS', '').split(','):
+        if not preload.strip():
+            continue
+        name, _, week = preload.strip().partition(':')
+        valid_result = model_path_unit.IsValid(types=name, week=int(week)) if week.isdigit() else None
+        assert valid_result, f"Invalid model in PRELOAD_MODELS: {preload}"
+        model_registry.Get(types=valid_result[0], week=valid_result[1])
+        if model_registry.default_key_ is None:
+            model_registry.SetDefault(types=valid_result[0], week=valid_result[1])
+
+def StartInference() -> None:
+    """
+    Fork the inference workers of this server process, once the models are preloaded and before it serves.
+    """
+    if inference_pool is not None:
+        inference_pool.Start(generation=model_registry.generation_)
+
+def LoadModel(model_key : ModelKey) -> None:
+    """
+    Load a model in the server process before its images are queued. With inference workers, fork them again
+    when the loaded models changed (a new model, a retrained one or an eviction), so the workers share the model
+    copy-on-write instead of each loading its own copy.
+
+    Args:
+    model_key : ModelKey - The model of the request.
+    """
+    model_registry.Get(types=model_key[0], week=model_key[1])
+    if inference_pool is not None:
+        inference_pool.Sync(generation=model_registry.generation_)
+
+def LoadEnsemble(ensemble_key : EnsembleKey) -> None:
+    """
+    LoadModel for an ensemble.
+
+    Args:
+    ensemble_key : EnsembleKey - The ensemble of the request.
+    """
+    model_registry.GetEnsemble(types=list(ensemble_key[0]), week=ensemble_key[1])
+    if inference_pool is not None:
+        inference_pool.Sync(generation=model_registry.generation_)
 
 # API Function from Server
 @Get
@@ -55,12 +238,7 @@ async def Index() -> str:
     await WebhookSend(webhook_url=link, message_object=message_object)
     return "Hello World"
 
-def RunLoopSync() -> None:
-    loop = new_event_loop()
-    set_event_loop(loop)
-    loop.run_until_complete(RunTrainAsync())
-
-async def RunTrainAsync() -> None:
+def TrainKwargs() -> dict:
     """
       ModelTypeFlag.ai_vad_ : False,
         ModelTypeFlag.cfa_ : True,
@@ -94,17 +272,42 @@ async def RunTrainAsync() -> None:
     # inverse for above
     #model_type_flag : AnomalyModelUnit.ModelTypeFlag = AnomalyModelUnit.ModelTypeFlag.cflow_ | AnomalyModelUnit.ModelTypeFlag.fastflow_ | AnomalyModelUnit.ModelTypeFlag.patchcore_
 
-    logger_instance : LoggerWebhook = LoggerWebhook(webhook_link=link, clone_cmd="~clone", close_cmd="~close")
+    # Arguments of RunModelProcess, the logger is created inside the training subprocess
+    return {"model_type_flag": model_type_flag, "name": "T5_Full_Individual_Filtered_Week_Unseen_Week3_Save_SimMutiAnomaly", "webhook_link": link}
 
-    await RunModelAsync(model_type_flag=model_type_flag, logger_instance_async=logger_instance, name="T5_Full_Individual_Filtered_Week_Unseen_Week3_Save_SimMutiAnomaly")
-
-   
 @Get 
-async def Train() -> str:
-    # cringe line here
-    Thread(target=RunLoopSync, daemon=True).start()
+async def Train() -> Response:
+    """
+    Handle the GET request to queue a training run, returns the job to poll on /train_status.
+    """
+    job = train_job_manager.Submit(name=request.args.get('name', 'train'), target=RunModelProcess, kwargs=TrainKwargs())
+    if job is None:
+        return Response(dumps({"messages": ["Training queue is full, try again later."]}), status=429, mimetype="application/json", headers={"Retry-After": "60"})
+    return Response(dumps(job.ToDict()), status=202, mimetype="application/json")
 
-    return "Training"
+@Get
+async def TrainStatus() -> Response:
+    """
+    Handle the GET request for the status and progress of one training job ('job_id'), or of every job.
+    """
+    job_id = request.args.get('job_id')
+    if not job_id:
+        return jsonify(train_job_manager.Jobs())
+    job = train_job_manager.Get(job_id=job_id)
+    if job is None:
+        return Response(dumps({"messages": [f"Unknown job: {job_id}"]}), status=404, mimetype="application/json")
+    return jsonify(job.ToDict())
+
+@Post
+async def TrainCancel() -> Response:
+    """
+    Handle the POST request to cancel a training job ('job_id'), queued or running.
+    """
+    job_id = request.form.get('job_id', '')
+    job = train_job_manager.Cancel(job_id=job_id)
+    if job is None:
+        return Response(dumps({"messages": [f"Unknown job: {job_id}"]}), status=404, mimetype="application/json")
+    return jsonify(job.ToDict())
 
 @Post
 async def PredictSetup() -> Response:
@@ -130,16 +333,159 @@ async def PredictSetup() -> Response:
 
     model_type_enum, model_week_enum = valid_result
 
-    # Run the setup for AnomalibTest
-    anomalib_test.Setup(model_path=model_path_unit.ModelPath(types=model_type_enum, week=model_week_enum))
+    # Load the model (kept resident in the registry) and use it as the default for /predict
+    model_registry.SetDefault(types=model_type_enum, week=model_week_enum)
+    LoadModel(model_registry.default_key_) # type: ignore
 
     return Response("Setup successful", status=200)
 
+def SelectModel() -> ModelKey | Response:
+    """
+    Resolve the model for a /predict request from the optional 'name' and 'week' form fields.
+
+    Returns:
+    ModelKey | Response - The key of the model, or a JSON error response.
+    """
+    week = request.form.get('week')
+    name = request.form.get('name')
+
+    if not week and not name:
+        if model_registry.default_key_ is None:
+            return Response(dumps({"messages": ["No model set up, call /predict_setup or pass 'name' and 'week'."], "images": []}), status=400, mimetype="application/json")
+        return model_registry.default_key_
+
+    if not week or not name:
+        return Response(dumps({"messages": ["Both 'week' and 'name' are required to select a model."], "images": []}), status=400, mimetype="application/json")
+
+    try:
+        week_int = int(week)
+    except ValueError:
+        return Response(dumps({"messages": ["'week' must be an integer."], "images": []}), status=400, mimetype="application/json")
+
+    valid_result = model_path_unit.IsValid(week=week_int, types=name)
+    if not valid_result:
+        return Response(dumps({"messages": ["Invalid model path for the provided 'week' and 'name'."], "images": []}), status=400, mimetype="application/json")
+
+    return valid_result
+
+def PredictResults(pending : list[tuple[str, Future | CachedResult]], labels : tuple[str, str], scores_only : bool = False) -> Iterator[CachedResult]:
+    """
+    Render the results of queued images one at a time, in upload order, as each one is scored.
+    Only the image being rendered is held as a PNG, so memory does not grow with the number of images.
+    Results rendered by the inference workers (RunRenderedBatch) are used as they are.
+    Cached results are passed through, new ones are added to result_cache.
+    With scores_only nothing is rendered or cached, every result has an empty image.
+
+    Args:
+    pending : list[tuple[str, Future | CachedResult]] - The cache key and either a future from predict_scheduler or the cached result, per image.
+    labels : tuple[str, str] - Model and week the render and encode stages are recorded under.
+    scores_only : bool - The futures resolve to (pred_score, pred_label) from AnomalibTest.PredictScores. Default is False.
+
+    Yields:
+    CachedResult - The result string, the prediction score and the PNG bytes (empty with scores_only).
+    """
+    for cache_key, item in pending:
+        if not isinstance(item, Future):
+            yield (item[0], item[1], b"") if scores_only else item
+            continue
+
+        if scores_only:
+            pred_score, pred_label = item.result()
+            yield f"pred_score: {pred_score}\npred_label: {pred_label}\n", pred_score, b""
+            continue
+
+        result = item.result()
+        cached = result if result is None or isinstance(result, tuple) else RenderResult(result, labels)
+        if cached is None:
+            continue
+        result_cache.Put(key=cache_key, result=cached)
+        yield cached
+
+def StreamResults(results : Iterator[CachedResult], response_format : PredictFormatEnum, labels : tuple[str, str], start : float) -> Iterator[bytes]:
+    """
+    Write each result as a msgpack frame or an NDJSON line as soon as it is ready.
+    The status line is already sent once streaming starts, so an error ends the stream with an error frame or line.
+
+    Args:
+    results : Iterator[CachedResult] - The results from PredictResults.
+    response_format : PredictFormatEnum - msgpack_ or ndjson_.
+    labels : tuple[str, str] - Model and week the serialize and total stages are recorded under.
+    start : float - perf_counter at the start of the request, for the total stage.
+
+    Yields:
+    bytes - One frame or line per image.
+    """
+    try:
+        for result_string, score, image_bytes in results:
+            with STAGE_METRICS.Timer(stage="serialize", model=labels[0], week=labels[1]):
+                if response_format == PredictFormatEnum.msgpack_:
+                    packed = PackFrame(message=result_string, score=score, image=image_bytes)
+                else:
+                    packed = PackLine(message=result_string, score=score, image=image_bytes)
+            yield packed
+    except Exception as e:
+        if response_format == PredictFormatEnum.msgpack_:
+            yield PackErrorFrame(f"Error processing images: {str(e)}")
+        else:
+            yield PackErrorLine(f"Error processing images: {str(e)}")
+    finally:
+        STAGE_METRICS.Observe(stage="total", model=labels[0], week=labels[1], seconds=perf_counter() - start)
+
+def LoadHeaders() -> dict[str, str]:
+    """
+    Headers telling the client how loaded the server is, so it can back off before it is refused.
+
+    Returns:
+    dict[str, str] - Images waiting for a batch and images in flight.
+    """
+    return {"X-Queue-Depth": str(predict_scheduler.Pending()), "X-In-Flight": str(admission.Stats()["in_flight"])}
+
+def ReleaseOnDone(future : Future, labels : tuple[str, str]) -> Future:
+    """
+    Give the in-flight capacity of one image back to admission once its inference has finished or failed,
+    and record the time from queueing to the end of its batch as the inference stage.
+
+    Args:
+    future : Future - The future of the image from predict_scheduler.
+    labels : tuple[str, str] - Model and week of the image.
+
+    Returns:
+    Future - The same future.
+    """
+    queued = perf_counter()
+    def Done(_ : Future) -> None:
+        STAGE_METRICS.Observe(stage="inference", model=labels[0], week=labels[1], seconds=perf_counter() - queued)
+        admission.Release(count=1)
+    future.add_done_callback(Done)
+    return future
+
 @Post
 async def Predict() -> Response:
     """
     Handle the POST request to predict anomalies from multiple images and return multiple messages and images as a response.
+
+    Optional form fields 'name' and 'week' select the model for this request, otherwise the model from /predict_setup is used.
+    The response is JSON with base64 images by default. With "Accept: application/x-msgpack" (raw PNG frames) or
+    "Accept: application/x-ndjson" (one JSON line per image) the results are streamed as each image is scored
+    (see classes/response_lib.py). Errors before the first result are always JSON.
+
+    Requests over PREDICT_MAX_BYTES or PREDICT_MAX_IMAGES are refused with 413, and with 503 and Retry-After while
+    PREDICT_MAX_IN_FLIGHT images are already queued or running. Every response carries X-Queue-Depth and X-In-Flight.
+
+    Each stage (read, cache, decode, inference, render, encode, serialize and total) is timed into STAGE_METRICS, see /metrics.
+
+    With the form field or query argument 'scores_only=true' only pred_score and pred_label are computed: no anomaly map
+    resizing, colouring, rendering or PNG encoding, and the results carry no image. Every JSON response also lists the scores.
+    With 'tiled=true' high resolution photos are scored tile by tile at full resolution (see AnomalibTest.PredictTiled),
+    'tile_size' (default the model input size), 'tile_overlap' (default 0.25) and 'tile_top_k' (default 1) configure it.
     """
+    start = perf_counter()
+
+    # Refuse oversized bodies before the upload is parsed
+    oversized = admission.CheckRequest(content_length=request.content_length, images=0)
+    if oversized is not None:
+        return Response(dumps({"messages": [oversized], "images": []}), status=413, mimetype="application/json", headers=LoadHeaders())
+
     if 'images' not in request.files:
         return Response(
             dumps({
@@ -150,54 +496,113 @@ async def Predict() -> Response:
             mimetype="application/json"
         )
 
+    # Select the model, either named by the request or the default from /predict_setup
+    model_key = SelectModel()
+    if isinstance(model_key, Response):
+        return model_key
+    model, week = labels = ModelLabels(model_key)
+    scores_only = request.values.get('scores_only', '').lower() in ('1', 'true', 'yes')
+    tiling = SelectTiling()
+    if isinstance(tiling, Response):
+        return tiling
+
     # Retrieve the image files from the request
     image_files = request.files.getlist('images')
+    oversized = admission.CheckRequest(content_length=request.content_length, images=len(image_files))
+    if oversized is not None:
+        return Response(dumps({"messages": [oversized], "images": []}), status=413, mimetype="application/json", headers=LoadHeaders())
 
-    # Create a temporary directory with a random name
-    temp_dir = join("testtest", str(uuid4()))
-    makedirs(temp_dir, exist_ok=True)
+    response_format = PredictFormatEnum(request.accept_mimetypes.best_match([response_format.value for response_format in PredictFormatEnum], default=PredictFormatEnum.json_.value))
 
     response_messages = []
     response_images = []
+    response_scores = []
 
     try:
-        # Save each image to the temporary directory
+        # Look each upload up in the result cache, only the misses need the model
+        model_mtime = result_cache.ModelTime(model_path=model_registry.ModelPath(types=model_key[0], week=model_key[1]))
+        looked_up : list[tuple[str, str, bytes | CachedResult]] = []
         for image_file in image_files:
-            assert image_file.filename is not None, "Image filename is None"
-            image_path = join(temp_dir, image_file.filename)
-            image_file.save(image_path)
-
-        # Evaluate the images using anomalib_test
-        results = anomalib_test.Evaluate(image_path=temp_dir)
+            with STAGE_METRICS.Timer(stage="read", model=model, week=week):
+                data = image_file.read()
+            with STAGE_METRICS.Timer(stage="cache", model=model, week=week):
+                cache_key = result_cache.Key(data=data, types=model_key[0], week=model_key[1], model_mtime=model_mtime, variant="" if tiling is None else f"tiled:{tiling}")
+                cached = result_cache.Get(key=cache_key)
+            looked_up.append((cache_key, str(image_file.filename), data if cached is None else cached))
+
+        # Reserve capacity for the misses before decoding any of them
+        misses = sum(1 for _, _, item in looked_up if isinstance(item, bytes))
+        if misses > 0 and not admission.Admit(count=misses):
+            return Response(
+                dumps({
+                    "messages": ["Server is busy, try again later."],
+                    "images": []
+                }),
+                status=503,
+                mimetype="application/json",
+                headers=dict(LoadHeaders(), **{"Retry-After": str(admission.retry_after_s_)})
+            )
+
+        # Decode the misses straight from memory and queue them on the scheduler, it batches them with images
+        # from concurrent requests. The model is only loaded when at least one image is not cached
+        queued : list[tuple[str, Future | CachedResult]] = []
+        try:
+            if misses > 0:
+                LoadModel(model_key)
+            for cache_key, filename, item in looked_up:
+                if not isinstance(item, bytes):
+                    queued.append((cache_key, item))
+                    continue
+
+                with STAGE_METRICS.Timer(stage="decode", model=model, week=week):
+                    image = image_unit.DecodeImage(item, ImageUnit.ColorModeEnum.rgb_)
+                    if image is not None:
+                        image = image_unit.ConvertColor(image, ImageUnit.ColorConversionEnum.bgr2rgb_)
+                if image is None:
+                    return Response(
+                        dumps({
+                            "messages": [f"Unable to decode image: {filename}"],
+                            "images": []
+                        }),
+                        status=400,
+                        mimetype="application/json"
+                    )
+                queued.append((cache_key, ReleaseOnDone(predict_scheduler.Submit(key=(model_key, scores_only, tiling), item=image), labels)))
+                misses -= 1
+        finally:
+            # Images not queued (decode error or failure) give their capacity back now
+            if misses > 0:
+                admission.Release(count=misses)
+
+        # Stream each result as soon as it is scored
+        if response_format != PredictFormatEnum.json_:
+            return Response(StreamResults(PredictResults(queued, labels, scores_only), response_format, labels, start), status=200, mimetype=response_format.value, headers=LoadHeaders())
 
         # Process the results
-        for result_image, result_string in results:
-            # Save the result image as PNG (supports RGBA)
-            image_buffer = BytesIO()
-            result_image.save(image_buffer, format="PNG")
-            image_buffer.seek(0)
-            image_base64 = b64encode(image_buffer.getvalue()).decode('utf-8')
-
-            # Add the result string and image to the response
+        for result_string, score, image_bytes in PredictResults(queued, labels, scores_only):
             response_messages.append(result_string)
-            response_images.append(image_base64)
-
-        # Clean up the temporary directory
-        rmtree(temp_dir, ignore_errors=True)
+            response_scores.append(score)
+            if scores_only:
+                continue
+            with STAGE_METRICS.Timer(stage="serialize", model=model, week=week):
+                response_images.append(b64encode(image_bytes).decode('utf-8'))
 
         # Return text and images in JSON
-        return Response(
-            dumps({
+        with STAGE_METRICS.Timer(stage="serialize", model=model, week=week):
+            body = dumps({
                 "messages": response_messages,
-                "images": response_images
-            }),
+                "images": response_images,
+                "scores": response_scores
+            })
+        STAGE_METRICS.Observe(stage="total", model=model, week=week, seconds=perf_counter() - start)
+        return Response(
+            body,
             status=200,
-            mimetype="application/json"
+            mimetype="application/json",
+            headers=LoadHeaders()
         )
 
     except Exception as e:
-        # Clean up the temporary directory in case of an error
-        rmtree(temp_dir, ignore_errors=True)
         return Response(
             dumps({
                 "messages": [f"Error processing images: {str(e)}"],
@@ -206,17 +611,167 @@ async def Predict() -> Response:
             status=500,
             mimetype="application/json"
         )
-    
-    finally:
-        # Clean up the temporary directory if it exists
-        if exists(temp_dir):
-            rmtree(temp_dir, ignore_errors=True)
+
+@Post
+async def PredictEnsemble() -> Response:
+    """
+    Handle the POST request to score images with an ensemble of models of one week, returned as JSON like /predict.
+
+    Form fields: 'images', 'week' and optionally 'names', comma separated model types (default every model type).
+    The models share their pretrained backbones, so each backbone runs once per batch (see AnomalibEnsemble), and the images
+    are batched with those of concurrent requests for the same ensemble. Admission works as for /predict.
+    The combined score is the mean of the normalized scores, each model's own score is listed after it.
+    """
+    start = perf_counter()
+    week = request.form.get('week')
+    names = [name.strip() for name in request.form.get('names', '').split(',') if name.strip()] or [model_type.name.rstrip('_') for model_type in ModelPathUnit.ModelTypeEnum]
+    if 'images' not in request.files or not week:
+        return Response(dumps({"messages": ["Both 'images' and 'week' are required."], "images": []}), status=400, mimetype="application/json")
+
+    try:
+        week_int = int(week)
+    except ValueError:
+        return Response(dumps({"messages": ["'week' must be an integer."], "images": []}), status=400, mimetype="application/json")
+
+    model_types : list[ModelPathUnit.ModelTypeEnum] = []
+    for name in names:
+        valid_result = model_path_unit.IsValid(types=name, week=week_int)
+        if not valid_result:
+            return Response(dumps({"messages": [f"Invalid model path for '{name}' and week {week_int}."], "images": []}), status=400, mimetype="application/json")
+        model_types.append(valid_result[0])
+    model_week = ModelPathUnit.ModelWeekEnum(week_int)
+
+    image_files = request.files.getlist('images')
+    oversized = admission.CheckRequest(content_length=request.content_length, images=len(image_files))
+    if oversized is not None:
+        return Response(dumps({"messages": [oversized], "images": []}), status=413, mimetype="application/json", headers=LoadHeaders())
+
+    # Every image runs every model, capacity is reserved per image for the whole ensemble
+    if not admission.Admit(count=len(image_files)):
+        return Response(dumps({"messages": ["Server is busy, try again later."], "images": []}), status=503, mimetype="application/json", headers=dict(LoadHeaders(), **{"Retry-After": str(admission.retry_after_s_)}))
+
+    ensemble_key : EnsembleKey = (tuple(model_types), model_week)
+    labels = ("ensemble", str(model_week.value))
+    try:
+        # Queue the images on ensemble_scheduler, it batches them with the images of concurrent requests
+        queued : list[Future] = []
+        try:
+            LoadEnsemble(ensemble_key)
+            for image_file in image_files:
+                image = image_unit.DecodeImage(image_file.read(), ImageUnit.ColorModeEnum.rgb_)
+                if image is None:
+                    return Response(dumps({"messages": [f"Unable to decode image: {image_file.filename}"], "images": []}), status=400, mimetype="application/json")
+                image = image_unit.ConvertColor(image, ImageUnit.ColorConversionEnum.bgr2rgb_)
+                queued.append(ReleaseOnDone(ensemble_scheduler.Submit(key=ensemble_key, item=image), labels))
+        finally:
+            # Images not queued give their capacity back now, the queued ones once they are scored
+            if len(queued) < len(image_files):
+                admission.Release(count=len(image_files) - len(queued))
+
+        response_messages = []
+        response_images = []
+        response_scores = []
+        for future in queued:
+            # Inference workers return the rendered result, results of this process are rendered here
+            rendered = future.result() if inference_pool is not None else RenderEnsembleResult(*future.result(), labels)
+            if rendered is None:
+                continue
+            result_string, score, image_bytes = rendered
+            response_messages.append(result_string)
+            response_scores.append(score)
+            response_images.append(b64encode(image_bytes).decode('utf-8'))
+
+        STAGE_METRICS.Observe(stage="total", model=labels[0], week=labels[1], seconds=perf_counter() - start)
+        return Response(dumps({"messages": response_messages, "images": response_images, "scores": response_scores}), status=200, mimetype="application/json", headers=LoadHeaders())
+
+    except Exception as e:
+        return Response(dumps({"messages": [f"Error processing images: {str(e)}"], "images": []}), status=500, mimetype="application/json")
+
+@Get
+async def CacheStats() -> Response:
+    """
+    Handle the GET request for the hit and miss counters of the prediction result cache.
+    """
+    return jsonify(result_cache.Stats())
+
+@Get
+async def PredictStatus() -> Response:
+    """
+    Handle the GET request for the load of /predict: the admission limits, images in flight and images waiting for a batch.
+    """
+    return jsonify(dict(admission.Stats(), queue_depth=predict_scheduler.Pending()))
+
+@Get
+async def Metrics() -> Response:
+    """
+    Handle the GET request for the per-stage latency histograms of /predict in the Prometheus text format.
+    """
+    return Response(STAGE_METRICS.Render(), status=200, mimetype="text/plain; version=0.0.4")
+
+@Get
+async def Ready() -> Response:
+    """
+    Handle the GET request for readiness, 200 once the default model (or any model without a default) is loaded and warmed, 503 before.
+    Every loaded model is listed with its state, whether it is warm and the latency of each warm-up inference in ms.
+    Inference workers are forked with the models of the server process, those are listed.
+    """
+    ready, models = model_registry.Readiness()
+    return Response(dumps({"ready": ready, "models": models}), status=200 if ready else 503, mimetype="application/json")
 
 def flask_run():
+    """
+    Flask development server, for local debugging only.
+    """
+    PreloadModels()
+    StartInference()
     APP.run()
-    
+
+def CreateApp() -> AsyncFlask:
+    """
+    Application factory, preloads the models and returns the Flask app.
+    Under gunicorn it runs once in the master, so the server workers forked from it share the preloaded models.
+    """
+    PreloadModels()
+    return APP
+
+def GunicornWorkerInit(worker : object) -> None:
+    """
+    Gunicorn post_worker_init hook, forks the inference workers of each server worker,
+    a process pool created in the master would not survive the fork of the server workers.
+    """
+    StartInference()
+
+def wsgi_run():
+    """
+    Production server, gunicorn with gthread workers: SERVER_WORKERS processes forked from a master that preloaded
+    the models, each serving SERVER_THREADS requests at once with keep-alive. Scheduler, admission limits, result cache
+    and training jobs are per server process, keep SERVER_WORKERS=1 and use INFERENCE_PROCESSES to spread inference
+    over the cores (or to train through the server). Gunicorn needs fork, on Windows waitress serves in one process.
+    The same server from the command line: gunicorn "server:CreateApp()" --preload --worker-class gthread --threads 16
+    """
+    host, port, threads = getenv('SERVER_HOST', '127.0.0.1'), int(getenv('SERVER_PORT', '5000')), int(getenv('SERVER_THREADS', '16'))
+    if platform == "win32":
+        from waitress import serve
+        app = CreateApp()
+        StartInference()
+        serve(app, host=host, port=port, threads=threads, channel_timeout=int(getenv('SERVER_KEEP_ALIVE', '75')))
+        return
+
+    from classes.wsgi_lib import GunicornServer
+    GunicornServer(app_factory=CreateApp, options={
+        "bind": f"{host}:{port}",
+        "workers": int(getenv('SERVER_WORKERS', '1')),
+        "worker_class": "gthread",
+        "threads": threads,
+        "keepalive": int(getenv('SERVER_KEEP_ALIVE', '75')),
+        # Cold model loads and large uploads run on the request threads, the worker heartbeat is not blocked by them
+        "timeout": int(getenv('SERVER_TIMEOUT', '120')),
+        "preload_app": True,
+        "post_worker_init": GunicornWorkerInit,
+    }).run()
+
 def main():
-    flask_run()
+    wsgi_run()
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,45 @@
+from os import environ
+import pytest
+
+# torch >= 2.6 loads weights only by default, the artifacts of tests/models.py are written by the tests themselves
+environ.setdefault("TORCH_FORCE_NO_WEIGHTS_ONLY_LOAD", "1")
+
+@pytest.fixture(scope="session")
+def torch_model_path(tmp_path_factory: pytest.TempPathFactory) -> str:
+    """
+    A tiny model.pt, see tests/models.py.
+    """
+    pytest.importorskip("anomalib")
+    from tests.models import SaveTorch
+
+    path = tmp_path_factory.mktemp("torch") / "model.pt"
+    SaveTorch(str(path))
+    return str(path)
+
+@pytest.fixture(scope="session")
+def openvino_model_path(tmp_path_factory: pytest.TempPathFactory) -> str:
+    """
+    The same tiny model exported to OpenVINO IR, see tests/models.py.
+    """
+    pytest.importorskip("anomalib")
+    pytest.importorskip("openvino")
+    from tests.models import SaveOpenVINO
+
+    path = tmp_path_factory.mktemp("openvino") / "model.xml"
+    SaveOpenVINO(str(path))
+    return str(path)
+
+@pytest.fixture(scope="session")
+def ensemble_model_paths(tmp_path_factory: pytest.TempPathFactory) -> dict[str, str]:
+    """
+    A cflow and a patchcore model.pt sharing one frozen resnet18, see tests/models.py.
+    """
+    pytest.importorskip("anomalib")
+    pytest.importorskip("timm")
+    from tests.models import SaveTorchBackbone
+
+    paths : dict[str, str] = {}
+    for seed, name in enumerate(("cflow", "patchcore")):
+        paths[name] = str(tmp_path_factory.mktemp(name) / "model.pt")
+        SaveTorchBackbone(paths[name], seed=seed)
+    return paths
@@ -0,0 +1,30 @@
+"""
+Training job stand-ins for TrainJobManager, imported by the job subprocess like anomalib_train.RunModelProcess.
+"""
+
+from typing import Any
+from subprocess import Popen
+from time import sleep
+import sys
+
+def Progress(progress_queue: Any) -> None:
+    # Printed by the job, must not reach the progress pipe
+    print("training log line")
+    progress_queue.put((1, 2, "cflow"))
+    progress_queue.put((2, 2, "patchcore"))
+
+def Modules(progress_queue: Any) -> None:
+    # Whether the subprocess imported the server, as a spawned multiprocessing child of python server.py does
+    imported = [name for name in ("server", "__mp_main__", "flask") if name in sys.modules]
+    progress_queue.put((len(imported), 1, ",".join(imported)))
+
+def Fail(progress_queue: Any) -> None:
+    raise SystemExit(3)
+
+def SleepWithChild(progress_queue: Any, pid_path: str) -> None:
+    # Stands for a DataLoader worker, the job does not stop it itself
+    child = Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    with open(pid_path, "w") as file:
+        file.write(str(child.pid))
+    progress_queue.put((0, 1, "started"))
+    sleep(60)
@@ -0,0 +1,103 @@
+"""
+Tiny exported models with the layout anomalib writes (an InferenceModel applying its own transform),
+so AnomalibTest is checked against the real inferencers without pretrained weights.
+"""
+
+from typing import Final
+from json import dump
+from os.path import dirname, join
+import torch
+
+# Not the 256x256 fallback of AnomalibTest, so a model read at the wrong size is caught
+INPUT_SIZE : Final[tuple[int, int]] = (96, 128)
+METADATA : Final[dict[str, object]] = {"task": "segmentation", "image_threshold": 0.5, "pixel_threshold": 0.5, "min": 0.0, "max": 2.0}
+
+class TinyModel(torch.nn.Module):
+    """
+    One seeded convolution, returns a non-negative NxHxW anomaly map like the anomalib torch models.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        generator = torch.Generator().manual_seed(0)
+        self.conv = torch.nn.Conv2d(3, 1, 5, padding=2)
+        with torch.no_grad():
+            self.conv.weight.copy_(torch.randn(self.conv.weight.shape, generator=generator) * 0.2)
+            self.conv.bias.zero_()
+
+    def forward(self, batch: torch.Tensor) -> torch.Tensor:
+        return self.conv(batch).pow(2).squeeze(1)
+
+def TinyInferenceModel(*, disable_antialias: bool = False) -> torch.nn.Module:
+    """
+    Wrap TinyModel with the Resize and Normalize transform of AnomalyModule.configure_transforms, at INPUT_SIZE.
+
+    Args:
+    disable_antialias : bool - As anomalib does for graph exports. Default is False.
+    """
+    from torchvision.transforms.v2 import Compose, Normalize, Resize
+    from anomalib.deploy.export import InferenceModel
+
+    transform = Compose([Resize(INPUT_SIZE, antialias=True), Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])])
+    return InferenceModel(model=TinyModel().eval(), transform=transform, disable_antialias=disable_antialias).eval()
+
+def SaveTorch(path: str) -> None:
+    """
+    Write a model.pt like AnomalyModelUnit.Save does for the torch backend.
+
+    Args:
+    path : str - Path of the model.pt.
+    """
+    torch.save({"model": TinyInferenceModel(), "metadata": dict(METADATA)}, path)
+
+def SaveOpenVINO(path: str) -> None:
+    """
+    Write a model.xml with its metadata.json like the OpenVINO export, batch dimension dynamic and antialiasing disabled.
+    The weights are kept in FP32, so the outputs can be compared with the torch artifact.
+
+    Args:
+    path : str - Path of the model.xml.
+    """
+    import openvino as ov
+
+    model = ov.convert_model(TinyInferenceModel(disable_antialias=True), example_input=torch.zeros(1, 3, *INPUT_SIZE), input=[(-1, 3, *INPUT_SIZE)])
+    ov.save_model(model, path, compress_to_fp16=False)
+    with open(join(dirname(path), "metadata.json"), "w") as file:
+        dump(METADATA, file)
+
+class TinyBackboneModel(torch.nn.Module):
+    """
+    A frozen resnet18 TimmFeatureExtractor, the same seeded weights in every instance, under a seeded 1x1 convolution head,
+    like the models of an ensemble that share a pretrained backbone.
+    """
+
+    def __init__(self, *, seed: int) -> None:
+        from anomalib.models.components.feature_extractors import TimmFeatureExtractor
+
+        super().__init__()
+        torch.manual_seed(0)
+        self.feature_extractor = TimmFeatureExtractor(backbone="resnet18", layers=["layer1", "layer2"], pre_trained=False, requires_grad=False)
+        self.layer_ = "layer1" if seed % 2 == 0 else "layer2"
+        generator = torch.Generator().manual_seed(seed)
+        self.head = torch.nn.Conv2d(64 if self.layer_ == "layer1" else 128, 1, 1)
+        with torch.no_grad():
+            self.head.weight.copy_(torch.randn(self.head.weight.shape, generator=generator) * 0.1)
+            self.head.bias.zero_()
+
+    def forward(self, batch: torch.Tensor) -> torch.Tensor:
+        return self.head(self.feature_extractor(batch)[self.layer_]).pow(2).squeeze(1)
+
+def SaveTorchBackbone(path: str, *, seed: int, input_size: tuple[int, int] = INPUT_SIZE) -> None:
+    """
+    Write a model.pt of TinyBackboneModel with the transform of TinyInferenceModel at input_size.
+
+    Args:
+    path : str - Path of the model.pt.
+    seed : int - Seed of the head, even heads read layer1 and odd heads layer2 of the backbone.
+    input_size : tuple[int, int] - Size of the Resize transform. Default is INPUT_SIZE.
+    """
+    from torchvision.transforms.v2 import Compose, Normalize, Resize
+    from anomalib.deploy.export import InferenceModel
+
+    transform = Compose([Resize(input_size, antialias=True), Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])])
+    torch.save({"model": InferenceModel(model=TinyBackboneModel(seed=seed).eval(), transform=transform).eval(), "metadata": dict(METADATA)}, path)
@@ -0,0 +1,151 @@
+from types import MappingProxyType
+import pytest
+
+torch = pytest.importorskip("torch")
+np = pytest.importorskip("numpy")
+pytest.importorskip("anomalib")
+
+from anomalib_test import AnomalibTest
+from tests.models import INPUT_SIZE
+
+def RandomImage(height: int, width: int, seed: int) -> "torch.Tensor":
+    """
+    A seeded CxHxW float image in [0, 1], like read_image(path, as_tensor=True).
+    """
+    return torch.rand(3, height, width, generator=torch.Generator().manual_seed(seed))
+
+@pytest.fixture
+def torch_test(torch_model_path: str) -> AnomalibTest:
+    anomalib_test = AnomalibTest(batch_size=4)
+    anomalib_test.Setup(model_path=torch_model_path)
+    return anomalib_test
+
+def test_input_size_read_from_transform(torch_test: AnomalibTest) -> None:
+    # The exported InferenceModel has no input_size, the size comes from its Resize
+    assert torch_test.InputSize() == INPUT_SIZE
+
+def test_predict_batch_matches_predict(torch_test: AnomalibTest) -> None:
+    image = RandomImage(300, 500, seed=1)
+    expected = torch_test.inferencer_.predict(image.clone())
+    result = torch_test.PredictBatch(images=[image])[0]
+
+    assert float(result.pred_score) == pytest.approx(float(expected.pred_score), abs=1e-6)
+    assert result.pred_label == expected.pred_label
+    assert result.anomaly_map.shape == expected.anomaly_map.shape == (300, 500)
+    np.testing.assert_allclose(result.anomaly_map, expected.anomaly_map, atol=1e-5)
+
+def test_predict_batch_mixed_sizes(torch_test: AnomalibTest) -> None:
+    images = [RandomImage(300, 500, seed=2), RandomImage(*INPUT_SIZE, seed=3), RandomImage(64, 64, seed=4)]
+    results = torch_test.PredictBatch(images=images)
+
+    assert len(results) == len(images)
+    for image, result in zip(images, results):
+        expected = torch_test.inferencer_.predict(image.clone())
+        assert float(result.pred_score) == pytest.approx(float(expected.pred_score), abs=1e-6)
+        np.testing.assert_allclose(result.anomaly_map, expected.anomaly_map, atol=1e-5)
+
+@pytest.fixture
+def openvino_test(openvino_model_path: str, tmp_path, monkeypatch: pytest.MonkeyPatch) -> AnomalibTest:
+    # OpenVINOInferencer writes its compiled model cache to ./cache, keep it out of the checkout
+    monkeypatch.chdir(tmp_path)
+    anomalib_test = AnomalibTest(batch_size=4)
+    anomalib_test.Setup(model_path=openvino_model_path)
+    return anomalib_test
+
+def test_split_prediction_slices_mappings(torch_test: AnomalibTest) -> None:
+    batch = torch.arange(12.0).reshape(3, 2, 2)
+    predictions = MappingProxyType({"anomaly_map": batch, "pred_score": [batch.amax(dim=(1, 2)), np.arange(3)]})
+    split = torch_test.SplitPrediction(predictions=predictions, index=1)
+
+    assert isinstance(split, dict)
+    assert torch.equal(split["anomaly_map"], batch[1:2])
+    assert torch.equal(split["pred_score"][0], torch.tensor([7.0]))
+    assert split["pred_score"][1].tolist() == [1]
+
+def test_openvino_batch_matches_single_images(openvino_test: AnomalibTest, torch_test: AnomalibTest) -> None:
+    assert openvino_test.InputSize() == INPUT_SIZE
+    images = [RandomImage(*INPUT_SIZE, seed=5), RandomImage(*INPUT_SIZE, seed=6)]
+    results = openvino_test.PredictBatch(images=images)
+
+    # OpenVINOInferencer.predict cannot read the dynamic batch of the export, a batch of one is the per-image prediction.
+    # The torch artifact of the same weights checks it loosely, the OpenVINO CPU plugin may infer in bf16
+    assert len(results) == 2
+    for image, result in zip(images, results):
+        single = openvino_test.PredictBatch(images=[image])[0]
+        assert result.anomaly_map.shape == single.anomaly_map.shape == INPUT_SIZE
+        assert float(result.pred_score) == pytest.approx(float(single.pred_score), abs=1e-5)
+        np.testing.assert_allclose(result.anomaly_map, single.anomaly_map, atol=1e-5)
+
+        expected = torch_test.inferencer_.predict(image.clone())
+        assert float(result.pred_score) == pytest.approx(float(expected.pred_score), rel=2e-2)
+    assert float(results[0].pred_score) != pytest.approx(float(results[1].pred_score))
+
+@pytest.mark.parametrize("length, tile, overlap", [(96, 96, 0.25), (200, 96, 0.25), (200, 96, 0.0), (1000, 128, 0.5), (97, 96, 0.9)])
+def test_tile_origins_cover_the_side(torch_test: AnomalibTest, length: int, tile: int, overlap: float) -> None:
+    origins = torch_test.TileOrigins(length=length, tile=tile, overlap=overlap)
+    assert origins[0] == 0 and origins[-1] == length - tile
+    assert origins == sorted(set(origins))
+    # No gap between neighbours, and the stride leaves the requested overlap
+    stride = max(1, int(tile * (1 - overlap)))
+    assert all(0 < right - left <= stride for left, right in zip(origins, origins[1:]))
+
+def test_predict_tiled_blends_into_the_full_resolution_map(torch_test: AnomalibTest) -> None:
+    # Tiles at the model input size are not resized, so every tile of the convolution model sees the pixels of the
+    # full image and the blended map must match the map of the whole image, up to the padding at the tile borders
+    image = RandomImage(2 * INPUT_SIZE[0] + 10, 2 * INPUT_SIZE[1] + 30, seed=5)
+    result = torch_test.PredictTiled(image=image, overlap=0.25, top_k=1)
+    assert result.anomaly_map.shape == image.shape[-2:]
+
+    inference_model = torch_test.inferencer_.model
+    with torch.inference_mode():
+        raw = inference_model.model(inference_model.transform.transforms[1](image.unsqueeze(0)))
+    metadata = dict(torch_test.inferencer_.metadata, image_shape=image.shape[-2:])
+    expected = np.squeeze(torch_test.inferencer_.post_process(raw, metadata=metadata)["anomaly_map"])
+    value_range = float(expected.max() - expected.min())
+    np.testing.assert_allclose(result.anomaly_map, expected, atol=0.01 * value_range)
+    assert np.abs(result.anomaly_map - expected).mean() < 1e-4 * value_range
+
+def test_predict_tiled_single_tile_equals_predict_batch(torch_test: AnomalibTest) -> None:
+    # One tile has the image border on every side, its window is flat and the map is the map of the tile
+    image = RandomImage(*INPUT_SIZE, seed=8)
+    result = torch_test.PredictTiled(image=image)
+    expected = torch_test.PredictBatch(images=[image])[0]
+    np.testing.assert_allclose(result.anomaly_map, np.squeeze(expected.anomaly_map), rtol=1e-5, atol=1e-6)
+    assert float(result.pred_score) == pytest.approx(float(expected.pred_score), rel=1e-6)
+
+def test_predict_tiled_without_overlap_stitches_the_tile_maps(torch_test: AnomalibTest) -> None:
+    # Without overlap the Hann window is 0 on the seams, those pixels take the map of their only tile
+    image = RandomImage(2 * INPUT_SIZE[0], 2 * INPUT_SIZE[1], seed=9)
+    result = torch_test.PredictTiled(image=image, overlap=0)
+    height, width = INPUT_SIZE
+    tiles = [image[:, top:top + height, left:left + width] for top in (0, height) for left in (0, width)]
+    maps = [np.squeeze(tile.anomaly_map) for tile in torch_test.PredictBatch(images=tiles)]
+    expected = np.block([[maps[0], maps[1]], [maps[2], maps[3]]])
+    np.testing.assert_allclose(result.anomaly_map, expected, rtol=1e-5, atol=1e-6)
+
+def test_tile_window_is_flat_towards_the_image_border(torch_test: AnomalibTest) -> None:
+    inner = torch_test.TileWindow(tile=96, first=False, last=False)
+    first = torch_test.TileWindow(tile=96, first=True, last=False)
+    last = torch_test.TileWindow(tile=96, first=False, last=True)
+    np.testing.assert_allclose(inner, np.hanning(96))
+    assert np.all(first[:48] == first[48]) and np.allclose(first[48:], inner[48:])
+    assert np.all(last[48:] == last[48]) and np.allclose(last[:48], inner[:48])
+    assert np.ptp(torch_test.TileWindow(tile=96, first=True, last=True)) == 0
+
+def test_predict_tiled_score_is_the_top_k_tile_mean(torch_test: AnomalibTest) -> None:
+    image = RandomImage(2 * INPUT_SIZE[0], 3 * INPUT_SIZE[1], seed=6)
+    tile_height, tile_width = INPUT_SIZE
+    origins = [(top, left) for top in torch_test.TileOrigins(length=image.shape[1], tile=tile_height, overlap=0.25) for left in torch_test.TileOrigins(length=image.shape[2], tile=tile_width, overlap=0.25)]
+    scores = sorted((score for score, _ in torch_test.PredictScores(images=[image[:, top:top + tile_height, left:left + tile_width] for top, left in origins])), reverse=True)
+
+    for top_k in (1, 3, len(scores) + 5):
+        result = torch_test.PredictTiled(image=image, overlap=0.25, top_k=top_k)
+        expected = scores[:top_k]
+        assert float(result.pred_score) == pytest.approx(sum(expected) / len(expected), rel=1e-5)
+        assert result.pred_label == (float(result.pred_score) >= 0.5)
+
+def test_predict_tiled_upscales_small_images(torch_test: AnomalibTest) -> None:
+    result = torch_test.PredictTiled(image=RandomImage(50, 60, seed=7))
+    # Scaled by max(96 / 50, 128 / 60), keeping the aspect ratio, into a single tile or more
+    assert result.anomaly_map.shape == result.image.shape[:2] == (107, 128)
+    assert result.pred_mask.shape == result.anomaly_map.shape
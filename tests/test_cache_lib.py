@@ -0,0 +1,72 @@
+from enum import Enum
+from os import listdir, utime
+import pytest
+
+pytest.importorskip("msgpack")
+
+from classes.cache_lib import ResultCache
+
+class TypeEnum(Enum):
+    cflow_ = 0
+    patchcore_ = 1
+
+class WeekEnum(Enum):
+    week3_ = 3
+    week8_ = 8
+
+def Key(result_cache: ResultCache, data: bytes = b"image", types: Enum = TypeEnum.cflow_, week: Enum = WeekEnum.week3_, model_mtime: int = 1, variant: str = "") -> str:
+    return result_cache.Key(data=data, types=types, week=week, model_mtime=model_mtime, variant=variant)
+
+def test_key_covers_image_model_and_variant() -> None:
+    result_cache = ResultCache()
+    key = Key(result_cache)
+    assert key == Key(result_cache)
+    assert len({key, Key(result_cache, data=b"other"), Key(result_cache, types=TypeEnum.patchcore_), Key(result_cache, week=WeekEnum.week8_),
+                Key(result_cache, model_mtime=2), Key(result_cache, variant="tiled:(0, 0.25, 1)")}) == 6
+
+def test_model_time_follows_the_file(tmp_path) -> None:
+    result_cache = ResultCache()
+    model_path = tmp_path / "model.pt"
+    model_path.write_bytes(b"v1")
+    utime(model_path, ns=(1_000_000_000, 1_000_000_000))
+    before = result_cache.ModelTime(model_path=str(model_path))
+    utime(model_path, ns=(2_000_000_000, 2_000_000_000))
+    assert result_cache.ModelTime(model_path=str(model_path)) == 2_000_000_000 != before
+
+def test_memory_tier_is_lru() -> None:
+    result_cache = ResultCache(max_entries=2)
+    for name in ("a", "b"):
+        result_cache.Put(key=name, result=(name, 0.5, b"png"))
+    assert result_cache.Get(key="a") is not None
+    result_cache.Put(key="c", result=("c", 0.5, b"png"))
+    assert result_cache.Get(key="b") is None
+    assert result_cache.Get(key="a") == ("a", 0.5, b"png")
+    assert result_cache.Stats()["hits"] == 2 and result_cache.Stats()["misses"] == 1
+
+def test_disk_tier_refills_memory(tmp_path) -> None:
+    ResultCache(max_entries=0, cache_dir=str(tmp_path)).Put(key="a", result=("a", 0.25, b"png"))
+    result_cache = ResultCache(cache_dir=str(tmp_path))
+    assert result_cache.Get(key="a") == ("a", 0.25, b"png")
+    assert result_cache.Get(key="a") == ("a", 0.25, b"png")
+    assert result_cache.Stats()["disk_hits"] == 1 and result_cache.Stats()["hits"] == 1
+
+def test_disk_tier_is_capped(tmp_path) -> None:
+    image = bytes(1000)
+    result_cache = ResultCache(max_entries=0, cache_dir=str(tmp_path), max_disk_bytes=5000)
+    for index in range(4):
+        result_cache.Put(key=f"{index}", result=("", 0.5, image))
+        utime(tmp_path / f"{index}.msgpack", ns=(index * 1_000_000_000, index * 1_000_000_000))
+    # Read, so it is no longer the least recently used
+    assert result_cache.Get(key="0") is not None
+    for index in range(4, 6):
+        result_cache.Put(key=f"{index}", result=("", 0.5, image))
+
+    assert sorted(listdir(tmp_path)) == ["0.msgpack", "3.msgpack", "4.msgpack", "5.msgpack"]
+    files = listdir(tmp_path)
+    assert sum((tmp_path / name).stat().st_size for name in files) <= 5000
+    assert result_cache.Stats()["disk_bytes"] <= 5000
+
+def test_disk_tier_trimmed_at_start(tmp_path) -> None:
+    ResultCache(max_entries=0, cache_dir=str(tmp_path)).Put(key="a", result=("", 0.5, bytes(1000)))
+    ResultCache(max_entries=0, cache_dir=str(tmp_path), max_disk_bytes=500)
+    assert listdir(tmp_path) == []
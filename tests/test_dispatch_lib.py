@@ -0,0 +1,104 @@
+from asyncio import Event, run, sleep
+from types import SimpleNamespace
+from typing import Any
+import pytest
+
+from classes.discord_lib import MessageObject
+from classes.dispatch_lib import CommandDispatcher
+
+class FakeMessage:
+    """
+    The parts of a discord Message the dispatcher uses, replies are recorded.
+    """
+
+    def __init__(self, *, channel_id: int, user_id: int, content: str = "~predict") -> None:
+        self.channel = SimpleNamespace(id=channel_id)
+        self.author = SimpleNamespace(id=user_id)
+        self.content : str = content
+        self.replies_ : list[str] = []
+
+    async def reply(self, content: str, **kwargs: Any) -> None:
+        self.replies_.append(content)
+
+class Gated:
+    """
+    Command function that records the messages it started and waits for release.
+    """
+
+    def __init__(self) -> None:
+        self.started_ : list[FakeMessage] = []
+        self.release_ : Event = Event()
+
+    async def __call__(self, message: FakeMessage, message_object: MessageObject) -> None:
+        self.started_.append(message)
+        await self.release_.wait()
+        message_object.SetMessage(f"done {message.author.id}")
+
+def Dispatch(dispatcher: CommandDispatcher, command: Gated, message: FakeMessage) -> str:
+    message_object = MessageObject()
+    dispatcher.Dispatch(function=command, message=message, message_object=message_object) # type: ignore
+    return message_object.message_ or ""
+
+async def Drain(dispatcher: CommandDispatcher) -> None:
+    while dispatcher.tasks_:
+        await sleep(0.01)
+
+@pytest.fixture(autouse=True)
+def default_limits(monkeypatch: pytest.MonkeyPatch) -> None:
+    for env in ("COMMAND_MAX_PER_CHANNEL", "COMMAND_MAX_PER_USER", "COMMAND_MAX_QUEUED"):
+        monkeypatch.delenv(env, raising=False)
+
+def test_user_limit_does_not_count_against_channel() -> None:
+    async def Scenario() -> None:
+        dispatcher, command = CommandDispatcher(), Gated()
+        a_first, a_second, b_first = FakeMessage(channel_id=1, user_id=10), FakeMessage(channel_id=1, user_id=10), FakeMessage(channel_id=1, user_id=20)
+        assert Dispatch(dispatcher, command, a_first) == ""
+        assert Dispatch(dispatcher, command, a_second) == "Queued, position 1"
+        # A's second command only waits for A, the channel still has a free slot for B
+        assert Dispatch(dispatcher, command, b_first) == ""
+        await sleep(0)
+        assert command.started_ == [a_first, b_first]
+        command.release_.set()
+        await Drain(dispatcher)
+        assert command.started_ == [a_first, b_first, a_second]
+        assert [message.replies_ for message in (a_first, a_second, b_first)] == [["done 10"], ["done 10"], ["done 20"]]
+        assert dispatcher.Stats() == {"tasks": 0, "channels": 0, "users": 0}
+    run(Scenario())
+
+def test_position_counts_waiting_commands_per_user_and_channel() -> None:
+    async def Scenario() -> None:
+        dispatcher, command = CommandDispatcher(), Gated()
+        assert Dispatch(dispatcher, command, FakeMessage(channel_id=1, user_id=10)) == ""
+        assert Dispatch(dispatcher, command, FakeMessage(channel_id=1, user_id=20)) == ""
+        assert Dispatch(dispatcher, command, FakeMessage(channel_id=1, user_id=30)) == "Queued, position 1"
+        assert Dispatch(dispatcher, command, FakeMessage(channel_id=1, user_id=40)) == "Queued, position 2"
+        # Behind its own command and behind the two waiting in the channel, the larger wait is reported
+        assert Dispatch(dispatcher, command, FakeMessage(channel_id=1, user_id=10)) == "Queued, position 3"
+        assert Dispatch(dispatcher, command, FakeMessage(channel_id=2, user_id=10)) == "Queued, position 2"
+        command.release_.set()
+        await Drain(dispatcher)
+        assert len(command.started_) == 6
+        assert dispatcher.Stats() == {"tasks": 0, "channels": 0, "users": 0}
+    run(Scenario())
+
+def test_full_queue_is_refused(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("COMMAND_MAX_QUEUED", "1")
+    async def Scenario() -> None:
+        dispatcher, command = CommandDispatcher(), Gated()
+        assert Dispatch(dispatcher, command, FakeMessage(channel_id=1, user_id=10)) == ""
+        assert Dispatch(dispatcher, command, FakeMessage(channel_id=1, user_id=10)) == "Queued, position 1"
+        assert Dispatch(dispatcher, command, FakeMessage(channel_id=1, user_id=10)) == "Too many commands queued (1), try again later"
+        assert dispatcher.Stats()["tasks"] == 2
+        await dispatcher.Shutdown()
+        assert dispatcher.Stats() == {"tasks": 0, "channels": 0, "users": 0}
+    run(Scenario())
+
+def test_failed_command_is_reported() -> None:
+    async def Failing(message: FakeMessage, message_object: MessageObject) -> None:
+        raise RuntimeError("no model")
+    async def Scenario() -> None:
+        dispatcher, message = CommandDispatcher(), FakeMessage(channel_id=1, user_id=10)
+        dispatcher.Dispatch(function=Failing, message=message, message_object=MessageObject()) # type: ignore
+        await Drain(dispatcher)
+        assert message.replies_ == ["Command failed: no model"]
+    run(Scenario())
@@ -0,0 +1,63 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+np = pytest.importorskip("numpy")
+pytest.importorskip("anomalib")
+pytest.importorskip("timm")
+
+from anomalib_test import AnomalibEnsemble, AnomalibTest, ModelPathUnit
+from tests.models import INPUT_SIZE, SaveTorchBackbone
+
+CFLOW = ModelPathUnit.ModelTypeEnum.cflow_
+
+@pytest.fixture(scope="module")
+def model_paths(ensemble_model_paths: dict[str, str]) -> dict[ModelPathUnit.ModelTypeEnum, str]:
+    return {ModelPathUnit.ModelTypeEnum[f"{name}_"]: path for name, path in ensemble_model_paths.items()}
+
+@pytest.fixture(scope="module")
+def anomalib_ensemble(model_paths: dict[ModelPathUnit.ModelTypeEnum, str]) -> AnomalibEnsemble:
+    anomalib_ensemble = AnomalibEnsemble(batch_size=4)
+    anomalib_ensemble.Setup(model_paths=model_paths)
+    return anomalib_ensemble
+
+def RandomTensor(height: int, width: int, seed: int) -> "torch.Tensor":
+    return torch.rand((3, height, width), generator=torch.Generator().manual_seed(seed))
+
+def test_backbone_shared_and_run_once_per_batch(anomalib_ensemble: AnomalibEnsemble) -> None:
+    assert list(anomalib_ensemble.shared_) == ["resnet18"]
+    shared = anomalib_ensemble.shared_["resnet18"]
+    assert shared.layers_ == ["layer1", "layer2"]
+
+    calls : list[int] = []
+    handle = shared.feature_extractor.register_forward_hook(lambda module, inputs, outputs: calls.append(inputs[0].shape[0]))
+    try:
+        anomalib_ensemble.PredictBatch(images=[RandomTensor(*INPUT_SIZE, seed=seed) for seed in range(3)])
+    finally:
+        handle.remove()
+    assert calls == [3]
+    assert shared.inputs_ is None and shared.features_ is None
+
+def test_scores_equal_the_models_on_their_own(anomalib_ensemble: AnomalibEnsemble, model_paths: dict[ModelPathUnit.ModelTypeEnum, str]) -> None:
+    images = [RandomTensor(200, 300, seed=1), RandomTensor(*INPUT_SIZE, seed=2)]
+    combined = anomalib_ensemble.PredictBatch(images=images)
+
+    for model_type, model_path in model_paths.items():
+        anomalib_test = AnomalibTest(batch_size=4)
+        anomalib_test.Setup(model_path=model_path)
+        for (_, scores), result in zip(combined, anomalib_test.PredictBatch(images=images)):
+            assert scores[model_type.name.rstrip("_")] == pytest.approx(float(result.pred_score), rel=1e-4)
+    for result, scores in combined:
+        assert float(result.pred_score) == pytest.approx(sum(scores.values()) / len(scores))
+        assert result.anomaly_map.shape[-2:] == result.image.shape[:2]
+
+def test_setup_refuses_members_with_other_transforms(model_paths: dict[ModelPathUnit.ModelTypeEnum, str], tmp_path) -> None:
+    SaveTorchBackbone(str(tmp_path / "model.pt"), seed=2, input_size=(64, 64))
+    anomalib_ensemble = AnomalibEnsemble()
+    with pytest.raises(AssertionError, match="share one transform"):
+        anomalib_ensemble.Setup(model_paths={CFLOW: model_paths[CFLOW], ModelPathUnit.ModelTypeEnum.stfpm_: str(tmp_path / "model.pt")})
+
+def test_render_lists_every_score(anomalib_ensemble: AnomalibEnsemble) -> None:
+    result, scores = anomalib_ensemble.PredictBatch(images=[RandomTensor(*INPUT_SIZE, seed=3)])[0]
+    rendered = AnomalibEnsemble.Render(result=result, scores=scores)
+    assert rendered is not None
+    assert rendered[1].endswith(f"cflow_score: {scores['cflow']}\npatchcore_score: {scores['patchcore']}\n")
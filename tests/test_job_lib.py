@@ -0,0 +1,80 @@
+from os import kill
+from time import monotonic, sleep
+from typing import Callable
+import sys
+import pytest
+
+from classes.job_lib import TrainJob, TrainJobManager
+from tests import jobs
+
+def WaitFor(condition: Callable[[], bool], timeout: float = 60) -> None:
+    deadline = monotonic() + timeout
+    while not condition():
+        assert monotonic() < deadline, "Timed out"
+        sleep(0.05)
+
+def Finished(job: TrainJob) -> bool:
+    return job.status_ not in (TrainJobManager.JobStatusEnum.queued_, TrainJobManager.JobStatusEnum.running_) and job.process_ is None
+
+def Alive(pid: int) -> bool:
+    try:
+        kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # A zombie is reaped by its parent, read its state
+    with open(f"/proc/{pid}/stat") as file:
+        return file.read().split(")")[-1].split()[0] != "Z"
+
+def test_progress_and_success() -> None:
+    manager = TrainJobManager(max_running=1, max_queued=4, niceness=0)
+    job = manager.Submit(name="progress", target=jobs.Progress, kwargs={})
+    assert job is not None
+    WaitFor(lambda: Finished(job))
+    WaitFor(lambda: job.progress_ == (2, 2, "patchcore"), timeout=5)
+    assert job.ToDict()["status"] == "succeeded"
+
+def test_subprocess_does_not_import_the_server() -> None:
+    manager = TrainJobManager(niceness=0)
+    job = manager.Submit(name="modules", target=jobs.Modules, kwargs={})
+    assert job is not None
+    WaitFor(lambda: Finished(job))
+    WaitFor(lambda: job.progress_[1] == 1, timeout=5)
+    assert job.status_ == TrainJobManager.JobStatusEnum.succeeded_
+    assert job.progress_ == (0, 1, "")
+
+def test_failure_exit_code() -> None:
+    manager = TrainJobManager(niceness=0)
+    job = manager.Submit(name="fail", target=jobs.Fail, kwargs={})
+    assert job is not None
+    WaitFor(lambda: Finished(job))
+    assert job.status_ == TrainJobManager.JobStatusEnum.failed_ and job.error_ == "Exit code 3"
+
+def test_finished_jobs_are_pruned() -> None:
+    manager = TrainJobManager(max_running=2, max_queued=8, niceness=0, max_finished=2)
+    submitted = [manager.Submit(name=f"fail{index}", target=jobs.Fail, kwargs={}) for index in range(4)]
+    assert all(job is not None for job in submitted)
+    WaitFor(lambda: all(Finished(job) for job in submitted)) # type: ignore
+    assert [state["job_id"] for state in manager.Jobs()] == [job.job_id_ for job in submitted[2:]] # type: ignore
+    assert manager.Get(job_id=submitted[0].job_id_) is None # type: ignore
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads /proc")
+def test_cancel_kills_the_process_group(tmp_path) -> None:
+    manager = TrainJobManager(niceness=0)
+    pid_path = tmp_path / "child.pid"
+    job = manager.Submit(name="sleep", target=jobs.SleepWithChild, kwargs={"pid_path": str(pid_path)})
+    assert job is not None
+    WaitFor(lambda: job.progress_ == (0, 1, "started"))
+    child_pid = int(pid_path.read_text())
+    assert Alive(child_pid)
+
+    manager.Cancel(job_id=job.job_id_)
+    WaitFor(lambda: Finished(job))
+    assert job.status_ == TrainJobManager.JobStatusEnum.cancelled_
+    WaitFor(lambda: not Alive(child_pid), timeout=10)
+
+def test_target_must_be_importable() -> None:
+    def Local(progress_queue: object) -> None:
+        pass
+    Local.__module__ = "__main__"
+    with pytest.raises(AssertionError):
+        TrainJobManager().Submit(name="main", target=Local, kwargs={})
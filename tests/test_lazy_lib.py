@@ -0,0 +1,27 @@
+from os import environ
+from os.path import abspath, dirname
+from subprocess import run
+import sys
+import pytest
+
+from classes.lazy_lib import ImportCost, LazyImport
+
+ROOT = dirname(dirname(abspath(__file__)))
+
+@pytest.mark.parametrize("module", ["server", "anomalib_test", "classes.worker_lib"])
+def test_entry_points_do_not_import_torch(module: str) -> None:
+    # Heavy libraries are imported when the first model is loaded, not when the server starts
+    check = f"import sys, {module}; print(sorted(name for name in ('torch', 'timm', 'lightning', 'openvino') if name in sys.modules))"
+    completed = run([sys.executable, "-c", check], cwd=ROOT, capture_output=True, text=True, env=dict(environ, INFERENCE_PROCESSES="0"))
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.strip().splitlines()[-1] == "[]"
+
+def test_lazy_import_resolves_once() -> None:
+    lazy = LazyImport("json:dumps")
+    from json import dumps
+    assert lazy.Resolve() is dumps and lazy.Resolve() is dumps and lazy.resolved_
+
+def test_import_cost_reports_the_module() -> None:
+    total_ms, modules = ImportCost("json", top=None)
+    assert total_ms > 0
+    assert "json" in [name for name, _ in modules]
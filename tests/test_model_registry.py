@@ -0,0 +1,119 @@
+from os import utime
+from threading import Event, Thread
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("anomalib")
+
+from anomalib_test import ModelPathUnit, ModelRegistry
+
+class FakeModel:
+    """
+    Stands for a loaded AnomalibTest, with the attributes the registry reads.
+    """
+
+    def __init__(self, size: int = 1) -> None:
+        self.size_ = size
+        self.warm_ = True
+        self.warmup_ms_ : list[float] = []
+
+    def MemoryBytes(self) -> int:
+        return self.size_
+
+SOURCE = (("model.pt", 1),)
+
+def Registry(memory_budget_mb: float = 1) -> ModelRegistry:
+    return ModelRegistry(memory_budget_mb=memory_budget_mb, backends=[ModelPathUnit.ModelBackendEnum.torch_])
+
+def test_hit_not_blocked_by_load() -> None:
+    registry = Registry()
+    resident = FakeModel()
+    registry.GetOrLoad(key="resident", labels=("resident", "1"), source=SOURCE, load=lambda: resident)
+
+    started, release = Event(), Event()
+    def SlowLoad() -> FakeModel:
+        started.set()
+        release.wait(timeout=10)
+        return FakeModel()
+    loader = Thread(target=registry.GetOrLoad, kwargs={"key": "slow", "labels": ("slow", "1"), "source": SOURCE, "load": SlowLoad})
+    loader.start()
+    assert started.wait(timeout=10)
+
+    # Served while the other model is still loading
+    assert registry.GetOrLoad(key="resident", labels=("resident", "1"), source=SOURCE, load=FakeModel) is resident
+    assert {status["model"]: status["state"] for status in registry.Readiness()[1]} == {"resident": "ready", "slow": "loading"}
+    release.set()
+    loader.join(timeout=10)
+    assert set(registry.Loaded()) == {"resident", "slow"}
+
+def test_concurrent_requests_share_one_load() -> None:
+    registry = Registry()
+    loads : list[FakeModel] = []
+    started, release = Event(), Event()
+    def SlowLoad() -> FakeModel:
+        loads.append(FakeModel())
+        started.set()
+        release.wait(timeout=10)
+        return loads[-1]
+
+    results : list[object] = []
+    threads = [Thread(target=lambda: results.append(registry.GetOrLoad(key="model", labels=("model", "1"), source=SOURCE, load=SlowLoad))) for _ in range(4)]
+    threads[0].start()
+    assert started.wait(timeout=10)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert len(loads) == 1
+    assert len(results) == 4 and all(result is loads[0] for result in results)
+
+def test_failed_load_raised_to_waiters_then_retried() -> None:
+    registry = Registry()
+    started, release = Event(), Event()
+    def FailingLoad() -> FakeModel:
+        started.set()
+        release.wait(timeout=10)
+        raise FileNotFoundError("model.pt")
+
+    errors : list[BaseException] = []
+    def Request() -> None:
+        try:
+            registry.GetOrLoad(key="model", labels=("model", "1"), source=SOURCE, load=FailingLoad)
+        except FileNotFoundError as e:
+            errors.append(e)
+    threads = [Thread(target=Request) for _ in range(2)]
+    threads[0].start()
+    assert started.wait(timeout=10)
+    threads[1].start()
+    release.set()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert len(errors) == 2
+    assert registry.Loaded() == [] and registry.Readiness()[1] == []
+    model = FakeModel()
+    assert registry.GetOrLoad(key="model", labels=("model", "1"), source=SOURCE, load=lambda: model) is model
+
+def test_evicts_least_recently_used() -> None:
+    registry = Registry(memory_budget_mb=2 / 1024 / 1024)
+    for key in ("a", "b", "c"):
+        registry.GetOrLoad(key=key, labels=(key, "1"), source=SOURCE, load=FakeModel)
+    assert registry.Loaded() == ["b", "c"]
+    assert [status["model"] for status in registry.Readiness()[1]] == ["b", "c"]
+
+def test_reloads_replaced_artifact(tmp_path) -> None:
+    registry = Registry()
+    model_path = tmp_path / "model.pt"
+    model_path.write_bytes(b"v1")
+    first = registry.GetOrLoad(key="model", labels=("model", "1"), source=registry.Source(model_paths=[str(model_path)]), load=FakeModel)
+    assert registry.GetOrLoad(key="model", labels=("model", "1"), source=registry.Source(model_paths=[str(model_path)]), load=FakeModel) is first
+
+    # Retrained: the registry must not keep serving the model it loaded before
+    model_path.write_bytes(b"v2")
+    stat = model_path.stat()
+    utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    second = registry.GetOrLoad(key="model", labels=("model", "1"), source=registry.Source(model_paths=[str(model_path)]), load=FakeModel)
+    assert second is not first
+    assert registry.Loaded() == ["model"]
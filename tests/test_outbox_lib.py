@@ -0,0 +1,38 @@
+from io import BytesIO
+import pytest
+
+pytest.importorskip("discord")
+pytest.importorskip("aiohttp")
+
+from classes.discord_lib import MessageObject
+from classes.outbox_lib import WebhookOutbox
+
+def ImageMessage(data: bytes, filename: str = "result.png") -> MessageObject:
+    message_object = MessageObject()
+    message_object.SetMessage(f"Result {data.decode()}")
+    message_object.SetFile(BytesIO(data), filename=filename, description="Result")
+    message_object.CreateEmbed(title="Result")
+    message_object.EmbedSetImage(url=f"attachment://{filename}")
+    return message_object
+
+def test_payload_renames_duplicate_files_without_changing_the_messages() -> None:
+    pack = [ImageMessage(b"first"), ImageMessage(b"second"), ImageMessage(b"third", filename="other.png")]
+    payload, uploads = WebhookOutbox(webhook_url="http://127.0.0.1/webhook").Payload(pack=pack)
+
+    assert [filename for filename, _ in uploads] == ["result.png", "1_result.png", "other.png"]
+    assert [data for _, data in uploads] == [b"first", b"second", b"third"]
+    assert [attachment["filename"] for attachment in payload["attachments"]] == ["result.png", "1_result.png", "other.png"]
+    assert [embed["image"]["url"] for embed in payload["embeds"]] == ["attachment://result.png", "attachment://1_result.png", "attachment://other.png"]
+    assert payload["content"] == "Result first\nResult second\nResult third"
+
+    # The queued messages keep their own names, embeds and streams
+    assert [message_object.file_.filename for message_object in pack] == ["result.png", "result.png", "other.png"]
+    assert [message_object.embed_.image.url for message_object in pack] == ["attachment://result.png", "attachment://result.png", "attachment://other.png"]
+    assert all(message_object.file_.fp.tell() == 0 for message_object in pack)
+
+def test_payload_is_the_same_when_built_again() -> None:
+    # A message carried over to the next call, or a call built again, must not be renamed twice
+    pack = [ImageMessage(b"first"), ImageMessage(b"second")]
+    outbox = WebhookOutbox(webhook_url="http://127.0.0.1/webhook")
+    assert outbox.Payload(pack=pack) == outbox.Payload(pack=pack)
+    assert outbox.Payload(pack=pack[1:])[1] == [("result.png", b"second")]
@@ -0,0 +1,30 @@
+from asyncio import StreamReader, run
+from typing import Any
+import pytest
+
+pytest.importorskip("msgpack")
+
+from classes.response_lib import PackFrame, ReadFrames, UnpackFrames
+
+FRAMES : bytes = PackFrame(message="a", score=0.1, image=b"\x89PNG") + PackFrame(message="b", score=None, image=b"")
+
+def Read(data: bytes) -> list[dict[str, Any]]:
+    async def Collect() -> list[dict[str, Any]]:
+        stream = StreamReader()
+        stream.feed_data(data)
+        stream.feed_eof()
+        return [frame async for frame in ReadFrames(stream)]
+    return run(Collect())
+
+def test_frames_round_trip() -> None:
+    expected = [{"message": "a", "score": 0.1, "image": b"\x89PNG"}, {"message": "b", "score": None, "image": b""}]
+    assert UnpackFrames(FRAMES) == expected
+    assert Read(FRAMES) == expected
+
+@pytest.mark.parametrize("cut, error", [(2, "Truncated frame header"), (6, "Truncated frame body")])
+def test_truncated_frames_raise_value_error(cut: int, error: str) -> None:
+    data = FRAMES + PackFrame(message="c", score=0.5, image=b"")[:cut]
+    with pytest.raises(ValueError, match=error):
+        UnpackFrames(data)
+    with pytest.raises(ValueError, match=error):
+        Read(data)
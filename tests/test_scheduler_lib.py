@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+from time import monotonic, sleep
+from typing import Any, Hashable
+import pytest
+
+from classes.scheduler_lib import BatchScheduler
+
+class Recorder:
+    """
+    run_batch that doubles every item and records the batches it was given.
+    """
+
+    def __init__(self, *, delay_s: float = 0.0) -> None:
+        self.batches_ : list[tuple[Hashable, list[Any]]] = []
+        self.delay_s_ : float = delay_s
+        self.lock_ : Lock = Lock()
+
+    def __call__(self, key: Hashable, items: list[Any]) -> list[Any]:
+        with self.lock_:
+            self.batches_.append((key, list(items)))
+        sleep(self.delay_s_)
+        return [item * 2 for item in items]
+
+def test_full_batch_is_dispatched_without_waiting() -> None:
+    recorder = Recorder()
+    scheduler = BatchScheduler(run_batch=recorder, max_wait_ms=5000, max_batch=4)
+    start = monotonic()
+    futures = [scheduler.Submit(key="model", item=item) for item in range(4)]
+    assert [future.result(timeout=5) for future in futures] == [0, 2, 4, 6]
+    assert monotonic() - start < 1.0
+    assert recorder.batches_ == [("model", [0, 1, 2, 3])]
+
+def test_partial_batch_waits_for_max_wait() -> None:
+    recorder = Recorder()
+    scheduler = BatchScheduler(run_batch=recorder, max_wait_ms=200, max_batch=8)
+    start = monotonic()
+    future = scheduler.Submit(key="model", item=21)
+    assert future.result(timeout=5) == 42
+    assert 0.15 <= monotonic() - start < 2.0
+    assert recorder.batches_ == [("model", [21])]
+
+def test_items_fan_out_to_their_own_futures() -> None:
+    recorder = Recorder(delay_s=0.01)
+    scheduler = BatchScheduler(run_batch=recorder, max_wait_ms=20, max_batch=4)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = list(pool.map(lambda item: scheduler.Submit(key=item % 2, item=item), range(20)))
+        results = [future.result(timeout=10) for future in futures]
+
+    assert results == [item * 2 for item in range(20)]
+    # Every item ran exactly once, in a batch of its own key, no batch over max_batch
+    assert sorted(item for _, items in recorder.batches_ for item in items) == list(range(20))
+    assert all(len(items) <= 4 and all(item % 2 == key for item in items) for key, items in recorder.batches_)
+    assert len(recorder.batches_) < 20
+    assert scheduler.Pending() == 0
+
+def test_overflow_goes_out_in_the_next_batch() -> None:
+    gate = Event()
+    recorder = Recorder()
+    def Run(key: Hashable, items: list[Any]) -> list[Any]:
+        if key == "gate":
+            gate.wait(5)
+        return recorder(key, items)
+
+    # The dispatcher is held on a first batch, so more than max_batch items queue up meanwhile
+    scheduler = BatchScheduler(run_batch=Run, max_wait_ms=50, max_batch=3)
+    held = scheduler.Submit(key="gate", item=0)
+    sleep(0.2)
+    futures = [scheduler.Submit(key="model", item=item) for item in range(5)]
+    gate.set()
+    assert held.result(timeout=5) == 0
+    assert [future.result(timeout=5) for future in futures] == [0, 2, 4, 6, 8]
+    assert recorder.batches_ == [("gate", [0]), ("model", [0, 1, 2]), ("model", [3, 4])]
+
+def test_batch_error_reaches_every_item() -> None:
+    def Fail(key: Hashable, items: list[Any]) -> list[Any]:
+        raise ValueError("model failed")
+
+    scheduler = BatchScheduler(run_batch=Fail, max_wait_ms=5000, max_batch=2)
+    futures = [scheduler.Submit(key="model", item=item) for item in range(2)]
+    for future in futures:
+        with pytest.raises(ValueError, match="model failed"):
+            future.result(timeout=5)
+
+    # The dispatcher survives the failure
+    scheduler.run_batch_ = Recorder()
+    futures = [scheduler.Submit(key="model", item=item) for item in (5, 6)]
+    assert [future.result(timeout=5) for future in futures] == [10, 12]
+
+def test_wrong_result_count_is_an_error() -> None:
+    scheduler = BatchScheduler(run_batch=lambda key, items: items[:1], max_wait_ms=5000, max_batch=2)
+    futures = [scheduler.Submit(key="model", item=item) for item in range(2)]
+    for future in futures:
+        with pytest.raises(AssertionError, match="one result per item"):
+            future.result(timeout=5)
+
+def test_executor_runs_max_in_flight_batches_at_once() -> None:
+    recorder = Recorder(delay_s=0.5)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        scheduler = BatchScheduler(run_batch=recorder, max_wait_ms=0, max_batch=1, executor=executor, max_in_flight=2)
+        start = monotonic()
+        futures = [scheduler.Submit(key="model", item=item) for item in range(4)]
+        assert [future.result(timeout=10) for future in futures] == [0, 2, 4, 6]
+        elapsed = monotonic() - start
+
+    # Two at a time: two rounds of 0.5 s, not four, and not all four at once
+    assert 0.9 <= elapsed < 1.8
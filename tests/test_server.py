@@ -0,0 +1,127 @@
+from io import BytesIO
+from time import monotonic, sleep
+import pytest
+
+torch = pytest.importorskip("torch")
+np = pytest.importorskip("numpy")
+pytest.importorskip("anomalib")
+pytest.importorskip("flask")
+
+import server
+from anomalib_test import AnomalibEnsemble, AnomalibTest, ModelPathUnit
+from tests.models import INPUT_SIZE
+
+MODEL_KEY = (ModelPathUnit.ModelTypeEnum.cflow_, ModelPathUnit.ModelWeekEnum.week3_)
+ENSEMBLE_TYPES = (ModelPathUnit.ModelTypeEnum.cflow_, ModelPathUnit.ModelTypeEnum.patchcore_)
+
+@pytest.fixture
+def torch_test(torch_model_path: str, monkeypatch: pytest.MonkeyPatch) -> AnomalibTest:
+    anomalib_test = AnomalibTest(batch_size=4)
+    anomalib_test.Setup(model_path=torch_model_path)
+    monkeypatch.setattr(server.model_registry, "Get", lambda *, types, week: anomalib_test)
+    monkeypatch.setattr(server.model_registry, "ModelPath", lambda *, types, week: torch_model_path)
+    return anomalib_test
+
+@pytest.fixture
+def client(monkeypatch: pytest.MonkeyPatch):
+    # Small limits, and no result cache so every upload reaches admission
+    monkeypatch.setattr(server.admission, "max_images_", 2)
+    monkeypatch.setattr(server.admission, "max_bytes_", 256 * 1024)
+    monkeypatch.setattr(server.admission, "max_in_flight_", 2)
+    monkeypatch.setitem(server.APP.config, "MAX_CONTENT_LENGTH", 256 * 1024)
+    monkeypatch.setattr(server, "result_cache", server.ResultCache(max_entries=0))
+    return server.APP.test_client()
+
+def RandomArray(height: int, width: int, seed: int) -> "np.ndarray":
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+def test_rendered_batch_returns_only_score_label_and_png(torch_test: AnomalibTest) -> None:
+    images = [RandomArray(200, 300, seed=1), RandomArray(*INPUT_SIZE, seed=2)]
+    rendered = server.RunRenderedBatch((MODEL_KEY, False, None), images)
+    expected = server.RunPredictBatch((MODEL_KEY, False, None), images)
+
+    assert len(rendered) == 2
+    for (message, score, png), result in zip(rendered, expected):
+        assert isinstance(message, str) and isinstance(score, float) and isinstance(png, bytes)
+        assert png.startswith(b"\x89PNG")
+        assert score == pytest.approx(float(result.pred_score))
+        # Rendering needs no model, the server process renders its own batches the same way
+        assert (message, score, png) == server.RenderResult(result, ("cflow", "3"))
+
+def test_rendered_batch_scores_only(torch_test: AnomalibTest) -> None:
+    images = [RandomArray(*INPUT_SIZE, seed=3)]
+    assert server.RunRenderedBatch((MODEL_KEY, True, None), images) == server.RunPredictBatch((MODEL_KEY, True, None), images)
+
+def PngBytes(seed: int) -> bytes:
+    import cv2
+    return cv2.imencode(".png", RandomArray(*INPUT_SIZE, seed=seed))[1].tobytes()
+
+def MultipartBody(files: list[bytes], boundary: str = "boundary") -> bytes:
+    parts = [f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n".encode() for name, value in (("name", "cflow"), ("week", "3"))]
+    parts += [f"--{boundary}\r\nContent-Disposition: form-data; name=\"images\"; filename=\"{index}.png\"\r\nContent-Type: image/png\r\n\r\n".encode() + data + b"\r\n" for index, data in enumerate(files)]
+    return b"".join(parts) + f"--{boundary}--\r\n".encode()
+
+def InFlight(expected: int) -> int:
+    # Capacity is given back by a done callback of the future, which may run just after result() returned
+    deadline = monotonic() + 5
+    while server.admission.in_flight_ != expected and monotonic() < deadline:
+        sleep(0.01)
+    return server.admission.in_flight_
+
+def Post(client, files: list[bytes]):
+    return client.post("/predict", data={"name": "cflow", "week": "3", "images": [(BytesIO(data), f"{index}.png") for index, data in enumerate(files)]}, content_type="multipart/form-data")
+
+def test_predict_json(client, torch_test: AnomalibTest) -> None:
+    response = Post(client, [PngBytes(1), PngBytes(2)])
+    assert response.status_code == 200, response.get_data(as_text=True)
+    body = response.get_json()
+    assert len(body["images"]) == len(body["scores"]) == 2
+    assert "X-Queue-Depth" in response.headers and "X-In-Flight" in response.headers
+    assert InFlight(0) == 0
+
+def test_content_length_over_limit(client) -> None:
+    response = Post(client, [bytes(300 * 1024)])
+    assert response.status_code == 413
+    assert "limit" in response.get_json()["messages"][0]
+
+def test_chunked_upload_over_limit(client) -> None:
+    # No Content-Length, as with Transfer-Encoding: chunked: only the cap applied while the body is read catches it.
+    # The environ goes to the application as it is, the test client would fill in the Content-Length again
+    from json import loads
+    from werkzeug.test import EnvironBuilder, run_wsgi_app
+    body = MultipartBody([bytes(300 * 1024)])
+    environ = EnvironBuilder(path="/predict", method="POST", input_stream=BytesIO(body), content_type="multipart/form-data; boundary=boundary").get_environ()
+    environ.pop("CONTENT_LENGTH")
+    environ["wsgi.input_terminated"] = True
+    app_iter, status, headers = run_wsgi_app(server.APP, environ, buffered=True)
+    assert status.startswith("413")
+    assert headers["Content-Type"] == "application/json"
+    assert "limit" in loads(b"".join(app_iter))["messages"][0]
+
+def test_too_many_images(client) -> None:
+    response = Post(client, [PngBytes(index) for index in range(3)])
+    assert response.status_code == 413
+    assert "3 images" in response.get_json()["messages"][0]
+
+def test_busy_answers_503_with_retry_after(client, torch_test: AnomalibTest, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(server.admission, "in_flight_", 1)
+    response = Post(client, [PngBytes(1), PngBytes(2)])
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(server.admission.retry_after_s_)
+    assert server.admission.in_flight_ == 1
+
+def test_predict_ensemble_goes_through_the_scheduler(client, ensemble_model_paths: dict[str, str], monkeypatch: pytest.MonkeyPatch) -> None:
+    anomalib_ensemble = AnomalibEnsemble(batch_size=4)
+    anomalib_ensemble.Setup(model_paths={ModelPathUnit.ModelTypeEnum[f"{name}_"]: path for name, path in ensemble_model_paths.items()})
+    monkeypatch.setattr(server.model_registry, "GetEnsemble", lambda *, types, week: anomalib_ensemble)
+    submitted : list[object] = []
+    submit = server.ensemble_scheduler.Submit
+    monkeypatch.setattr(server.ensemble_scheduler, "Submit", lambda *, key, item: submitted.append(key) or submit(key=key, item=item))
+
+    response = client.post("/predict_ensemble", data={"week": "3", "names": "cflow,patchcore", "images": [(BytesIO(PngBytes(seed)), f"{seed}.png") for seed in range(2)]}, content_type="multipart/form-data")
+    assert response.status_code == 200, response.get_data(as_text=True)
+    body = response.get_json()
+    assert len(body["images"]) == len(body["scores"]) == 2
+    assert all("cflow_score" in message and "patchcore_score" in message for message in body["messages"])
+    assert submitted == [(ENSEMBLE_TYPES, ModelPathUnit.ModelWeekEnum.week3_)] * 2
+    assert InFlight(0) == 0
@@ -0,0 +1,50 @@
+from os import getpid
+import sys
+import pytest
+
+if not sys.platform.startswith("linux"):
+    pytest.skip("InferencePool forks its workers, Linux only", allow_module_level=True)
+
+from classes.worker_lib import InferencePool, WorkerPing
+
+# Stands for the models loaded in the server process, the workers see the state of the parent at their fork
+MODELS : list[str] = []
+
+def ReadModels() -> list[str]:
+    return list(MODELS)
+
+@pytest.fixture
+def inference_pool() -> InferencePool:
+    inference_pool = InferencePool(processes=2, threads=1)
+    yield inference_pool
+    inference_pool.shutdown()
+
+def WorkerPids(inference_pool: InferencePool) -> set[int]:
+    return {inference_pool.submit(WorkerPing).result(timeout=30) for _ in range(8)}
+
+def test_workers_share_models_loaded_before_start(inference_pool: InferencePool) -> None:
+    MODELS[:] = ["cflow:3"]
+    inference_pool.Start(generation=1)
+    assert inference_pool.submit(ReadModels).result(timeout=30) == ["cflow:3"]
+    assert getpid() not in WorkerPids(inference_pool)
+
+def test_sync_forks_again_only_when_models_changed(inference_pool: InferencePool) -> None:
+    MODELS[:] = ["cflow:3"]
+    inference_pool.Start(generation=1)
+    workers = inference_pool.executor_
+    before = WorkerPids(inference_pool)
+    inference_pool.Sync(generation=1)
+    assert inference_pool.executor_ is workers
+
+    # A model loaded after the fork reaches the workers once they are forked again, they never load it themselves
+    MODELS.append("patchcore:8")
+    inference_pool.Sync(generation=2)
+    assert inference_pool.submit(ReadModels).result(timeout=30) == ["cflow:3", "patchcore:8"]
+    assert WorkerPids(inference_pool).isdisjoint(before)
+
+def test_sync_lets_retired_workers_finish(inference_pool: InferencePool) -> None:
+    MODELS[:] = ["cflow:3"]
+    inference_pool.Start(generation=1)
+    futures = [inference_pool.submit(ReadModels) for _ in range(4)]
+    inference_pool.Sync(generation=2)
+    assert [future.result(timeout=30) for future in futures] == [["cflow:3"]] * 4
@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor
+from os.path import abspath, dirname
+from socket import socket
+from subprocess import Popen
+from time import monotonic, sleep
+from urllib.request import urlopen
+import sys
+import pytest
+
+pytest.importorskip("gunicorn")
+if sys.platform == "win32":
+    pytest.skip("gunicorn needs fork", allow_module_level=True)
+
+# A route as slow as a batch of inference, served by GunicornServer with one gthread worker
+SERVER = """
+import sys
+from time import sleep
+from classes.wsgi_lib import GunicornServer
+
+def App(environ, start_response):
+    sleep(0.5)
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [b"ok"]
+
+GunicornServer(app_factory=lambda: App, options={"bind": sys.argv[1], "workers": 1, "worker_class": "gthread", "threads": 8, "preload_app": True, "loglevel": "warning"}).run()
+"""
+
+def FreePort() -> int:
+    with socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+@pytest.fixture
+def server_url() -> str:
+    port = FreePort()
+    process = Popen([sys.executable, "-c", SERVER, f"127.0.0.1:{port}"], cwd=dirname(dirname(abspath(__file__))))
+    try:
+        deadline = monotonic() + 30
+        while True:
+            try:
+                with socket() as probe:
+                    probe.connect(("127.0.0.1", port))
+                break
+            except OSError:
+                assert monotonic() < deadline and process.poll() is None, "gunicorn did not start"
+                sleep(0.1)
+        yield f"http://127.0.0.1:{port}/"
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+def Fetch(url: str) -> bytes:
+    with urlopen(url, timeout=30) as response:
+        return response.read()
+
+def test_threads_serve_requests_concurrently(server_url: str) -> None:
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        start = monotonic()
+        bodies = list(pool.map(Fetch, [server_url] * 8))
+        elapsed = monotonic() - start
+
+    assert bodies == [b"ok"] * 8
+    assert elapsed < 2.0